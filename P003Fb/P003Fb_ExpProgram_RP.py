@@ -36,8 +36,20 @@ from tkinter import Toplevel, Canvas, BOTH, TclError, Tk, Label, Button, \
      StringVar, OptionMenu, IntVar, Radiobutton
 from time import time, sleep
 from os import getcwd, popen, mkdir, path as os_path
-from random import choice, shuffle
-from PIL import ImageTk, Image  
+from PIL import ImageTk
+
+# Shared P003 helpers live in the P003_common folder, one level up from this
+# script's folder (e.g., ~/Desktop/Experiments/P003/P003_common/)
+sys_path.insert(0, os_path.dirname(os_path.dirname(os_path.abspath(__file__))))
+from P003_common.timing import TouchLatencyLog, DeadlineScheduler
+from P003_common.data_files import side_file_loc
+from P003_common.scene import CanvasScene, Disc, Rect
+from P003_common.stimuli import key_frame, load_stimulus
+from P003_common.preload import SessionPreload
+from P003_common.resources import ResourceMonitor
+from P003_common.randomness import SessionRNG
+from P003_common.schedules import schedule_for_code, ReinforcementTally
+from P003_common.sequences import balanced_order
 
 # The first variable declared is whether the program is the operant box version
 # for pigeons, or the test version for humans to view. The variable below is 
@@ -233,7 +245,8 @@ class MainScreen(object):
     # called within the initial __init__() function that is 
     # run when the object is first built:
         
-    def __init__(self, subject_ID, record_data, data_folder_directory, phase_type):
+    def __init__(self, subject_ID, record_data, data_folder_directory, phase_type,
+                 session_seed=None):
         
         #  Passed-in variables
         self.subject_ID           = subject_ID
@@ -297,14 +310,164 @@ class MainScreen(object):
         header_list = ["SessionTime", "Xcord","Ycord", "Event", "TrialTime", 
                        "TrialType","TargetPeckNum", "BackgroundPeckNum",
                        "TrialNum", "TrialColor", "Subject",
-                       "Date"] # Column headers
+                       "Date", "TouchEventTime", "QueueDelay",
+                       "SessionSeed", "Region", "OnsetDelay"] # Column headers
         self.session_data_frame.append(header_list) # First row of matrix is the column headers
         self.date = date.today().strftime("%y-%m-%d")
         self.myFile_loc = 'FILL' # To be filled later on after Pig. ID is provided (in set vars func below)
+        self.touch_latency_log = TouchLatencyLog() # Tk event-queue delay of every touch
+        self.scheduler = DeadlineScheduler(self.root, lambda: self.current_trial_counter) # drift-free phase timers
+        self.rng = SessionRNG(session_seed) # seeded RNG streams for this session (seed is logged)
+        self.reinforcement_tally = ReinforcementTally() # expected vs. observed reinforcers (printed every ITI and at session end)
+        self.onset_delay = "NA" # ms the stimulus went up after its scheduled onset (stimulus_onset row only)
+
+        self.build_scene() # every canvas item of the session, built once (hidden)
+        self.resource_monitor = ResourceMonitor(self.root, self.mastercanvas, self.scene,
+                                                kept = lambda: len(self.session_data_frame) + len(self.scheduler.phase_log)) # per-trial leak check
+
+        self.preload = SessionPreload(self.prepare_session) # stimuli and trial order, prepared before the spacebar
 
         ## Finally, start the recursive loop that runs the program:
         self.place_birds_in_box()
 
+    def build_scene(self):
+        # Builds every item the Canvas uses during the session once, hidden
+        # (see P003_common/scene.py). The ITI, start signal and trials then
+        # only show the groups they need and swap the stimulus image, instead
+        # of deleting and rebuilding everything (and re-binding each tag)
+        # every time. Order is important here, as shapes built on top of each
+        # other will overlap/overdraw.
+        self.scene = CanvasScene(self.mastercanvas)
+
+        # First, the background. This basically is a button the size of 
+        # the screen to track any pecks; buttons built on top of this button will
+        # NOT count as background pecks but as key pecks, because the object is
+        # covering that part of the background.
+        self.scene.add("background", self.mastercanvas.create_rectangle(
+            0, 0,
+            self.mainscreen_width,
+            self.mainscreen_height,
+            fill="black",
+            outline="black",
+            tag="bkgrd"))
+
+        # The start signal key (a white square)
+        self.scene.add("start_signal", self.mastercanvas.create_rectangle(
+            [416, 288, 608, 480],
+            outline="black",
+            fill="white",
+            tag="key"))
+
+        # Coordinates for all the keys
+        key_coord_list = [416, 288, 608, 480]   # ~192 px diameter
+        midpoint_diameter = 10
+
+        # Key outline around the key
+        outline_size = 20  # pixels beyond key circle
+
+        # (key_frame() composites the key images with the same geometry)
+        self.key_frame_geometry = {"key_pixels": key_coord_list[2] - key_coord_list[0],
+                                   "outline_size": outline_size,
+                                   "midpoint_diameter": midpoint_diameter}
+
+        # The key: a single image item centered on it, showing the trial's
+        # stimulus pre-composited with the black outline disc, the fine
+        # inner outline and the midpoint (key_frame() in
+        # P003_common/stimuli.py, made in prepare_session; the image is
+        # set each trial in build_keys)
+        cx = (key_coord_list[0] + key_coord_list[2]) // 2
+        cy = (key_coord_list[1] + key_coord_list[3]) // 2
+        self.stimulus_item = self.scene.add("keys", self.mastercanvas.create_image(
+            cx, cy,
+            anchor="center",
+            tag="key"))
+
+        # Touch regions, checked in this order (see P003_common/scene.py):
+        # pecks are classified by these shapes, not by which item is on top
+        key_center_x = (key_coord_list[0] + key_coord_list[2]) / 2
+        key_center_y = (key_coord_list[1] + key_coord_list[3]) / 2
+        key_radius = (key_coord_list[2] - key_coord_list[0]) / 2
+        self.scene.add_region("start_signal", "start_signal", Rect(416, 288, 608, 480), "key")
+        self.scene.add_region("keys", "key_midpoint", Disc(key_center_x, key_center_y, midpoint_diameter / 2), "key")
+        self.scene.add_region("keys", "key_disc", Disc(key_center_x, key_center_y, key_radius), "key")
+        self.scene.add_region("keys", "key_outline", Disc(key_center_x, key_center_y, key_radius + outline_size), "key")
+        self.scene.add_region("background", "background",
+                              Rect(0, 0, self.mainscreen_width, self.mainscreen_height), "bkgrd")
+    
+    def prepare_session(self):
+        # Everything the session needs that only depends on the subject and
+        # condition: stimulus images and trial order. It runs on a worker thread,
+        # started at the end of __init__ while the bird is put in the box
+        # (see P003_common/preload.py), so nothing here may touch Tk.
+        # first_ITI waits for it and then makes the PhotoImages.
+
+        # Now, we need to input the stimuli assignment images 
+        # 1) Read per‐subject CSV to get PNG filenames
+        script_dir = getcwd()
+        csv_path = os_path.join(script_dir, "P003Fb_stimulus_assignments.csv")
+        with open(csv_path, encoding="utf-8-sig") as f:
+            reader = DictReader(f)
+            row = next(r for r in reader if r["Subject"] == self.subject_ID)
+
+        all_trial_types = [
+            "INS_2","INS_5","INS_20","INS_50",
+            "OMS_2","OMS_5","OMS_20","OMS_50"
+        ]
+        self.stimulus_assignments_dict = {
+            tt: row[tt]
+            for tt in all_trial_types
+            if row.get(tt, "").strip()  # only if there's a filename in the cell
+        }
+
+        # 2) Load each PNG (PhotoImages are made in first_ITI, on the Tk thread)
+        # We need to work out the folder that contains *this* .py file: 
+        script_dir = os_path.dirname(os_path.abspath(__file__))          # …/P003/P003Fb
+        # The stimuli folder sits right next to this script:
+        stimuli_folder = os_path.join(script_dir, "stimuli")             # …/P003/P003Fb/stimuli
+
+        KEY_PIXELS = 192          # size of stimuli, same as previous experiments (P003e/P003f)
+
+        self.stimulus_pil_images = {}
+        for tt, fname in self.stimulus_assignments_dict.items():
+            img_path = os_path.join(stimuli_folder, fname)
+
+            # RGBA (keeps transparency if any) and resized to the key,
+            # from the stimulus cache, then composited into the whole key
+            # graphic (P003_common/stimuli.py)
+            pil_img = load_stimulus(img_path, (KEY_PIXELS, KEY_PIXELS), "RGBA")
+            self.stimulus_pil_images[tt] = key_frame(pil_img, **self.key_frame_geometry)
+        # ...and the bare key, for trial types without a stimulus
+        self.stimulus_pil_images[None] = key_frame(None, **self.key_frame_geometry)
+
+        # 3) Build the trial‐order list, 160 trials, no >3 same in a row
+        potential_trial_assignments = [
+            "INS_2", "INS_5", "INS_20", "INS_50",
+            "OMS_2", "OMS_5", "OMS_20", "OMS_50"
+        ] * 20                       # 160 total
+
+        # keep only trials that match this bird’s between-subjects condition
+        potential_trial_assignments = [
+            tt for tt in potential_trial_assignments
+            if tt.startswith(self.phase_type)         # "INS" or "OMS"
+        ]
+
+        # Now we have 4 distinct trial codes × 20 each  =  80 elements
+        # Order them so no FOUR IDENTICAL trial codes appear consecutively,
+        # and (within 4 blocks of 20) so every code follows every other
+        # about equally often (P003_common/sequences.py)
+        self.trial_assignment_list, self.transition_balance, self.unbalanced_transitions = balanced_order(
+            potential_trial_assignments,
+            blocks = 4,
+            max_run = 3,
+            rng = self.rng.order)   # full 80
+
+        # Touch region label masks of every screen the session shows, so a
+        # peck is classified with one array lookup (P003_common/region_mask.py)
+        self.scene.prepare_masks(("background",),
+                                 ("background", "start_signal"),
+                                 ("background", "keys"))
+
+
     def place_birds_in_box(self):
         # This is the default screen run until the birds are placed into the
         # box and the space bar is pressed. It then proceedes to the ITI. It only
@@ -313,89 +476,40 @@ class MainScreen(object):
         def first_ITI(event):
             # Is initial delay before first trial starts
             print("Spacebar pressed -- SESSION STARTED")
-            self.mastercanvas.delete("all")
+            self.clear_canvas()
             self.root.unbind("<space>")
             self.start_time = datetime.now()
             self.trial_type = "NA"
 
-            # Now, we need to input the stimuli assignment images 
-            # 1) Read per‐subject CSV to get PNG filenames
-            script_dir = getcwd()
-            csv_path = os_path.join(script_dir, "P003Fb_stimulus_assignments.csv")
-            with open(csv_path, encoding="utf-8-sig") as f:
-                reader = DictReader(f)
-                row = next(r for r in reader if r["Subject"] == self.subject_ID)
-
-            all_trial_types = [
-                "INS_2","INS_5","INS_20","INS_50",
-                "OMS_2","OMS_5","OMS_20","OMS_50"
-            ]
-            self.stimulus_assignments_dict = {
-                tt: row[tt]
-                for tt in all_trial_types
-                if row.get(tt, "").strip()  # only if there's a filename in the cell
-            }
-
-            # 2) Preload each PNG into PhotoImages
-            # We need to work out the folder that contains *this* .py file: 
-            script_dir = os_path.dirname(os_path.abspath(__file__))          # …/P003/P003Fb
-            # The stimuli folder sits right next to this script:
-            stimuli_folder = os_path.join(script_dir, "stimuli")             # …/P003/P003Fb/stimuli
-
-            KEY_PIXELS = 192          # size of stimuli, same as previous experiments (P003e/P003f)
-
-            self.stimulus_images = {}
-            for tt, fname in self.stimulus_assignments_dict.items():
-                img_path = os_path.join(stimuli_folder, fname)
-
-                pil_img = (
-                    Image.open(img_path)          # original file
-                         .convert("RGBA")         # keep transparency if any
-                         .resize((KEY_PIXELS, KEY_PIXELS), Image.LANCZOS)
-                )
-                self.stimulus_images[tt] = ImageTk.PhotoImage(pil_img)
-
-            # 3) Build the trial‐order list, 160 trials, no >3 same in a row
-            potential_trial_assignments = [
-                "INS_2", "INS_5", "INS_20", "INS_50",
-                "OMS_2", "OMS_5", "OMS_20", "OMS_50"
-            ] * 20                       # 160 total
-
-            # keep only trials that match this bird’s between-subjects condition
-            potential_trial_assignments = [
-                tt for tt in potential_trial_assignments
-                if tt.startswith(self.phase_type)         # "INS" or "OMS"
-            ]
-
-            # Now we have 4 distinct trial codes × 20 each  =  80 elements
-            # Shuffle until no FOUR IDENTICAL trial codes appear consecutively
-            while True:
-                shuffle(potential_trial_assignments)
-
-                # look for any run of four identical elements
-                bad_run_found = any(
-                    potential_trial_assignments[i]   == potential_trial_assignments[i-1] ==
-                    potential_trial_assignments[i-2] == potential_trial_assignments[i-3]
-                    for i in range(3, len(potential_trial_assignments))
-                )
-
-                if not bad_run_found:
-                    self.trial_assignment_list = potential_trial_assignments[:]   # full 80
-                    break            # good order found; leave the while-loop
+            # The stimuli and trial order were prepared before the spacebar
+            # (prepare_session); wait for them if they aren't ready yet
+            self.preload.result()
+            print(f"Session seed: {self.rng.seed}")
+            print(f"{self.unbalanced_transitions.summary()} (unbalanced)")
+            print(self.transition_balance.summary())
+            self.stimulus_images = {tt: ImageTk.PhotoImage(pil_img)
+                                    for tt, pil_img in self.stimulus_pil_images.items()}
+
+            # Reinforcement schedule of each trial code: INS_n/OMS_n are RRn
+            # (see P003_common/schedules.py)
+            self.schedules = {code: schedule_for_code(code, "RR")
+                              for code in set(self.trial_assignment_list)}
 
             # After the order of stimuli per trial is determined, we can start.
             # If running a test session, the duration of intervals can be 
             # lowered significantly to make more efficient
+            self.scheduler.restart() # The session timeline starts now
             if self.subject_ID == "TEST": # If test, don't worry about ITI delays
                 self.ITI_duration = 1000
                 self.hopper_duration = 1000
-                self.root.after(1000, self.ITI)
+                self.scheduler.after("session_start", 1000, self.ITI)
             else:
-                self.root.after(2000, self.ITI)
+                self.scheduler.after("session_start", 2000, self.ITI)
 
 
         # This runs first, setting up the spacebar trigger
         self.root.bind("<space>", first_ITI) # bind cursor state to "space" key
+        self.preload.show_status(self.root, self.mastercanvas) # ready indicator
         self.mastercanvas.create_text(512,374,
                                       fill="white",
                                       font="Times 25 italic bold",
@@ -414,17 +528,9 @@ class MainScreen(object):
         self.clear_canvas()
         
         # Make sure pecks during ITI are saved
-        self.mastercanvas.create_rectangle(0,0,
-                                           self.mainscreen_width,
-                                           self.mainscreen_height,
-                                           fill = "black",
-                                           outline = "black",
-                                           tag = "bkgrd")
-        self.mastercanvas.tag_bind("bkgrd",
-                                   "<Button-1>",
-                                   lambda event, 
-                                   event_type = "ITI_peck": 
-                                       self.write_data(event, event_type))
+        self.scene.show("background")
+        self.scene.on_press("bkgrd",
+                            lambda event: self.write_data(event, "ITI_peck"))
             
         # This turns all the stimuli off from the previous trial (during the
         # ITI). Needs to happen every ITI.
@@ -455,11 +561,13 @@ class MainScreen(object):
                                               text=f"ITI ({int(self.ITI_duration/1000)} sec.)")
                 
             # Reset other variables for the following trial.
-            self.trial_start = time() # Set trial start time (note that it includes the ITI, which is subtracted later)
+            self.trial_start = self.scheduler.anchor_time() # Set trial start time at this ITI's scheduled start (note that it includes the ITI, which is subtracted later)
             self.trial_peck_counter = 0 # Reset trial peck counter each trial
             self.background_peck_counter = 0 # Also reset background counter
             
             self.write_comp_data(False) # update data .csv with trial data from the previous trial
+            self.resource_monitor.sample(self.current_trial_counter) # canvas items, bindings, timers and objects (warns on growth)
+            print(self.reinforcement_tally.status()) # expected vs. observed reinforcers so far
             
             # First pick the trial type from the prexisting list....
             self.trial_type = self.trial_assignment_list[self.current_trial_counter - 1]
@@ -468,10 +576,10 @@ class MainScreen(object):
             self.current_trial_counter += 1
             
             if self.current_trial_counter == 1:
-                self.root.after(self.ITI_duration, self.start_signal_period)
+                self.scheduler.after("ITI", self.ITI_duration, self.start_signal_period)
             else:
                 # Next, set a delay timer to proceed to the next trial
-                self.root.after(self.ITI_duration, self.build_keys)
+                self.scheduler.after("ITI", self.ITI_duration, self.build_keys)
                 
             # Finally, print terminal feedback "headers" for each event within the next trial
             print(f"\n{'*'*30} Trial {self.current_trial_counter} begins {'*'*30}") # Terminal feedback...
@@ -490,44 +598,15 @@ class MainScreen(object):
         # We need to turn on the houselight as soon as the trial starts
         if operant_box_version:
             rpi_board.write(house_light_GPIO_num, True) # Turn off house light
-        # Border...
-        self.mastercanvas.create_rectangle(0,0,
-                                           self.mainscreen_width,
-                                           self.mainscreen_height,
-                                           fill = "black",
-                                           outline = "black",
-                                           tag = "bkgrd")
-        # Make it a button
-        self.mastercanvas.tag_bind("bkgrd",
-                                   "<Button-1>",
-                                   lambda event: 
-                                       self.background_press(event))
-        
-        # Next build the actual cue
-        key_coord_list =  [416, 288, 608, 480]
-        # Key outline around the key
-        outline_size = 20  # pixels beyond key circle
-        outline_coords_list = [
-            key_coord_list[0] - outline_size,
-            key_coord_list[1] - outline_size,
-            key_coord_list[2] + outline_size,
-            key_coord_list[3] + outline_size
-        ]
-        self.mastercanvas.create_rectangle(key_coord_list,
-                                      outline = "black",
-                                      fill = "white",
-                                      tag = "key")
-
-        # Then bind a function to a key press!
-        self.mastercanvas.tag_bind("key",
-                                   "<Button-1>",
-                                   lambda event, 
-                                   event_type = "start_signal_press": 
-                                       self.start_signal_press(event, event_type))
+        # Show the background and the start signal key (built once in
+        # build_scene), then make them buttons
+        self.scene.show("background", "start_signal")
+        self.scene.on_press("bkgrd", self.background_press)
+        self.scene.on_press("key",
+                            lambda event: self.start_signal_press(event, "start_signal_press"))
 
         # Timer if start signal press hasn't been pecked at for 5 minutes 
-        self.auto_start_id = self.root.after(300_000, self.build_keys)
-
+        self.auto_start_id = self.scheduler.after("start_signal_timeout", 300_000, self.build_keys)
 
     def start_signal_press(self, event, event_type):
         # Cancel the auto-start timer if it’s still pending
@@ -537,8 +616,9 @@ class MainScreen(object):
         # Write data for the peck
         self.write_data(event, event_type)
         self.clear_canvas()
-        # Proceed to the first trial after 1 s
-        self.root.after(1000, self.build_keys)
+        # Proceed to the first trial after 1 s (timed from this peck)
+        self.scheduler.restart()
+        self.scheduler.after("start_signal_delay", 1000, self.build_keys)
         
     
     """
@@ -564,85 +644,25 @@ class MainScreen(object):
         if operant_box_version:
             rpi_board.write(house_light_GPIO_num, True)  # Turn on houselight
 
-    # First, build the background. This basically builds a button the size of 
-    # the screen to track any pecks; buttons built on top of this button will
-    # NOT count as background pecks but as key pecks, because the object is
-    # covering that part of the background.
-        self.mastercanvas.create_rectangle(
-            0, 0,
-            self.mainscreen_width,
-            self.mainscreen_height,
-            fill="black",
-            outline="black",
-            tag="bkgrd"
-        )
-        self.mastercanvas.tag_bind(
-            "bkgrd", "<Button-1>",
-            lambda event: self.background_press(event)
-        )
-
-        # Coordinates for all the keys
-        key_coord_list = [416, 288, 608, 480]   # ~192 px diameter
-        midpoint_diameter = 10
-        midpoint_coord_list = [
-            key_coord_list[0] + ((key_coord_list[2] - key_coord_list[0]) // 2) - (midpoint_diameter // 2),
-            key_coord_list[1] + ((key_coord_list[3] - key_coord_list[1]) // 2) - (midpoint_diameter // 2),
-            key_coord_list[0] + ((key_coord_list[2] - key_coord_list[0]) // 2) + (midpoint_diameter // 2),
-            key_coord_list[1] + ((key_coord_list[3] - key_coord_list[1]) // 2) + (midpoint_diameter // 2)
-        ]
-
-        # Key outline around the key
-        outline_size = 20  # pixels beyond key circle
-        outline_coords_list = [
-            key_coord_list[0] - outline_size,
-            key_coord_list[1] - outline_size,
-            key_coord_list[2] + outline_size,
-            key_coord_list[3] + outline_size
-        ]
-
-        # First up, build the actual circle that is the key and will
-        # contain the stimulus. Order is important here, as shapes built
-        # on top of each other will overlap/overdraw.
-        self.mastercanvas.create_oval(
-            outline_coords_list,
-            outline="black",
-            fill="black",
-            tag="key")
-
-        # Stimulus image .png
-        cx = (key_coord_list[0] + key_coord_list[2]) // 2
-        cy = (key_coord_list[1] + key_coord_list[3]) // 2
-        img = self.stimulus_images.get(self.trial_type)
-        if img:
-            # draw the PNG centered in the key circle
-            self.mastercanvas.create_image(
-                cx, cy,
-                image=img,
-                anchor="center",
-                tag="key")
-
-        # redraw the fine outline around the key (inner circle)
-        self.mastercanvas.create_oval(
-            key_coord_list,
-            outline="black",
-            fill="",
-            tag="key")
-
-        # Then create the midpoint...
-        self.mastercanvas.create_oval(
-            midpoint_coord_list,
-            fill="black",
-            outline="black",
-            tag="key")
-
-        # Then bind a function to each key press!
-        self.mastercanvas.tag_bind(
-            "key", "<Button-1>",
-            lambda event, event_type="key_peck": self.key_press(event, event_type))
+    # Show the background and the key (built once in build_scene) with
+    # this trial's stimulus image, then make them buttons
+        self.scene.show("background", "keys")
+        self.scene.configure(self.stimulus_item,
+                             image=self.stimulus_images.get(self.trial_type, self.stimulus_images[None]))
+        self.scene.on_press("bkgrd", self.background_press)
+        self.scene.on_press("key",
+                            lambda event: self.key_press(event, "key_peck"))
             
+        # Flush the draw, then log when the stimulus actually went up and
+        # how long after its scheduled onset (see P003_common/timing.py)
+        self.root.update_idletasks()
+        self.onset_delay = self.scheduler.onset()
+        self.write_data(None, "stimulus_onset")
+        self.onset_delay = "NA"
+
         # Lastly, start a timer for the trial
-        self.trial_timer = self.root.after(self.trial_timer_duration,
-                                   self.calculate_trial_outcome)
+        self.trial_timer = self.scheduler.after("trial", self.trial_timer_duration,
+                                                self.calculate_trial_outcome)
 
     def key_press(self, event, event_type):
         # This is the function that is called whenever a key is pressed. It
@@ -667,23 +687,13 @@ class MainScreen(object):
     
         self.clear_canvas()
     
-        # If INS/OMS trial, reinforcement is probabilistic
-        # Extract the RR value from the trial type (e.g., INS_2 → rr_sched = 2)
-        rr_sched = int(self.trial_type.split("_")[1])  # Extract 2, 5, 20, or 50       
-
-        # Determine default reinforcement status
-        if "INS" in self.trial_type:
-                reinforced = False
-        elif "OMS" in self.trial_type:
-                reinforced = True
-
-        # Roll a dice a number of times equal to the number of pecks in the trial
-        for _ in range(self.trial_peck_counter): 
-            if choice(range(rr_sched)) == 0:  # Simulates a die roll (0 = reinforcement occurs)
-                if "INS" in self.trial_type:
-                    reinforced = True
-                elif "OMS" in self.trial_type:
-                    reinforced = False
+        # INS/OMS trials are RR (e.g., INS_2 -> RR2), decided with a single
+        # draw from 1 - (1 - 1/RR)^pecks (INS: reinforced on a hit; OMS:
+        # reinforcement is cancelled by a hit)
+        reinforced = self.schedules[self.trial_type].outcome(self.trial_peck_counter,
+                                                             self.rng.outcome)
+        self.reinforcement_tally.record(self.trial_type, self.schedules[self.trial_type],
+                                        self.trial_peck_counter, reinforced)
         
         # If a reinforcement is earned...
         if reinforced:
@@ -703,7 +713,7 @@ class MainScreen(object):
                 rpi_board.set_servo_pulsewidth(servo_GPIO_num,
                                                hopper_up_val) # Move hopper to up position
             
-            self.root.after(self.hopper_duration, lambda: self.ITI())
+            self.scheduler.after("hopper", self.hopper_duration, self.ITI)
         
         # If not reinforced, just proceed to the ITI
         else:
@@ -730,15 +740,13 @@ class MainScreen(object):
     
     def clear_canvas(self):
          # This is by far the most called function across the program. It
-         # deletes all the objects currently on the Canvas. A finer point to 
-         # note here is that objects still exist onscreen if they are covered
-         # up (rendering them invisible and inaccessible); if too many objects
-         # are stacked upon each other, it can may be too difficult to track/
-         # project at once (especially if many of the objects have functions 
-         # tied to them. Therefore, its important to frequently clean up the 
-         # Canvas by literally deleting every element.
+         # hides everything in the scene (see build_scene) so nothing can be
+         # seen or pecked, and deletes anything else drawn on the Canvas
+         # (e.g., onscreen feedback text). The scene's items are only
+         # hidden, not deleted, so the next phase just shows them again
+         # instead of rebuilding them.
         try:
-            self.mastercanvas.delete("all")
+            self.scene.clear()
         except TclError:
             print("No screen to exit")
         
@@ -794,6 +802,9 @@ class MainScreen(object):
                 x, y = event.x, event.y
             else: # There are certain data events that are not pecks.
                 x, y = "NA", "NA"   
+
+            # Tk's own timestamp of the touch vs. when this callback actually ran
+            event_time, queue_delay = self.touch_latency_log.record(event)
                 
             print(f"{outcome:>30} | x: {x: ^3} y: {y:^3} | {self.trial_type:^5} | {str(datetime.now() - self.start_time)}")
             # print(f"{outcome:>30} | x: {x: ^3} y: {y:^3} | Target: {self.current_target_location: ^2} | {str(datetime.now() - self.start_time)}")
@@ -809,13 +820,19 @@ class MainScreen(object):
                 self.current_trial_counter,           # TrialNum 
                 self.stimulus_assignments_dict[self.trial_type],  # TrialColor 
                 self.subject_ID,                      # Subject 
-                date.today()                          # Date 
+                date.today(),                         # Date 
+                event_time,                           # TouchEventTime (Tk server ms)
+                queue_delay,                          # QueueDelay (ms in Tk event queue)
+                self.rng.seed,                        # SessionSeed
+                getattr(event, "region", "NA"),       # Region (touch region, see build_scene)
+                self.onset_delay                      # OnsetDelay (ms, stimulus onset after its scheduled time; onset row only)
             ])
         
             header_list = ["SessionTime", "Xcord","Ycord", "Event", "TrialTime", 
                            "TrialType","TargetPeckNum", "BackgroundPeckNum",
                             "TrialNum", "TrialColor",
-                           "Subject", "Date"] # Column headers
+                           "Subject", "Date", "TouchEventTime", "QueueDelay",
+                           "SessionSeed", "Region", "OnsetDelay"] # Column headers
 
         
     def write_comp_data(self, SessionEnded):
@@ -828,6 +845,10 @@ class MainScreen(object):
         # write over the existing document.
         if SessionEnded:
             self.write_data(None, "SessionEnds") # Writes end of session to df
+            print(self.touch_latency_log.summary())
+            print(self.scheduler.summary())
+            print(self.resource_monitor.summary())
+            print(self.reinforcement_tally.summary())
         if self.record_data : # If experimenter has choosen to automatically record data in seperate sheet:
             myFile_loc = f"{self.data_folder_directory}/{self.subject_ID}/{self.subject_ID}_{self.start_time.strftime('%Y-%m-%d_%H.%M.%S')}_P003Fb_data.csv"
             # This loop writes the data in the matrix to the .csv              
@@ -836,6 +857,12 @@ class MainScreen(object):
                 w = writer(myFile, quoting=QUOTE_MINIMAL)
                 w.writerows(self.session_data_frame) # Write all event/trial data 
             print(f"\n- Data file written to {myFile_loc}")
+            if SessionEnded: # Per-session touch-delay histogram, phase timing log, transition counts and reinforcement check
+                self.touch_latency_log.write_histogram(side_file_loc(myFile_loc, "touch-latency"))
+                self.scheduler.write_phase_log(side_file_loc(myFile_loc, "phase-timing"))
+                self.resource_monitor.write(side_file_loc(myFile_loc, "resources"))
+                self.reinforcement_tally.write(side_file_loc(myFile_loc, "reinforcement-check"))
+                self.transition_balance.write_matrix(side_file_loc(myFile_loc, "transitions"))
                 
 #%% Finally, this is the code that actually runs:
 try:   
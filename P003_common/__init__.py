@@ -0,0 +1,13 @@
+# -*- coding: utf-8 -*-
+"""
+P003_common - helpers shared by every P003 experiment program.
+
+The experiment scripts (P003e, P003f, P003Fb, ...) each live in their own
+folder and are run from there. They reach this package by adding the parent
+P003 folder to sys.path before importing, e.g.:
+
+    sys_path.insert(0, os_path.dirname(os_path.dirname(os_path.abspath(__file__))))
+    from P003_common.timing import TouchLatencyLog
+
+Nothing in here touches the hopper/GPIO hardware; that stays in each script.
+"""
@@ -0,0 +1,27 @@
+# -*- coding: utf-8 -*-
+"""
+Names of the files written next to a session's data file.
+
+At the end of a session, each program writes a few extra files (touch
+latency histogram, phase timing, ...) next to its data .csv, named after
+it with "_data" swapped for what they hold:
+
+    .../P003f_data/Joplin/Joplin_2026-01-05_09.00.00_P003F_data.csv
+    .../P003f_data/Joplin/Joplin_2026-01-05_09.00.00_P003F_touch-latency.csv
+
+Only the file name changes: the data folders are named "..._data" too, so
+a plain str.replace() would point the file into a folder that does not
+exist. P003e's file names go on after "_data" ("_data-Phase-RR5.csv"),
+which is kept.
+"""
+from os import path as os_path
+
+
+def side_file_loc(data_file_loc, name):
+    # data_file_loc with the last "_data" of its file name replaced by
+    # "_" + name, e.g. side_file_loc(myFile_loc, "touch-latency")
+    folder, file_name = os_path.split(data_file_loc)
+    before, found, after = file_name.rpartition("_data")
+    if not found:
+        before, after = os_path.splitext(file_name)
+    return os_path.join(folder, f"{before}_{name}{after}")
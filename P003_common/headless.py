@@ -0,0 +1,452 @@
+# -*- coding: utf-8 -*-
+"""
+Headless (no display, no hardware) runtime for the P003 programs.
+
+A HeadlessSession loads one of the experiment scripts and builds its real
+MainScreen, but with the Tk window, Canvas and PhotoImages swapped for the
+small stand-ins below. Every root.after() timer runs on a virtual clock, so
+a whole 180-trial session (ITIs, trial timers, hopper) runs in well under a
+second, and touches can be delivered at any virtual time with touch(x, y).
+
+Because the program's own methods do all the work (build_keys, key_press,
+calculate_trial_outcome, ...), whatever the script on disk does is what
+runs here, including any changes made to it since a session was recorded.
+
+Hit-testing follows Tk's rules closely enough for these programs: the
+topmost pickable item under the touch gets the <Button-1> bindings of its
+tags, then the canvas-wide binding runs. Shapes with no fill (Tk's default)
+are only pickable on their outline, and text items are not pickable here
+(on the real screen a touch on ITI/feedback text is lost as well).
+
+The hardware is never touched: operant_box_version is forced to False in the
+loaded copy of the script, so run these tools on an analysis machine.
+"""
+import heapq
+from contextlib import contextmanager, redirect_stdout
+from datetime import datetime
+from importlib.util import spec_from_file_location, module_from_spec
+from inspect import signature
+from itertools import count
+from os import chdir, devnull, getcwd, path as os_path
+from types import SimpleNamespace
+
+# Virtual sessions start at this (arbitrary) wall-clock time, in seconds
+HEADLESS_EPOCH = 1_700_000_000.0
+
+_module_counter = count() # unique module names for each loaded copy
+
+
+class HeadlessEvent(object):
+    # Minimal stand-in for a Tk <Button-1> event. time defaults to 0, so
+    # TouchLatencyLog writes "NA" rather than a made-up queueing delay.
+    def __init__(self, x, y, time=0):
+        self.x = x
+        self.y = y
+        self.time = time
+        self.widget = None
+
+
+class HeadlessRoot(object):
+    # Stand-in for the Toplevel/Tk window. Keeps the after() queue on a
+    # virtual clock (ms since the session object was made).
+    def __init__(self, *args, **kwargs):
+        self.now_ms = 0.0
+        self.queue = [] # heap of (due_ms, order, after_id, callback, args)
+        self.pending = {} # after_id -> True while the timer is still live
+        self.bindings = {}
+        self.destroyed = False
+        self._order = count()
+        self.tk = SimpleNamespace(call=self._tk_call)
+
+    # Clocks used in place of monotonic() and time()
+    def clock(self):
+        return self.now_ms / 1000
+
+    def wall_time(self):
+        return HEADLESS_EPOCH + (self.now_ms / 1000)
+
+    # Timers
+    def after(self, ms, func=None, *args):
+        after_id = f"after#{next(self._order)}"
+        heapq.heappush(self.queue, (self.now_ms + ms, next(self._order),
+                                    after_id, func, args))
+        self.pending[after_id] = True
+        return after_id
+
+    def after_idle(self, func, *args):
+        return self.after(0, func, *args)
+
+    def after_cancel(self, after_id):
+        self.pending.pop(after_id, None)
+
+    def _tk_call(self, *args):
+        # Only "after info" is used (to count live timers)
+        if args[:2] == ("after", "info"):
+            return tuple(self.pending)
+        return ""
+
+    def run(self, until_ms=None):
+        # Runs timers in order until the queue is empty, the window is
+        # destroyed, or the virtual clock reaches until_ms
+        while self.queue and not self.destroyed:
+            due_ms, _, after_id, func, args = self.queue[0]
+            if until_ms is not None and due_ms > until_ms:
+                break
+            heapq.heappop(self.queue)
+            if self.pending.pop(after_id, None) is None:
+                continue # cancelled
+            self.now_ms = max(self.now_ms, due_ms)
+            func(*args)
+        if until_ms is not None and not self.destroyed:
+            self.now_ms = max(self.now_ms, until_ms)
+
+    # Key bindings (e.g., <space> to start the session)
+    def bind(self, sequence, func=None, add=None):
+        if func is None:
+            return self.bindings.get(sequence)
+        self.bindings[sequence] = func
+
+    def unbind(self, sequence, funcid=None):
+        self.bindings.pop(sequence, None)
+
+    def key(self, sequence):
+        func = self.bindings.get(sequence)
+        if func is not None:
+            func(HeadlessEvent(0, 0))
+
+    # Window calls that have nothing to do without a display
+    def title(self, *args): pass
+    def geometry(self, *args): pass
+    def attributes(self, *args): pass
+    def config(self, **kwargs): pass
+    configure = config
+    def update(self): pass
+    def update_idletasks(self): pass
+    def mainloop(self): pass
+
+    def destroy(self):
+        self.destroyed = True
+
+    def winfo_exists(self):
+        return not self.destroyed
+
+
+class HeadlessCanvas(object):
+    # Stand-in for the Canvas: keeps items (in stacking order), tags and
+    # bindings, and delivers touches to whichever item Tk would pick.
+    def __init__(self, root, **kwargs):
+        self.root = root
+        self.width = kwargs.get("width", 1024)
+        self.height = kwargs.get("height", 768)
+        self.items = {} # item id -> dict(kind, coords, tags, options); insertion = stacking order
+        self.tag_bindings = {} # (tag, sequence) -> callback
+        self.bindings = {} # sequence -> callback (canvas-wide)
+        self._ids = count(1)
+
+    def _create(self, kind, coords, options):
+        if len(coords) == 1 and isinstance(coords[0], (list, tuple)):
+            coords = coords[0]
+        tags = options.get("tags", options.get("tag", ()))
+        if isinstance(tags, str):
+            tags = tuple(tags.split())
+        item_id = next(self._ids)
+        self.items[item_id] = {"kind": kind,
+                               "coords": [float(c) for c in coords],
+                               "tags": tuple(tags),
+                               "options": dict(options)}
+        return item_id
+
+    def create_rectangle(self, *coords, **options): return self._create("rectangle", coords, options)
+    def create_oval(self, *coords, **options): return self._create("oval", coords, options)
+    def create_polygon(self, *coords, **options): return self._create("polygon", coords, options)
+    def create_line(self, *coords, **options): return self._create("line", coords, options)
+    def create_image(self, *coords, **options): return self._create("image", coords, options)
+    def create_text(self, *coords, **options): return self._create("text", coords, options)
+
+    def find_all(self):
+        return tuple(self.items)
+
+    def find_withtag(self, tag_or_id):
+        if tag_or_id == "all":
+            return self.find_all()
+        if isinstance(tag_or_id, int):
+            return (tag_or_id,) if tag_or_id in self.items else ()
+        return tuple(i for i, item in self.items.items() if tag_or_id in item["tags"])
+
+    def gettags(self, tag_or_id):
+        found = self.find_withtag(tag_or_id)
+        return self.items[found[0]]["tags"] if found else ()
+
+    def delete(self, *tags_or_ids):
+        for tag_or_id in tags_or_ids:
+            for item_id in self.find_withtag(tag_or_id):
+                del self.items[item_id]
+
+    def coords(self, tag_or_id, *coords):
+        found = self.find_withtag(tag_or_id)
+        if not found:
+            return []
+        if coords:
+            if len(coords) == 1 and isinstance(coords[0], (list, tuple)):
+                coords = coords[0]
+            for item_id in found:
+                self.items[item_id]["coords"] = [float(c) for c in coords]
+        return list(self.items[found[0]]["coords"])
+
+    def move(self, tag_or_id, dx, dy):
+        for item_id in self.find_withtag(tag_or_id):
+            c = self.items[item_id]["coords"]
+            self.items[item_id]["coords"] = [v + (dx if i % 2 == 0 else dy) for i, v in enumerate(c)]
+
+    def itemconfigure(self, tag_or_id, **options):
+        for item_id in self.find_withtag(tag_or_id):
+            self.items[item_id]["options"].update(options)
+    itemconfig = itemconfigure
+
+    def itemcget(self, tag_or_id, option):
+        found = self.find_withtag(tag_or_id)
+        return self.items[found[0]]["options"].get(option, "") if found else ""
+
+    def tag_raise(self, tag_or_id, above=None):
+        for item_id in self.find_withtag(tag_or_id):
+            self.items[item_id] = self.items.pop(item_id)
+    lift = tag_raise
+
+    def tag_lower(self, tag_or_id, below=None):
+        lowered = {i: self.items[i] for i in self.find_withtag(tag_or_id)}
+        rest = {i: item for i, item in self.items.items() if i not in lowered}
+        self.items = {**lowered, **rest}
+
+    def tag_bind(self, tag, sequence=None, func=None, add=None):
+        if sequence is None: # sequences bound to tag, as Tk lists them
+            return tuple(seq for (t, seq) in self.tag_bindings if t == tag)
+        if func is None:
+            return self.tag_bindings.get((tag, sequence))
+        self.tag_bindings[(tag, sequence)] = func
+
+    def tag_unbind(self, tag, sequence, funcid=None):
+        self.tag_bindings.pop((tag, sequence), None)
+
+    def bind(self, sequence=None, func=None, add=None):
+        if func is None:
+            return self.bindings.get(sequence)
+        self.bindings[sequence] = func
+
+    def unbind(self, sequence, funcid=None):
+        self.bindings.pop(sequence, None)
+
+    def pack(self, **kwargs): pass
+    def place(self, **kwargs): pass
+    def config(self, **kwargs): pass
+    configure = config
+    def update(self): pass
+    def update_idletasks(self): pass
+    def winfo_width(self): return self.width
+    def winfo_height(self): return self.height
+
+    # Hit-testing
+    def _contains(self, item, x, y):
+        options = item["options"]
+        if options.get("state", "normal") in ("hidden", "disabled"):
+            return False
+        c = item["coords"]
+        if item["kind"] == "image":
+            image = options.get("image")
+            if image is None:
+                return False
+            w, h = image.width(), image.height()
+            anchor = options.get("anchor", "center")
+            if anchor == "center": # (which contains "e" and "n")
+                anchor = ""
+            x1 = c[0] - (0 if "w" in anchor else w if "e" in anchor else w / 2)
+            y1 = c[1] - (0 if "n" in anchor else h if "s" in anchor else h / 2)
+            return x1 <= x <= x1 + w and y1 <= y <= y1 + h
+        if item["kind"] in ("rectangle", "oval"):
+            if options.get("fill", "") == "":
+                return False # unfilled shapes are only hit on their outline
+            x1, x2 = sorted((c[0], c[2]))
+            y1, y2 = sorted((c[1], c[3]))
+            if item["kind"] == "rectangle":
+                return x1 <= x <= x2 and y1 <= y <= y2
+            rx, ry = (x2 - x1) / 2, (y2 - y1) / 2
+            if rx == 0 or ry == 0:
+                return False
+            return ((x - x1 - rx) / rx) ** 2 + ((y - y1 - ry) / ry) ** 2 <= 1
+        return False # text, lines and polygons are not used as touch targets
+
+    def item_at(self, x, y):
+        # Topmost pickable item under (x, y), or None
+        for item_id in reversed(list(self.items)):
+            if self._contains(self.items[item_id], x, y):
+                return item_id
+        return None
+
+    def find_overlapping(self, x1, y1, x2, y2):
+        # Only point queries (x1 == x2, y1 == y2) are needed: pickable items
+        # under the point, bottom to top, as Tk returns them
+        return tuple(i for i, item in self.items.items()
+                     if self._contains(item, (x1 + x2) / 2, (y1 + y2) / 2))
+
+    def event_generate(self, sequence, x=0, y=0, time=0, when=None, **kwargs):
+        # Only <Button-1> is generated on the canvas. when="tail" queues the
+        # touch behind whatever is already pending, like Tk's event queue.
+        if sequence not in ("<Button-1>", "<ButtonPress-1>"):
+            return
+        event = HeadlessEvent(x, y, time)
+        if when == "tail":
+            self.root.after(0, self._deliver, event)
+        else:
+            self._deliver(event)
+
+    def touch(self, x, y):
+        # Delivers a <Button-1> at (x, y). Returns the tags of the item that
+        # was hit (empty if only the canvas itself, or nothing, was hit).
+        return self._deliver(HeadlessEvent(x, y))
+
+    def _deliver(self, event):
+        x, y = event.x, event.y
+        item_id = self.item_at(x, y)
+        tags = self.items[item_id]["tags"] if item_id is not None else ()
+        for tag in tags + (("all",) if item_id is not None else ()):
+            func = self.tag_bindings.get((tag, "<Button-1>"))
+            if func is not None:
+                func(event)
+        func = self.bindings.get("<Button-1>")
+        if func is not None:
+            func(event)
+        return tags
+
+
+class HeadlessPhotoImage(object):
+    # Stand-in for ImageTk.PhotoImage; keeps the PIL image and its size
+    def __init__(self, image=None, **kwargs):
+        self.image = image
+        size = getattr(image, "size", None) or (kwargs.get("width", 0), kwargs.get("height", 0))
+        self._width, self._height = size
+
+    def width(self):
+        return self._width
+
+    def height(self):
+        return self._height
+
+
+def _virtual_datetime(root):
+    # datetime class whose now() follows the root's virtual clock (SessionTime)
+    class VirtualDatetime(datetime):
+        @classmethod
+        def now(cls, tz=None):
+            return cls.fromtimestamp(root.wall_time(), tz)
+    return VirtualDatetime
+
+
+@contextmanager
+def working_directory(folder):
+    # The programs find their .csv/stimuli relative to getcwd()
+    previous = getcwd()
+    chdir(folder)
+    try:
+        yield
+    finally:
+        chdir(previous)
+
+
+def load_program(program_path, headless=True):
+    # Imports a fresh copy of an experiment script (its __main__ block does
+    # not run) with the Tk classes swapped for the headless ones. With
+    # headless=False the real Tk classes are kept (e.g., for stress tests).
+    program_path = os_path.abspath(program_path)
+    name = f"p003_headless_{next(_module_counter)}"
+    spec = spec_from_file_location(name, program_path)
+    program = module_from_spec(spec)
+    with working_directory(os_path.dirname(program_path)), \
+            open(devnull, "w") as sink, redirect_stdout(sink):
+        spec.loader.exec_module(program)
+    program.operant_box_version = False # never drive the hopper from here
+    if not headless:
+        return program
+    program.Toplevel = program.Tk = HeadlessRoot
+    program.Canvas = HeadlessCanvas
+    program.ImageTk = SimpleNamespace(PhotoImage=HeadlessPhotoImage)
+    return program
+
+
+def mainscreen_kwargs(program, subject_ID, session_seed=None, **kwargs):
+    # MainScreen arguments for a test/analysis session (no data written),
+    # keeping only the ones this program's MainScreen actually takes
+    kwargs = {"subject_ID": subject_ID,
+              "record_data": False,
+              "data_folder_directory": os_path.dirname(program.__file__),
+              "session_seed": session_seed,
+              "exp_phase_num": "NA",
+              **kwargs}
+    accepted = signature(program.MainScreen.__init__).parameters
+    return {k: v for k, v in kwargs.items() if k in accepted}
+
+
+class HeadlessSession(object):
+    # One MainScreen of one program, run on a virtual clock. Constructor
+    # arguments the program's MainScreen does not take are dropped, so the
+    # same call works for every P003 program, e.g.:
+    #     s = HeadlessSession("P003Fc/P003Fc_ExpProgram_RP.py", "Peach",
+    #                         session_seed=1234, phase_type="OMS")
+    #     s.start(); s.run(until_ms=60000); s.touch(512, 384); s.run()
+    def __init__(self, program_path, subject_ID="TEST", session_seed=None,
+                 quiet=True, **options):
+        self.program_path = os_path.abspath(program_path)
+        self.folder = os_path.dirname(self.program_path)
+        self.quiet = quiet
+        self.program = load_program(self.program_path)
+        kwargs = mainscreen_kwargs(self.program, subject_ID, session_seed,
+                                   **options)
+        with self._running():
+            self.screen = self.program.MainScreen(**kwargs)
+            if hasattr(self.screen, "preload"): # session prepared before the spacebar
+                self.screen.preload.wait()
+        self.root = self.screen.root
+        self.canvas = self.screen.mastercanvas
+        # Put the program's clocks on the virtual timeline
+        self.program.time = self.root.wall_time
+        self.program.datetime = _virtual_datetime(self.root)
+        self.screen.scheduler.clock = self.root.clock
+        self.screen.scheduler.wall_clock = self.root.wall_time
+        self.screen.touch_latency_log.clock = self.root.clock
+
+    @contextmanager
+    def _running(self):
+        with working_directory(self.folder):
+            if self.quiet:
+                with open(devnull, "w") as sink, redirect_stdout(sink):
+                    yield
+            else:
+                yield
+
+    @property
+    def now_ms(self):
+        return self.root.now_ms
+
+    @property
+    def finished(self):
+        return self.root.destroyed
+
+    def start(self):
+        # Same as pressing the space bar once the bird is in the box
+        with self._running():
+            self.root.key("<space>")
+
+    def run(self, until_ms=None):
+        with self._running():
+            self.root.run(until_ms)
+
+    def after(self, ms, func, *args):
+        # Schedules func at now + ms on the session's virtual clock
+        return self.root.after(ms, func, *args)
+
+    def touch(self, x, y):
+        with self._running():
+            return self.canvas.touch(x, y)
+
+    def data(self):
+        # session_data_frame as a list of {column: value} dicts
+        header, *rows = self.screen.session_data_frame
+        return [dict(zip(header, row)) for row in rows]
@@ -0,0 +1,144 @@
+# -*- coding: utf-8 -*-
+"""
+Hidden patch geometry and lookup for P003f.
+
+P003f hides a patch at one of eight compass locations around the key. The
+locations only depend on the screen, so compass_layout() computes them once
+(in build_scene), as Rects with their corners in order, and checks that
+every patch is wholly on the screen, clear of the key and of the other
+patches:
+
+    self.hidden_patch_layout = compass_layout((512, 384), distance = 300, size = 100,
+                                              avoid = [key_outline])
+
+The patches of a session, one or many, are then put in a PatchGrid: a
+uniform grid over the screen where each cell lists the patches that overlap
+it, so a touch is only checked against the patches of its own cell, i.e.
+in constant time however many patches there are. A PatchGrid is a shape
+like Rect and Disc (scene.py), so it is the scene's "hidden_patch" region:
+
+    self.hidden_patches = PatchGrid({location: self.hidden_patch_layout[location]
+                                     for location in locations})
+    self.scene.reshape("hidden_patch", self.hidden_patches)
+    location = self.hidden_patches.hit(event.x, event.y) # on a hidden patch peck
+
+hit() also counts the pecks on each patch; the counts are summarized in the
+terminal and written next to the session data file (_hidden-patches.csv)
+at the end of the session. That file lists every patch the session showed,
+pecked or not, so replay.py and region_mask.py rebuild a session's patches
+from it (session_patches); for data recorded before it existed, they fall
+back to the patches logged on hidden_patch_peck rows.
+"""
+from csv import DictReader, writer, QUOTE_MINIMAL
+from math import floor
+from numbers import Real
+from os import path as os_path
+
+from P003_common.data_files import side_file_loc
+from P003_common.region_mask import SCREEN_SIZE
+from P003_common.scene import Rect, Disc
+
+# Compass locations in the order the programs list them, as (x, y) steps
+# away from the center (screen y grows downwards)
+COMPASS = {"north": (0, -1), "north-east": (1, -1), "east": (1, 0),
+           "south-east": (1, 1), "south": (0, 1), "south-west": (-1, 1),
+           "west": (-1, 0), "north-west": (-1, -1)}
+
+PATCH_COLUMNS = ["Patch", "X1", "Y1", "X2", "Y2", "Pecks"]
+
+
+def overlaps(rect, shape):
+    # Whether a Rect shares any point with another Rect or a Disc
+    if isinstance(shape, Disc):
+        # Closest point of the rectangle to the disc's center
+        x = min(max(shape.cx, rect.x1), rect.x2)
+        y = min(max(shape.cy, rect.y1), rect.y2)
+        return shape.contains(x, y)
+    return (rect.x1 <= shape.x2 and shape.x1 <= rect.x2
+            and rect.y1 <= shape.y2 and shape.y1 <= rect.y2)
+
+
+def compass_layout(center, distance, size, avoid=(), screen=SCREEN_SIZE):
+    # {location: Rect} of size x size patches centered distance px (on each
+    # axis) from center at every compass location; raises ValueError if a
+    # patch is off the screen or touches another patch or an avoid shape
+    cx, cy = center
+    layout = {}
+    for location, (dx, dy) in COMPASS.items():
+        x, y = cx + (dx * distance), cy + (dy * distance)
+        layout[location] = Rect(x - (size / 2), y - (size / 2), x + (size / 2), y + (size / 2))
+    locations = list(layout)
+    for i, location in enumerate(locations):
+        rect = layout[location]
+        if rect.x1 < 0 or rect.y1 < 0 or rect.x2 > screen[0] or rect.y2 > screen[1]:
+            raise ValueError(f"Hidden patch {location} {rect.key[1:]} is off the screen")
+        for other in locations[i + 1:]:
+            if overlaps(rect, layout[other]):
+                raise ValueError(f"Hidden patches {location} and {other} overlap")
+        for shape in avoid:
+            if overlaps(rect, shape):
+                raise ValueError(f"Hidden patch {location} overlaps {shape.key}")
+    return layout
+
+
+class PatchGrid(object):
+    def __init__(self, patches, cell=64):
+        # patches: {patch ID: Rect}, checked in this order where they overlap
+        self.patches = dict(patches)
+        self.cell = cell # grid cell size in px
+        self.cells = {} # (column, row) -> [patch IDs overlapping the cell]
+        for patch_id, rect in self.patches.items():
+            for column in range(floor(rect.x1 / cell), floor(rect.x2 / cell) + 1):
+                for row in range(floor(rect.y1 / cell), floor(rect.y2 / cell) + 1):
+                    self.cells.setdefault((column, row), []).append(patch_id)
+        self.key = ("patches",) + tuple((patch_id,) + rect.key
+                                        for patch_id, rect in self.patches.items())
+        self.pecks = {patch_id: 0 for patch_id in self.patches} # hit() counts
+
+    def patch_at(self, x, y):
+        # ID of the first patch containing (x, y), or None
+        for patch_id in self.cells.get((floor(x / self.cell), floor(y / self.cell)), ()):
+            if self.patches[patch_id].contains(x, y):
+                return patch_id
+        return None
+
+    def contains(self, x, y):
+        # (also takes NumPy arrays of x and y, e.g. to make a region mask)
+        if isinstance(x, Real) and isinstance(y, Real):
+            return self.patch_at(x, y) is not None
+        inside = False
+        for rect in self.patches.values():
+            inside = inside | rect.contains(x, y)
+        return inside
+
+    def hit(self, x, y):
+        # Patch pecked at (x, y) (counted), or "NA" if none is there
+        patch_id = self.patch_at(x, y)
+        if patch_id is None:
+            return "NA"
+        self.pecks[patch_id] += 1
+        return patch_id
+
+    def summary(self):
+        counts = " | ".join(f"{patch_id} {pecks}" for patch_id, pecks in self.pecks.items())
+        return f"Hidden patch pecks: {counts or 'no patches'}"
+
+    def write(self, file_loc):
+        # Geometry and peck count of every patch of the session
+        with open(file_loc, 'w', newline='') as myFile:
+            w = writer(myFile, quoting=QUOTE_MINIMAL)
+            w.writerow(PATCH_COLUMNS)
+            w.writerows([patch_id, rect.x1, rect.y1, rect.x2, rect.y2, self.pecks[patch_id]]
+                         for patch_id, rect in self.patches.items())
+
+
+def session_patches(data_file_loc):
+    # {patch ID: Rect} of every hidden patch a session showed, in the order
+    # written, from the _hidden-patches.csv next to its data file; None if
+    # the session has no such file
+    file_loc = side_file_loc(data_file_loc, "hidden-patches")
+    if not os_path.exists(file_loc):
+        return None
+    with open(file_loc, 'r', encoding='utf-8-sig') as f:
+        return {row["Patch"]: Rect(float(row["X1"]), float(row["Y1"]), float(row["X2"]), float(row["Y2"]))
+                for row in DictReader(f)}
@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+"""
+Session preparation on a worker thread, before the spacebar.
+
+Every program used to read its stimulus .csv, decode its PNGs and draw
+(or look up) its trial order inside first_ITI, i.e. after the experimenter
+pressed space with the bird already in the box. All of that only depends on
+the subject and condition picked in the ExperimenterControlPanel, so
+MainScreen now starts it as soon as it is made:
+
+    self.preload = SessionPreload(self.prepare_session)   # end of __init__
+    self.preload.show_status(self.root, self.mastercanvas) # start screen
+
+prepare_session() runs on a worker thread and must not touch Tk: it only
+sets plain attributes (PIL images, trial order, schedules, trial plan).
+first_ITI then calls self.preload.result(), which waits for the worker if
+it has not finished yet (and re-raises anything it raised), and makes the
+PhotoImages on the Tk thread.
+
+The start screen shows "Preparing session..." until the worker is done,
+then "Session ready" (or the error). Nothing else uses the session's RNG
+streams before the spacebar, so a seed draws the same session as before.
+"""
+from threading import Thread
+from time import perf_counter
+
+
+class SessionPreload(object):
+    def __init__(self, prepare):
+        self.prepare = prepare
+        self.seconds = None # how long prepare() took
+        self._result = None
+        self._error = None
+        self._poll_id = None
+        self._root = None
+        self._thread = Thread(target=self._run, name="P003 session preload", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        start = perf_counter()
+        try:
+            self._result = self.prepare()
+        except BaseException as error: # re-raised on the Tk thread by result()
+            self._error = error
+        self.seconds = perf_counter() - start
+
+    def ready(self):
+        return not self._thread.is_alive()
+
+    def wait(self):
+        # Blocks until prepare() has finished (e.g., headless sessions, which
+        # only stay in the program's folder while MainScreen is being made)
+        self._thread.join()
+
+    def result(self):
+        # Waits for prepare() to finish; returns what it returned
+        self.wait()
+        self.stop_status()
+        if self._error is not None:
+            raise self._error
+        return self._result
+
+    def show_status(self, root, canvas, x=512, y=520, poll_ms=100):
+        # Ready indicator on the start screen, polled from the Tk thread
+        self._root = root
+        text_id = canvas.create_text(x, y, fill="yellow", font="Times 20 italic",
+                                     text="Preparing session...")
+        def poll():
+            self._poll_id = None
+            if not self.ready():
+                self._poll_id = root.after(poll_ms, poll)
+            elif self._error is not None:
+                canvas.itemconfigure(text_id, fill="red",
+                                     text=f"Session preparation failed: {self._error!r}")
+            else:
+                canvas.itemconfigure(text_id, fill="green",
+                                     text=f"Session ready ({self.seconds:.1f} s)")
+        poll()
+
+    def stop_status(self):
+        # Cancels the indicator's polling (e.g., at the spacebar)
+        if self._poll_id is not None:
+            self._root.after_cancel(self._poll_id)
+            self._poll_id = None
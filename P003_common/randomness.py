@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+"""
+Seeded, per-session random number generation for the P003 programs.
+
+Each session gets one SessionRNG. Its seed is written into every data row
+(SessionSeed column), so any session can be regenerated exactly by passing
+the same seed back in (e.g., MainScreen(..., session_seed=1234) or the
+headless tools).
+
+The seed feeds separate streams, so that changing how outcomes are drawn
+(e.g., a new schedule rule) never changes the trial order of a seed, and
+vice versa:
+    rng.order    -> trial order, hidden patch placement, other session design
+    rng.outcome  -> reinforcement dice rolls, VR requirements, Pavlovian draws
+"""
+from random import Random, SystemRandom
+
+
+class SessionRNG(object):
+    def __init__(self, seed=None):
+        # If no seed is given, draw a fresh one from the OS so that sessions
+        # are still different from each other, but the seed is known
+        if seed is None:
+            seed = SystemRandom().randrange(2 ** 32)
+        self.seed = int(seed)
+        self.order = self.stream("order")
+        self.outcome = self.stream("outcome")
+
+    def stream(self, name):
+        # Independent generator derived from the session seed and a stream name
+        return Random(f"{self.seed}-{name}")
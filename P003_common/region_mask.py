@@ -0,0 +1,179 @@
+# -*- coding: utf-8 -*-
+"""
+Rasterized touch-region label masks for the P003 programs.
+
+CanvasScene (scene.py) classifies a touch by checking the live regions'
+shapes in order. A RegionMask does that check once for every pixel of a
+screen layout (the groups shown, e.g. background + keys, with the shapes
+they have then), using the same Rect/Disc formulas on whole NumPy arrays:
+
+    labels[y, x] = 1 + index of the first region containing (x, y), 0: none
+
+Each program makes the masks of all its layouts in prepare_session(),
+i.e. on the preload worker thread before the spacebar:
+
+    self.scene.prepare_masks(("background",), ("background", "start_signal"),
+                             ("background", "keys"))
+
+and from then on the scene classifies a touch with one array lookup. P003f
+prepares its trial layout for all 8 hidden patch positions. Touches off the
+mask (or in a layout nobody prepared) are still classified by the shapes.
+
+The same masks classify logged touches after the fact, vectorized over a
+whole data file (and over data files that were recorded before the Region
+column existed), e.g.:
+
+    python -m P003_common.region_mask P003f/P003F_ExpProgram_RP.py data/*/*.csv \\
+        --out regions_P003f.csv
+
+NumPy is optional: without it no masks are made and the scene keeps
+classifying every touch by its shapes.
+"""
+from argparse import ArgumentParser
+from csv import DictReader, writer, QUOTE_MINIMAL
+from os import path as os_path
+
+try:
+    import numpy as np
+except ImportError: # shapes only (see above)
+    np = None
+
+SCREEN_SIZE = (1024, 768) # every P003 program's canvas (width, height)
+ITI_LAYOUT = ("background",)
+START_SIGNAL_LAYOUT = ("background", "start_signal")
+TRIAL_LAYOUT = ("background", "keys")
+TOUCH_EVENTS = ("ITI_peck", "start_signal_press", "key_peck",
+                "background_peck", "hidden_patch_peck")
+
+REGION_COLUMNS = ["File", "Event", "Region", "Count"]
+
+
+class RegionMask(object):
+    def __init__(self, regions, size=SCREEN_SIZE):
+        # regions: [(region ID, tag, shape)] in the order they are checked
+        self.regions = [(region_id, tag) for region_id, tag, _ in regions]
+        self.width, self.height = size
+        xs = np.arange(self.width)[np.newaxis, :]
+        ys = np.arange(self.height)[:, np.newaxis]
+        self.labels = np.zeros((self.height, self.width), dtype=np.uint8)
+        # Paint the last region first, so the first one checked ends on top
+        for index in reversed(range(len(regions))):
+            inside = np.broadcast_to(regions[index][2].contains(xs, ys), self.labels.shape)
+            self.labels[inside] = index + 1
+        # Region ID of each label (0: "NA"), for vectorized lookups
+        self.region_ids = np.array(["NA"] + [region_id for region_id, _ in self.regions], dtype=object)
+
+    def covers(self, x, y):
+        # Whether (x, y) is a pixel of the mask (touches come as ints)
+        return (x == int(x) and y == int(y)
+                and 0 <= x < self.width and 0 <= y < self.height)
+
+    def region_at(self, x, y):
+        # (region ID, tag) of a touch at a pixel of the mask, or None
+        label = self.labels[int(y), int(x)]
+        return self.regions[label - 1] if label else None
+
+    def classify(self, xs, ys):
+        # Region ID of every (xs[i], ys[i]) at once ("NA": no region or off
+        # the mask)
+        xs = np.asarray(xs, dtype=float)
+        ys = np.asarray(ys, dtype=float)
+        on_mask = ((xs >= 0) & (xs < self.width) & (ys >= 0) & (ys < self.height)
+                   & (xs == np.floor(xs)) & (ys == np.floor(ys)))
+        labels = np.zeros(xs.shape, dtype=np.uint8)
+        labels[on_mask] = self.labels[ys[on_mask].astype(int), xs[on_mask].astype(int)]
+        return self.region_ids[labels]
+
+
+def assign_regions(scene, rows, hidden_patch_layout=None, shown_patches=None):
+    # Region ID of every touch row of one session's data file (a list of
+    # DictReader rows), from the layout that was on screen when it was
+    # logged; "NA" for rows that are not touches. shown_patches: P003f's
+    # {location: Rect} of the session's hidden patches (patches.session_patches)
+    from P003_common.patches import PatchGrid
+
+    regions = np.array(["NA"] * len(rows), dtype=object)
+    trial_mask = scene.prepare_mask(TRIAL_LAYOUT)
+    if not shown_patches and hidden_patch_layout:
+        # Data without a _hidden-patches.csv only logs the patches that
+        # were pecked (on hidden patch pecks); without any, no touch was
+        # on a patch
+        shown_patches = {}
+        for location in (row.get("HiddenPatch") for row in rows):
+            if location in hidden_patch_layout:
+                shown_patches.setdefault(location, hidden_patch_layout[location])
+    if shown_patches:
+        trial_mask = scene.prepare_mask(TRIAL_LAYOUT + ("hidden_patch",),
+                                        hidden_patch = PatchGrid(shown_patches))
+    by_layout = {} # mask -> [row indexes]
+    start_signal_done = False
+    for i, row in enumerate(rows):
+        event = row.get("Event")
+        if event not in TOUCH_EVENTS:
+            continue
+        if event == "ITI_peck":
+            mask = scene.prepare_mask(ITI_LAYOUT)
+        elif not start_signal_done:
+            # Touches before the start signal press (and the press itself)
+            mask = scene.prepare_mask(START_SIGNAL_LAYOUT)
+            start_signal_done = event == "start_signal_press"
+        else:
+            mask = trial_mask
+        by_layout.setdefault(mask, []).append(i)
+    for mask, indexes in by_layout.items():
+        xs = [rows[i]["Xcord"] for i in indexes]
+        ys = [rows[i]["Ycord"] for i in indexes]
+        regions[indexes] = mask.classify(np.array(xs, dtype=float), np.array(ys, dtype=float))
+    return regions
+
+
+def main():
+    from P003_common.headless import HeadlessSession
+    from P003_common.patches import session_patches
+    from P003_common.replay import RecordedSession
+
+    parser = ArgumentParser(description="Assign touch regions to logged P003 touches with the program's region masks")
+    parser.add_argument("program", help="experiment script, e.g. P003f/P003F_ExpProgram_RP.py")
+    parser.add_argument("csv_files", nargs="+", help="recorded session data .csv files")
+    parser.add_argument("--out", default="region_counts.csv", help="touch counts per file, event and region")
+    args = parser.parse_args()
+    if np is None:
+        parser.error("NumPy is needed to classify logged touches")
+
+    # The regions only depend on the program, not on the subject
+    recorded = RecordedSession(args.csv_files[0])
+    session = HeadlessSession(args.program, recorded.subject_ID,
+                              exp_phase_name=recorded.exp_phase_name,
+                              phase_type=recorded.phase_type())
+    scene = session.screen.scene
+    hidden_patch_layout = getattr(session.screen, "hidden_patch_layout", None)
+
+    results = []
+    mismatches = 0
+    for csv_path in args.csv_files:
+        with open(csv_path, 'r', encoding='utf-8-sig') as f:
+            rows = list(DictReader(f))
+        shown_patches = session_patches(csv_path) if hidden_patch_layout else None
+        regions = assign_regions(scene, rows, hidden_patch_layout, shown_patches)
+        counts = {}
+        for row, region in zip(rows, regions):
+            if row.get("Event") in TOUCH_EVENTS:
+                key = (row["Event"], region)
+                counts[key] = counts.get(key, 0) + 1
+                # Files with a logged Region column are checked against it
+                if row.get("Region", region) != region:
+                    mismatches += 1
+        results += [[os_path.basename(csv_path), event, region, count]
+                    for (event, region), count in sorted(counts.items())]
+
+    with open(args.out, 'w', newline='') as myFile:
+        w = writer(myFile, quoting=QUOTE_MINIMAL)
+        w.writerow(REGION_COLUMNS)
+        w.writerows(results)
+    print(f"{sum(row[3] for row in results)} touches in {len(args.csv_files)} files; "
+          f"{mismatches} differ from a logged Region")
+    print(f"\n- Region counts written to {args.out}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,263 @@
+# -*- coding: utf-8 -*-
+"""
+Replay recorded P003 sessions through the current program code.
+
+Each recorded touch (start signal press, key/background/hidden patch pecks)
+is delivered again, at its recorded x/y and TrialTime, to a HeadlessSession
+of whichever program script is given. The program's own timers, peck
+handlers and calculate_trial_outcome() then decide each trial, so the
+output is the trial-by-trial outcome the script *as it is now* would have
+produced for the same bird behavior. Trial types are forced to the recorded
+ones, and the recorded SessionSeed (if the file has one) is reused, so a
+session replayed through unchanged code reproduces its own outcomes.
+
+ITI pecks are not replayed (they cannot change an outcome), and pecks the
+bird never made cannot be invented: if a changed program keeps a trial
+going longer than the recording, the extra time has no pecks in it.
+
+Many sessions can be replayed in parallel from the terminal, e.g.:
+
+    python -m P003_common.replay P003e/P003E_ExpProgram_RP.py data/*/*.csv \\
+        --out replay_RR.csv --workers 4
+"""
+from argparse import ArgumentParser
+from concurrent.futures import ProcessPoolExecutor
+from csv import DictReader, writer, QUOTE_MINIMAL
+from os import path as os_path
+
+from P003_common.headless import HeadlessSession
+from P003_common.patches import session_patches
+from P003_common.trial_plan import TrialPlan
+
+OUTCOME_EVENTS = ("reinforced_trial", "nonreinforced_trial")
+TRIAL_TOUCH_EVENTS = ("key_peck", "background_peck", "hidden_patch_peck")
+START_SIGNAL_EVENT = "start_signal_press"
+START_KEY_CENTER = (512, 384) # center of the start signal key on every program
+
+REPLAY_COLUMNS = ["File", "TrialNum", "TrialType", "RecordedOutcome",
+                  "ReplayedOutcome", "RecordedKeyPecks", "ReplayedKeyPecks",
+                  "Match"]
+
+
+class RecordedTrial(object):
+    def __init__(self, trial_num):
+        self.trial_num = trial_num
+        self.trial_type = None
+        self.trial_color = None
+        self.outcome = "NA"
+        self.requirement = None # logged response requirement (e.g. VRRequirement), if any
+        self.touches = [] # (TrialTime s, x, y) of every in-trial touch
+        self.key_pecks = 0
+
+
+class RecordedSession(object):
+    # Everything replay needs from one session's data .csv
+    def __init__(self, csv_path):
+        self.csv_path = csv_path
+        self.subject_ID = None
+        self.exp_phase_name = None
+        self.hidden_patch_locations = [] # P003f: hidden patches the session showed
+        self.session_seed = None
+        self.outcome_mode = None # P003Fc: "end_of_trial" or "immediate"
+        self.start_touches = [] # touches made while the start signal was up
+        self.trials = {} # TrialNum -> RecordedTrial
+
+        start_signal_done = False
+        with open(csv_path, 'r', encoding='utf-8-sig') as f:
+            for row in DictReader(f):
+                self.subject_ID = self.subject_ID or row.get("Subject")
+                self.exp_phase_name = self.exp_phase_name or row.get("ExpPhase")
+                if row.get("SessionSeed") not in (None, "", "NA"):
+                    self.session_seed = int(row["SessionSeed"])
+                self.outcome_mode = self.outcome_mode or row.get("OutcomeMode")
+                if (row.get("HiddenPatch") not in (None, "", "NA")
+                        and row["HiddenPatch"] not in self.hidden_patch_locations):
+                    self.hidden_patch_locations.append(row["HiddenPatch"])
+                try:
+                    trial_num = int(row["TrialNum"])
+                except (KeyError, ValueError):
+                    continue
+                if trial_num < 1:
+                    continue
+                event = row["Event"]
+                trial = self.trials.setdefault(trial_num, RecordedTrial(trial_num))
+
+                if event in OUTCOME_EVENTS:
+                    trial.trial_type = row["TrialType"]
+                    trial.trial_color = row.get("TrialColor")
+                    trial.outcome = event
+                    if row.get("VRRequirement") not in (None, "", "NA"):
+                        trial.requirement = int(row["VRRequirement"])
+                elif event in TRIAL_TOUCH_EVENTS + (START_SIGNAL_EVENT,):
+                    touch = (max(0.0, float(row["TrialTime"])),
+                             float(row["Xcord"]), float(row["Ycord"]))
+                    # Pecks made before the first trial's start signal was
+                    # answered belong to the start signal period
+                    if trial_num == 1 and not start_signal_done:
+                        self.start_touches.append(touch)
+                        start_signal_done = event == START_SIGNAL_EVENT
+                        continue
+                    if trial.trial_type is None:
+                        trial.trial_type = row["TrialType"]
+                        trial.trial_color = row.get("TrialColor")
+                    trial.touches.append(touch)
+                    if event == "key_peck":
+                        trial.key_pecks += 1
+
+        # Trials without a type were only ever in their ITI (session ended)
+        self.trials = {n: t for n, t in self.trials.items() if t.trial_type is not None}
+        # P003f writes every patch it showed, pecked or not, next to the data
+        # file; older data only has the ones pecked (in order of first peck)
+        shown_patches = session_patches(csv_path)
+        if shown_patches:
+            self.hidden_patch_locations = list(shown_patches)
+        if not start_signal_done:
+            self.start_touches.append((0.0,) + START_KEY_CENTER)
+
+    def correct_trial_types(self, stimulus_assignments_dict):
+        # P003Fb logs the *next* trial's type in TrialType (its TrialColor is
+        # right), so where a TrialColor belongs to exactly one trial type,
+        # that type wins over the logged one
+        types_by_color = {}
+        for trial_type, color in stimulus_assignments_dict.items():
+            types_by_color.setdefault(color, []).append(trial_type)
+        for trial in self.trials.values():
+            color_types = types_by_color.get(trial.trial_color, [])
+            if len(color_types) == 1:
+                trial.trial_type = color_types[0]
+
+    def trial_types(self):
+        return [self.trials[n].trial_type for n in sorted(self.trials)]
+
+    def requirements(self):
+        # Logged per-trial requirements, or None if the file has none
+        requirements = [self.trials[n].requirement for n in sorted(self.trials)]
+        return requirements if any(r is not None for r in requirements) else None
+
+    def phase_type(self):
+        # "INS"/"OMS" condition of P003Fb/Fc sessions (ignores Fc's INSFR_2 trials)
+        for trial_type in self.trial_types():
+            if not trial_type.startswith("INSFR"):
+                return trial_type.split("_")[0]
+        return None
+
+
+def replay_session(program_path, csv_path, session_seed=None, **mainscreen_kwargs):
+    # Replays one recorded session; returns a list of REPLAY_COLUMNS rows
+    recorded = RecordedSession(csv_path)
+    if session_seed is None:
+        session_seed = recorded.session_seed
+    kwargs = {"exp_phase_name": recorded.exp_phase_name,
+              "phase_type": recorded.phase_type(),
+              "immediate_outcome": recorded.outcome_mode == "immediate",
+              **mainscreen_kwargs}
+    session = HeadlessSession(program_path, recorded.subject_ID, session_seed,
+                              **kwargs)
+    screen = session.screen
+    replayed_outcomes = {}
+    scheduled = {"trial": None, "after_ids": []}
+
+    def schedule_touches(touches):
+        for after_id in scheduled["after_ids"]:
+            session.root.after_cancel(after_id)
+        scheduled["after_ids"] = [session.after(t * 1000, session.touch, x, y)
+                                  for t, x, y in touches]
+
+    # Hook the program's own methods; the originals still do all the work
+    program_write_data = screen.write_data
+    def write_data(event, outcome, *args):
+        if outcome in OUTCOME_EVENTS:
+            replayed_outcomes.setdefault(screen.current_trial_counter, outcome)
+        program_write_data(event, outcome, *args)
+
+    program_start_signal_period = screen.start_signal_period
+    def start_signal_period():
+        program_start_signal_period()
+        schedule_touches(recorded.start_touches)
+
+    program_build_keys = screen.build_keys
+    def build_keys():
+        trial = recorded.trials.get(screen.current_trial_counter)
+        if trial is not None:
+            screen.trial_type = trial.trial_type
+        program_build_keys()
+        # Only on the first build of a trial (Fc re-builds FR trials)
+        if trial is not None and scheduled["trial"] != trial.trial_num:
+            scheduled["trial"] = trial.trial_num
+            schedule_touches(trial.touches)
+
+    screen.write_data = write_data
+    screen.start_signal_period = start_signal_period
+    screen.build_keys = build_keys
+
+    session.start()
+    # first_ITI has now built the program's own trial list (or plan);
+    # replace it
+    recorded.correct_trial_types(screen.stimulus_assignments_dict)
+    if hasattr(screen, "trial_plan"):
+        screen.trial_plan = TrialPlan(order=recorded.trial_types(),
+                                      requirements=recorded.requirements())
+    screen.trial_assignment_list = recorded.trial_types()
+    screen.max_trials = len(screen.trial_assignment_list)
+    if recorded.hidden_patch_locations and hasattr(screen, "place_hidden_patches"):
+        screen.place_hidden_patches(recorded.hidden_patch_locations)
+    session.run()
+
+    replayed_key_pecks = {}
+    for row in session.data():
+        if row["Event"] == "key_peck":
+            replayed_key_pecks[row["TrialNum"]] = replayed_key_pecks.get(row["TrialNum"], 0) + 1
+
+    results = []
+    for n in sorted(recorded.trials):
+        trial = recorded.trials[n]
+        replayed = replayed_outcomes.get(n, "NA")
+        results.append([os_path.basename(csv_path), n, trial.trial_type,
+                        trial.outcome, replayed, trial.key_pecks,
+                        replayed_key_pecks.get(n, 0), trial.outcome == replayed])
+    return results
+
+
+def _replay_job(job):
+    program_path, csv_path, session_seed = job
+    return replay_session(program_path, csv_path, session_seed)
+
+
+def replay_sessions(program_path, csv_paths, workers=None, session_seed=None):
+    # Replays many sessions in parallel (one process per session at a time)
+    jobs = [(program_path, csv_path, session_seed) for csv_path in csv_paths]
+    results = []
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for session_rows in pool.map(_replay_job, jobs):
+            results.extend(session_rows)
+    return results
+
+
+def main():
+    parser = ArgumentParser(description="Replay recorded P003 sessions through a program's current outcome logic")
+    parser.add_argument("program", help="experiment script, e.g. P003e/P003E_ExpProgram_RP.py")
+    parser.add_argument("csv_files", nargs="+", help="recorded session data .csv files")
+    parser.add_argument("--out", default="replay_results.csv", help="trial-by-trial output .csv")
+    parser.add_argument("--workers", type=int, default=None, help="parallel processes (default: all cores)")
+    parser.add_argument("--seed", type=int, default=None,
+                        help="session seed to use instead of each file's SessionSeed")
+    args = parser.parse_args()
+
+    results = replay_sessions(args.program, args.csv_files, args.workers, args.seed)
+    with open(args.out, 'w', newline='') as myFile:
+        w = writer(myFile, quoting=QUOTE_MINIMAL)
+        w.writerow(REPLAY_COLUMNS)
+        w.writerows(results)
+
+    # Terminal summary: outcome agreement per session
+    per_file = {}
+    for row in results:
+        matched, total = per_file.get(row[0], (0, 0))
+        per_file[row[0]] = (matched + row[-1], total + 1)
+    for file_name, (matched, total) in per_file.items():
+        print(f"{file_name:>60} | {matched}/{total} trial outcomes match")
+    print(f"\n- Replay results written to {args.out}")
+
+
+if __name__ == '__main__':
+    main()
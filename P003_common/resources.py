@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+"""
+Per-trial resource counts, to catch canvas, callback and object leaks.
+
+A session runs for hours on the same Tk window, so anything a trial leaves
+behind (a canvas item nobody deletes, a tag binding, an after() timer that
+is never cancelled, a lambda kept alive by one of them) piles up unseen
+until the Pi slows down. ResourceMonitor counts, at the same point of the
+ITI:
+
+    CanvasItems    items on the Canvas (scene items + any transient text)
+    BoundTags      (tag, sequence) Tk bindings on the canvas items' tags
+    PressHandlers  scene handlers that are set (see scene.py)
+    PendingAfters  live root.after() timers ("after info")
+    PythonObjects  objects tracked by Python's garbage collector, minus the
+                   rows the session keeps on purpose (data rows, phase log)
+
+The Tk counts are cheap and taken every trial. Counting Python's objects
+means building a list of every one of them, so PythonObjects is only
+counted in the warmup trials and then every object_every trials ("NA" in
+between; 0 never counts it). A leak of even a few objects per trial still
+adds up past the slack between two counts.
+
+The counts of the first warmup trials set the baseline. From then on, a
+count that goes above the highest value seen so far, by more than its
+slack, prints a warning. A session without leaks should only warn, if at
+all, in its first few trials:
+
+    self.resource_monitor = ResourceMonitor(self.root, self.mastercanvas, self.scene,
+                                            kept = lambda: len(self.session_data_frame))
+    self.resource_monitor.sample(self.current_trial_counter)   # each ITI
+
+The counts are written next to the session data file (_resources.csv) and
+summarized in the terminal at the end of the session.
+"""
+from csv import writer, QUOTE_MINIMAL
+from gc import get_objects
+
+RESOURCE_COLUMNS = ["TrialNum", "CanvasItems", "BoundTags", "PressHandlers",
+                    "PendingAfters", "PythonObjects"]
+
+
+class ResourceMonitor(object):
+    def __init__(self, root, canvas, scene, kept=None, warmup=3, object_slack=200,
+                 object_every=20):
+        self.root = root
+        self.canvas = canvas
+        self.scene = scene
+        self.kept = kept # callable: objects the session keeps on purpose
+        self.warmup = warmup # trials sampled before growth is checked
+        self.object_every = object_every # PythonObjects counted every this many trials (0: never)
+        # How far a count may go above its highest value so far before it
+        # is reported (Python's object count wobbles a little every trial)
+        self.slack = {"CanvasItems": 0, "BoundTags": 0, "PressHandlers": 0,
+                      "PendingAfters": 0, "PythonObjects": object_slack}
+        self.log = [] # RESOURCE_COLUMNS rows, one per sampled trial
+        self.highest = {} # column -> highest count after the warmup
+        self.warnings = [] # (TrialNum, column, previous highest, count)
+
+    def counts(self, count_objects=True):
+        # count_objects: also count Python's objects (slow; "NA" if not)
+        tags = {tag for item in self.canvas.find_all() for tag in self.canvas.gettags(item)}
+        bound_tags = sum(len(self.canvas.tag_bind(tag) or ()) for tag in tags)
+        handlers = sum(handler is not None for handler in self.scene.handlers.values())
+        pending = self.root.tk.call("after", "info")
+        if isinstance(pending, str): # Tk returns "" when there are none
+            pending = pending.split()
+        objects = "NA"
+        if count_objects:
+            objects = len(get_objects()) - (self.kept() if self.kept else 0)
+        return {"CanvasItems": len(self.canvas.find_all()),
+                "BoundTags": bound_tags,
+                "PressHandlers": handlers,
+                "PendingAfters": len(pending),
+                "PythonObjects": objects}
+
+    def sample(self, trial_num):
+        # Counts everything for this trial (Python's objects only in the
+        # warmup and every object_every trials); returns the warnings it raised
+        sampled = len(self.log)
+        counts = self.counts(count_objects = bool(self.object_every)
+                             and (sampled < self.warmup or sampled % self.object_every == 0))
+        self.log.append([trial_num] + [counts[column] for column in RESOURCE_COLUMNS[1:]])
+        if len(self.log) < self.warmup:
+            return []
+        raised = []
+        for column, count in counts.items():
+            if count == "NA":
+                continue
+            if column not in self.highest:
+                # Baseline: the highest count of the warmup trials
+                self.highest[column] = max(row[RESOURCE_COLUMNS.index(column)] for row in self.log
+                                           if row[RESOURCE_COLUMNS.index(column)] != "NA")
+            elif count > self.highest[column] + self.slack[column]:
+                raised.append((trial_num, column, self.highest[column], count))
+                self.highest[column] = count
+        for warning in raised:
+            print(f"WARNING: {warning[1]} grew from {warning[2]} to {warning[3]} "
+                  f"by trial {warning[0]} (possible leak)")
+        self.warnings += raised
+        return raised
+
+    def summary(self):
+        if not self.log:
+            return "Resources: no trials sampled"
+        changes = []
+        for i, column in enumerate(RESOURCE_COLUMNS[1:], 1):
+            counted = [row[i] for row in self.log if row[i] != "NA"] # (PythonObjects: not every trial)
+            changes.append(f"{column} {counted[0]} -> {counted[-1]}" if counted else f"{column} NA")
+        changes = " | ".join(changes)
+        return (f"Resources ({len(self.log)} trials, {len(self.warnings)} growth warnings): "
+                f"{changes}")
+
+    def write(self, file_loc):
+        # Per-trial counts of the session
+        with open(file_loc, 'w', newline='') as myFile:
+            w = writer(myFile, quoting=QUOTE_MINIMAL)
+            w.writerow(RESOURCE_COLUMNS)
+            w.writerows(self.log)
@@ -0,0 +1,175 @@
+# -*- coding: utf-8 -*-
+"""
+Persistent canvas scene for the P003 programs.
+
+Every ITI, start signal and trial used to delete("all") and then rebuild
+the full-screen background, the key (outline, stimulus, midpoint) and, in
+P003f, the hidden patch, re-registering a tag_bind lambda each time. A
+CanvasScene holds all of those items, created once per session and kept
+hidden, so a phase only changes which ones are visible:
+
+    scene.add("keys", canvas.create_oval(..., tag = "key"))   # once
+    scene.add_region("keys", "key_disc", Disc(512, 384, 96), "key")
+    scene.show("background", "keys")                          # each trial
+    scene.on_press("key", lambda event: self.key_press(event, "key_peck"))
+    scene.clear()                                             # end of trial
+
+Touches are classified by geometry, not by Tk's item stacking. The canvas
+has one <Button-1> binding; each touch is checked against the regions of
+the groups that are showing, in the order the regions were added (first
+match wins), e.g. midpoint, then key disc, then key outline ring, then the
+full-screen background. The region's ID is put on the event
+(event.region, logged in the Region column) and the handler set with
+on_press() for the region's tag ("key", "bkgrd", "hidden_patch") is called.
+With a handful of fixed shapes per screen this is constant time, and it
+does not matter which Tcl item happens to be on top. Layouts given to
+prepare_masks() are rasterized once into a label mask (region_mask.py),
+after which a touch is classified with a single array lookup.
+
+configure() only sends options that changed to Tk, so showing the same
+items again, or the same stimulus twice in a row, costs nothing. Anything
+else drawn on the canvas (e.g., onscreen feedback text in test sessions)
+is transient and is deleted by clear().
+"""
+from P003_common.region_mask import RegionMask, SCREEN_SIZE, np
+
+
+class Rect(object):
+    # Axis-aligned rectangle, edges included (corners in any order)
+    def __init__(self, x1, y1, x2, y2):
+        self.x1, self.x2 = sorted((x1, x2))
+        self.y1, self.y2 = sorted((y1, y2))
+        self.key = ("rect", self.x1, self.y1, self.x2, self.y2)
+
+    def contains(self, x, y):
+        # (also takes NumPy arrays of x and y)
+        return (self.x1 <= x) & (x <= self.x2) & (self.y1 <= y) & (y <= self.y2)
+
+
+class Disc(object):
+    # Filled circle, edge included
+    def __init__(self, cx, cy, radius):
+        self.cx = cx
+        self.cy = cy
+        self.radius = radius
+        self.key = ("disc", cx, cy, radius)
+
+    def contains(self, x, y):
+        return (x - self.cx) ** 2 + (y - self.cy) ** 2 <= self.radius ** 2
+
+
+class CanvasScene(object):
+    def __init__(self, canvas):
+        self.canvas = canvas
+        self.groups = {} # group name -> [item IDs], in stacking order
+        self.visible = set() # groups currently shown
+        self.regions = [] # [group, region ID, shape, tag], in the order they are checked
+        self.handlers = {} # tag -> callback(event) for <Button-1> (None = ignored)
+        self.item_options = {} # item ID -> options last sent to Tk
+        self.masks = {} # layout key -> RegionMask (see prepare_mask)
+        self.mask = None # mask of what is shown now (False: none prepared)
+        self.canvas.bind("<Button-1>", self._press)
+
+    def add(self, group, item_id):
+        # Registers a newly created item under a group (hidden until shown)
+        self.groups.setdefault(group, []).append(item_id)
+        self.configure(item_id, state = "hidden")
+        return item_id
+
+    def add_region(self, group, region_id, shape, tag):
+        # A touch region that is live while its group is shown
+        self.groups.setdefault(group, [])
+        self.regions.append([group, region_id, shape, tag])
+        self.handlers.setdefault(tag, None)
+
+    def reshape(self, region_id, shape):
+        # Moves/resizes a region (e.g., P003f's hidden patch location)
+        for region in self.regions:
+            if region[1] == region_id:
+                region[2] = shape
+        self.mask = None
+
+    def _layout(self, groups, shapes):
+        # Regions live with groups shown, as [(region ID, tag, shape)], and
+        # the key of their mask
+        live = [(region_id, tag, shapes.get(region_id, shape))
+                for group, region_id, shape, tag in self.regions if group in groups]
+        return live, tuple((region_id, tag, shape.key) for region_id, tag, shape in live)
+
+    def prepare_mask(self, groups, **shapes):
+        # Label mask of the layout with groups shown (and regions moved to
+        # shapes, by region ID); made once, then reused. None without NumPy.
+        # Runs on the preload thread, so it must not touch Tk
+        if np is None:
+            return None
+        live, key = self._layout(groups, shapes)
+        if key not in self.masks:
+            self.masks[key] = RegionMask(live, SCREEN_SIZE)
+        return self.masks[key]
+
+    def prepare_masks(self, *layouts):
+        for groups in layouts:
+            self.prepare_mask(groups)
+
+    def region_at(self, x, y):
+        # (region ID, tag) of the first live region containing (x, y), or None
+        if self.mask is None: # what is shown changed: look up its mask
+            _, key = self._layout(self.visible, {})
+            self.mask = self.masks.get(key, False)
+        if self.mask and self.mask.covers(x, y):
+            return self.mask.region_at(x, y)
+        for group, region_id, shape, tag in self.regions:
+            if group in self.visible and shape.contains(x, y):
+                return region_id, tag
+        return None
+
+    def tag_at(self, x, y):
+        # Tag whose handler a touch at (x, y) would go to right now, or None
+        hit = self.region_at(x, y)
+        return hit[1] if hit else None
+
+    def _press(self, event):
+        hit = self.region_at(event.x, event.y)
+        if hit is None:
+            return
+        event.region, tag = hit
+        handler = self.handlers.get(tag)
+        if handler is not None:
+            handler(event)
+
+    def on_press(self, tag, handler):
+        # What a peck on tag does from now on (None: nothing)
+        self.handlers[tag] = handler
+
+    def configure(self, item_id, **options):
+        # itemconfigure() with only the options that changed
+        last = self.item_options.setdefault(item_id, {})
+        changed = {k: v for k, v in options.items() if k not in last or last[k] != v}
+        if changed:
+            self.canvas.itemconfigure(item_id, **changed)
+            last.update(changed)
+
+    def show(self, *groups):
+        self.mask = None
+        for group in groups:
+            self.visible.add(group)
+            for item_id in self.groups[group]:
+                self.configure(item_id, state = "normal")
+
+    def hide(self, *groups):
+        self.mask = None
+        for group in groups:
+            self.visible.discard(group)
+            for item_id in self.groups[group]:
+                self.configure(item_id, state = "hidden")
+
+    def clear(self):
+        # Hides the whole scene, ignores pecks on it, and deletes any
+        # transient items drawn over it
+        self.hide(*self.groups)
+        for tag in self.handlers:
+            self.handlers[tag] = None
+        scene_items = {item_id for items in self.groups.values() for item_id in items}
+        for item_id in self.canvas.find_all():
+            if item_id not in scene_items:
+                self.canvas.delete(item_id)
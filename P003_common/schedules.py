@@ -0,0 +1,389 @@
+# -*- coding: utf-8 -*-
+"""
+Reinforcement schedules for the P003 programs.
+
+Every program's calculate_trial_outcome() used to carry its own copy of the
+outcome rules (per-peck dice loops for RR, a VR band draw, FR2, Pavlovian
+probabilities, yoked ratios). The rules now live here, one class per
+schedule, and every outcome is decided with at most one random draw no
+matter how many pecks there were:
+
+    RandomRatio(n)       each peck has a 1/n chance of meeting the
+                         requirement, so it is met with probability
+                         1 - (1 - 1/n) ** pecks (same as rolling a die
+                         per peck)
+    VariableRatio(n)     requirement drawn uniformly from n +/- band (30%)
+                         each trial, or given from a session table
+                         (requirement_table); met if pecks >= requirement
+    FixedRatio(n)        met if pecks >= n
+    Pavlovian(p)         reinforced with probability p; pecks don't matter
+    Extinction()         never reinforced
+    Yoked(p)             reinforced with probability p (the master bird's
+                         obtained rate); pecks don't matter
+
+Ratio schedules take a contingency: "INS" (instrumental, reinforced if the
+requirement is met) or "OMS" (omission, reinforced unless it is met).
+Each schedule also gives probability(pecks), the exact chance of
+reinforcement, so it can be checked against simulation:
+
+    python -m P003_common.schedules
+
+probability_table() keeps P(reinforced | k pecks) for k = 0..300 of every
+schedule it is asked about, computed exactly once. ReinforcementTally uses
+it to compare expected and observed reinforcers per trial type, with no
+simulation: live (a one-line status() every ITI, the full summary() at the
+end of each session) or afterwards from data files:
+
+    python -m P003_common.schedules --tables probability_tables.csv
+    python -m P003_common.schedules --data data/Peach/*.csv --kind VR --count-background
+"""
+from argparse import ArgumentParser
+from csv import DictReader, writer, QUOTE_MINIMAL
+from random import Random
+
+CONTINGENCIES = ("INS", "OMS")
+
+
+class Schedule(object):
+    # Base class: subclasses give requirement_met() and met_probability()
+    name = "Schedule"
+    depends_on_pecks = True
+
+    def __init__(self, contingency="INS"):
+        if contingency not in CONTINGENCIES:
+            raise ValueError(f"contingency must be one of {CONTINGENCIES}, not {contingency!r}")
+        self.contingency = contingency
+
+    def outcome(self, pecks, rng, requirement=None):
+        # True if the trial is reinforced
+        met = self.requirement_met(pecks, rng, requirement)
+        return met if self.contingency == "INS" else not met
+
+    def probability(self, pecks, requirement=None):
+        # Exact probability that outcome() returns True
+        p_met = self.met_probability(pecks, requirement)
+        return p_met if self.contingency == "INS" else 1 - p_met
+
+    def __repr__(self):
+        return f"{self.contingency} {self.name}"
+
+
+class RandomRatio(Schedule):
+    def __init__(self, ratio, contingency="INS"):
+        super().__init__(contingency)
+        self.ratio = ratio
+        self.name = f"RR{ratio}"
+
+    def met_probability(self, pecks, requirement=None):
+        return 1 - (1 - 1 / self.ratio) ** max(0, pecks)
+
+    def requirement_met(self, pecks, rng, requirement=None):
+        if pecks <= 0:
+            return False
+        return rng.random() < self.met_probability(pecks)
+
+
+class VariableRatio(Schedule):
+    def __init__(self, ratio, contingency="INS", band=0.30):
+        super().__init__(contingency)
+        self.ratio = ratio
+        self.band = band # requirements are spread +/- this fraction of the ratio
+        self.low = max(1, int(round((1 - band) * ratio)))
+        self.high = max(self.low, int(round((1 + band) * ratio)))
+        self.name = f"VR{ratio}"
+
+    def draw_requirement(self, rng):
+        return rng.randint(self.low, self.high)
+
+    def requirement_table(self, trials, rng):
+        # Requirements for a whole session's worth of trials, spread evenly
+        # over the band (each value equally often; any remainder goes to
+        # randomly chosen values), in random order
+        values = list(range(self.low, self.high + 1))
+        table = values * (trials // len(values)) + rng.sample(values, trials % len(values))
+        rng.shuffle(table)
+        return table
+
+    def met_probability(self, pecks, requirement=None):
+        if requirement is not None:
+            return 1.0 if pecks >= requirement else 0.0
+        met_values = min(self.high, pecks) - self.low + 1
+        return max(0, met_values) / (self.high - self.low + 1)
+
+    def requirement_met(self, pecks, rng, requirement=None):
+        if requirement is None:
+            requirement = self.draw_requirement(rng)
+        return pecks >= requirement
+
+
+class FixedRatio(Schedule):
+    def __init__(self, ratio, contingency="INS"):
+        super().__init__(contingency)
+        self.ratio = ratio
+        self.name = f"FR{ratio}"
+
+    def met_probability(self, pecks, requirement=None):
+        return 1.0 if pecks >= self.ratio else 0.0
+
+    def requirement_met(self, pecks, rng, requirement=None):
+        return pecks >= self.ratio
+
+
+class Pavlovian(Schedule):
+    depends_on_pecks = False
+
+    def __init__(self, p=1.0):
+        super().__init__("INS")
+        self.p = p
+        self.name = f"PAV{round(p * 100, 1):g}"
+
+    def met_probability(self, pecks, requirement=None):
+        return self.p
+
+    def requirement_met(self, pecks, rng, requirement=None):
+        # Certain outcomes don't use up a random draw
+        if self.p >= 1:
+            return True
+        if self.p <= 0:
+            return False
+        return rng.random() < self.p
+
+    def __repr__(self):
+        return self.name
+
+
+class Extinction(Pavlovian):
+    def __init__(self):
+        super().__init__(0.0)
+        self.name = "EXT"
+
+
+class Yoked(Pavlovian):
+    def __init__(self, p):
+        super().__init__(p)
+        self.name = f"Yoked{p:.3f}"
+
+
+def ratio_schedule(kind, ratio, contingency):
+    # e.g. ratio_schedule("RR", 5, "INS")
+    return {"RR": RandomRatio, "VR": VariableRatio, "FR": FixedRatio}[kind](ratio, contingency)
+
+
+def schedule_for_code(trial_code, kind="RR", ratio=None):
+    # Schedule for the programs' trial codes: "PAV", "EXT", "INS"/"OMS"
+    # (ratio given), "INS_5"/"OMS_20" (ratio in the code) and "INSFR_2"
+    if trial_code == "PAV":
+        return Pavlovian(1.0)
+    if trial_code == "EXT":
+        return Extinction()
+    contingency, _, code_ratio = trial_code.partition("_")
+    if contingency.endswith("FR"): # e.g., INSFR_2
+        return FixedRatio(int(code_ratio), contingency[:-2])
+    if code_ratio:
+        ratio = int(code_ratio)
+    if ratio is None:
+        raise ValueError(f"no ratio given for trial code {trial_code!r}")
+    return ratio_schedule(kind, ratio, contingency)
+
+
+#%% Exact probability tables
+
+TABLE_MAX_PECKS = 300 # far more pecks than fit in one 10 s trial
+RATIOS_IN_USE = (2, 5, 20, 50)
+PAVLOVIAN_PS_IN_USE = (1.0, 0.353, 0.125, 0.044, 0.011, 0.006) # P003B.ii/iii
+TABLE_COLUMNS = ["Schedule", "Contingency", "Pecks", "PReinforced"]
+_TABLES = {} # (schedule type, parameters, max pecks) -> table
+
+
+def probability_table(schedule, max_pecks=TABLE_MAX_PECKS):
+    # [P(reinforced | 0 pecks), ..., P(reinforced | max_pecks)], computed
+    # exactly the first time it is asked for and cached by the schedule's
+    # parameters (so equal schedules share one table)
+    key = (type(schedule).__name__, tuple(sorted(vars(schedule).items())), max_pecks)
+    if key not in _TABLES:
+        _TABLES[key] = [schedule.probability(pecks) for pecks in range(max_pecks + 1)]
+    return _TABLES[key]
+
+
+def expected_probability(schedule, pecks):
+    # Table lookup, or the exact value past the end of the table
+    table = probability_table(schedule)
+    return table[pecks] if 0 <= pecks < len(table) else schedule.probability(pecks)
+
+
+def schedules_in_use():
+    # RR and VR (+/-30% band) at every ratio in use, under both
+    # contingencies, P003Fc's FR2 and the Pavlovian probabilities
+    schedules = [ratio_schedule(kind, ratio, contingency)
+                 for kind in ("RR", "VR") for ratio in RATIOS_IN_USE
+                 for contingency in CONTINGENCIES]
+    return schedules + [FixedRatio(2)] + [Pavlovian(p) for p in PAVLOVIAN_PS_IN_USE] + [Extinction()]
+
+
+def write_tables(file_loc, schedules, max_pecks=TABLE_MAX_PECKS):
+    # Long-format .csv of the tables, for the analysis scripts
+    with open(file_loc, 'w', newline='') as myFile:
+        w = writer(myFile, quoting=QUOTE_MINIMAL)
+        w.writerow(TABLE_COLUMNS)
+        for schedule in schedules:
+            for pecks, p in enumerate(probability_table(schedule, max_pecks)):
+                w.writerow([schedule.name, schedule.contingency, pecks, round(p, 8)])
+
+
+class ReinforcementTally(object):
+    # Expected vs. observed reinforcers per trial type. Each trial adds its
+    # exact P(reinforced | pecks) from the tables, so the expected count and
+    # its variance (sum of p * (1 - p)) are just lookups
+    def __init__(self):
+        self.trial_types = {} # trial type -> [trials, observed, expected, variance]
+
+    def record(self, trial_type, schedule, pecks, reinforced):
+        p = expected_probability(schedule, pecks)
+        tally = self.trial_types.setdefault(trial_type, [0, 0, 0.0, 0.0])
+        tally[0] += 1
+        tally[1] += bool(reinforced)
+        tally[2] += p
+        tally[3] += p * (1 - p)
+
+    def rows(self):
+        # [trial type, trials, observed, expected, z]. Where nothing could
+        # vary, z is 0 if the outcomes were the certain ones and +/-inf if not
+        # (e.g., a reinforced EXT trial)
+        rows = []
+        for trial_type, (trials, observed, expected, variance) in sorted(self.trial_types.items()):
+            if variance > 0:
+                z = (observed - expected) / variance ** 0.5
+            elif abs(observed - expected) < 1e-9:
+                z = 0.0
+            else:
+                z = float("inf") if observed > expected else float("-inf")
+            rows.append([trial_type, trials, observed, round(expected, 2), round(z, 2)])
+        return rows
+
+    def status(self):
+        # One-line summary() for the terminal during the session
+        if not self.trial_types:
+            return "Reinforcement check: no trials yet"
+        cells = []
+        for trial_type, trials, observed, expected, z in self.rows():
+            flag = " CHECK" if abs(z) > 3 else ""
+            cells.append(f"{trial_type} {observed}/{trials} (exp. {expected:.1f}, z {z:+.2f}{flag})")
+        return "Reinforcement check: " + " | ".join(cells)
+
+    def summary(self):
+        if not self.trial_types:
+            return "Reinforcement check: no trials"
+        lines = ["Reinforcement check (expected from exact P(reinforced | pecks)):"]
+        for trial_type, trials, observed, expected, z in self.rows():
+            lines.append(f"{trial_type:>10}: {observed:>3}/{trials:<3} reinforced | "
+                         f"expected {expected:6.1f} | z {z:+.2f}{'  <-- CHECK' if abs(z) > 3 else ''}")
+        return "\n".join(lines)
+
+    def write(self, file_loc):
+        with open(file_loc, 'w', newline='') as myFile:
+            w = writer(myFile, quoting=QUOTE_MINIMAL)
+            w.writerow(["TrialType", "Trials", "Observed", "Expected", "Z"])
+            w.writerows(self.rows())
+
+
+def tally_session(csv_path, schedule_of, count_background=False, tally=None):
+    # Adds every completed trial of a session's data file to a tally.
+    # schedule_of(trial code) gives each trial's schedule; count_background:
+    # background pecks count toward the requirement (P003Fc). Sessions run
+    # in P003Fc's immediate outcome mode are skipped: their trials end at
+    # the requirement, so the pecks logged are not a full trial's pecks.
+    tally = tally or ReinforcementTally()
+    with open(csv_path, 'r', encoding='utf-8-sig') as f:
+        for row in DictReader(f):
+            if row.get("OutcomeMode") == "immediate":
+                print(f"Skipping {csv_path} (immediate outcome mode)")
+                break
+            if row["Event"] not in ("reinforced_trial", "nonreinforced_trial"):
+                continue
+            pecks = int(row["TargetPeckNum"])
+            if count_background:
+                pecks += int(row["BackgroundPeckNum"])
+            tally.record(row["TrialType"], schedule_of(row["TrialType"]), pecks,
+                         row["Event"] == "reinforced_trial")
+    return tally
+
+
+#%% Checking against simulation
+
+def simulate(schedule, pecks, trials, rng):
+    # Fraction of simulated trials that are reinforced, peck by peck: RR
+    # rolls a die per peck, VR draws a requirement per trial, etc.
+    reinforced = 0
+    for _ in range(trials):
+        if isinstance(schedule, RandomRatio):
+            met = any(rng.randrange(schedule.ratio) == 0 for _ in range(pecks))
+        elif isinstance(schedule, VariableRatio):
+            met = pecks >= rng.choice(range(schedule.low, schedule.high + 1))
+        elif isinstance(schedule, FixedRatio):
+            met = pecks >= schedule.ratio
+        else:
+            met = rng.random() < schedule.p
+        reinforced += met if schedule.contingency == "INS" else not met
+    return reinforced / trials
+
+
+def check_schedules(schedules, pecks_list, trials=20000, seed=0):
+    # [(schedule, pecks, exact p, outcome() rate, simulated rate, ok), ...]
+    # ok: both rates within 4 standard errors of the exact probability
+    rng = Random(seed)
+    rows = []
+    for schedule in schedules:
+        for pecks in pecks_list:
+            p = schedule.probability(pecks)
+            from_outcome = sum(schedule.outcome(pecks, rng) for _ in range(trials)) / trials
+            simulated = simulate(schedule, pecks, trials, rng)
+            tolerance = 4 * (p * (1 - p) / trials) ** 0.5 + 1e-9
+            rows.append((schedule, pecks, p, from_outcome, simulated,
+                         abs(from_outcome - p) <= tolerance and abs(simulated - p) <= tolerance))
+    return rows
+
+
+def main():
+    parser = ArgumentParser(description="Check P003 reinforcement schedules against peck-by-peck simulation")
+    parser.add_argument("--trials", type=int, default=20000, help="simulated trials per schedule and peck count")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--tables", default=None, help="write the exact probability tables of every schedule in use to this .csv")
+    parser.add_argument("--data", nargs="+", default=None, help="session data .csv files to check expected vs. observed reinforcers")
+    parser.add_argument("--kind", default="RR", choices=["RR", "VR"], help="ratio schedule of the INS/OMS trial codes in --data")
+    parser.add_argument("--ratio", type=int, default=None, help="ratio of plain INS/OMS codes in --data (e.g., 20 for P003g)")
+    parser.add_argument("--count-background", action="store_true", help="background pecks count toward the requirement (P003Fc)")
+    args = parser.parse_args()
+
+    if args.tables:
+        write_tables(args.tables, schedules_in_use())
+        print(f"- Probability tables written to {args.tables}")
+        return
+    if args.data:
+        def schedule_of(trial_code):
+            # P003B.ii/iii codes are Pavlovian percentages (e.g., "35.3")
+            try:
+                return Pavlovian(float(trial_code) / 100)
+            except ValueError:
+                return schedule_for_code(trial_code, args.kind, args.ratio)
+        tally = ReinforcementTally()
+        for csv_path in args.data:
+            tally_session(csv_path, schedule_of, args.count_background, tally)
+        print(tally.summary())
+        return
+
+    schedules = [ratio_schedule(kind, ratio, contingency)
+                 for kind in ("RR", "VR", "FR") for ratio in (2, 5, 20, 50)
+                 for contingency in CONTINGENCIES]
+    schedules += [Pavlovian(p) for p in (1.0, 0.353, 0.125, 0.011)] + [Extinction(), Yoked(0.42)]
+    rows = check_schedules(schedules, (0, 1, 3, 10, 40), args.trials, args.seed)
+    print(f"{'Schedule':>14} | {'Pecks':>5} | {'Exact':>6} | {'outcome()':>9} | {'Simulated':>9}")
+    for schedule, pecks, p, from_outcome, simulated, ok in rows:
+        print(f"{repr(schedule):>14} | {pecks:>5} | {p:6.3f} | {from_outcome:9.3f} | "
+              f"{simulated:9.3f} {'' if ok else '  <-- MISMATCH'}")
+    failures = sum(not row[-1] for row in rows)
+    print(f"\n{len(rows) - failures}/{len(rows)} schedule checks agree with simulation")
+    raise SystemExit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
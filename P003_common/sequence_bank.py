@@ -0,0 +1,222 @@
+# -*- coding: utf-8 -*-
+"""
+Pre-generated banks of valid trial orders for the P003 programs.
+
+Drawing an order at the spacebar (constrained_order / balanced_order) is
+fast, but it still happens live and nobody can look at the order a bird is
+going to get before the session. A bank holds many orders per experiment
+configuration, all generated and checked in advance, each with its quality
+metrics (longest run, transition chi-square and largest deviation; see
+sequences.py). At session start, MainScreen picks one at random in O(1) and
+logs its SequenceID in every data row, so any session's order can be looked
+up (or regenerated: sequence i of a bank built with seed s always comes
+from Random(f"{name}-{s}-{i}")).
+
+Banks are stored as one .json per configuration in sequence_banks/. Each
+order is packed as a base-k number (k = number of trial types) in base64,
+so a 180-trial order takes ~50 characters. If a program's trial list does
+not match its bank (e.g., max_trials was changed), the order is generated
+live as before and logged with SequenceID "NA".
+
+Build or rebuild banks from the terminal, e.g.:
+
+    python -m P003_common.sequence_bank P003e P003f --size 1000 --workers 4
+    python -m P003_common.sequence_bank --summary
+"""
+from argparse import ArgumentParser
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date
+from json import dump, load
+from os import makedirs, path as os_path
+from random import Random
+
+from P003_common.sequences import (balanced_order, constrained_order,
+                                   run_lengths, TransitionBalance)
+
+BANK_FOLDER = os_path.join(os_path.dirname(os_path.abspath(__file__)), "sequence_banks")
+BANK_COLUMNS = ["Order", "LongestRun", "ChiSquare", "MaxDeviation"] # SequenceID = row index
+
+_FR_CODES = ["2", "5", "20", "50"]
+
+# Trial list and ordering rules of each configuration, matching what the
+# programs build in first_ITI. blocks = None: constrained_order();
+# otherwise balanced_order() with that many blocks. group_by = "prefix":
+# the run limit applies to the part of the code before "_" (P003f).
+BANK_CONFIGS = {
+    "P003e": dict(trial_types = ["PAV", "INS", "OMS"] * 60,
+                  blocks = None, group_by = None),
+    "P003f": dict(trial_types = ["INS_2", "INS_5", "INS_20",
+                                 "OMS_2", "OMS_5", "OMS_20",
+                                 "PAV", "EXT"] * 20,
+                  blocks = 4, group_by = "prefix"),
+    "P003Fc_INS": dict(trial_types = [f"INS_{fr}" for fr in _FR_CODES] * 20,
+                       blocks = 4, group_by = None),
+    "P003Fc_OMS": dict(trial_types = [f"OMS_{fr}" for fr in _FR_CODES] * 20,
+                       blocks = 4, group_by = None),
+    # Peach and Itzamna also get 20 INSFR_2 trials
+    "P003Fc_INS+FR2": dict(trial_types = [f"INS_{fr}" for fr in _FR_CODES] * 20 + ["INSFR_2"] * 20,
+                           blocks = 4, group_by = None),
+    "P003Fc_OMS+FR2": dict(trial_types = [f"OMS_{fr}" for fr in _FR_CODES] * 20 + ["INSFR_2"] * 20,
+                           blocks = 4, group_by = None),
+    "P003B.ii": dict(trial_types = ["100", "35.3", "12.5", "4.4", "1.1", "0.6"] * 9,
+                     blocks = None, group_by = None),
+}
+MAX_RUN = 3
+
+
+def _prefix(code):
+    return code.split("_")[0]
+
+
+def generate_order(config, trial_types, rng):
+    # Draws one order of trial_types with a configuration's ordering rules
+    key = _prefix if config["group_by"] == "prefix" else None
+    if config["blocks"] is None:
+        return constrained_order(trial_types, MAX_RUN, rng, key)
+    order, _, _ = balanced_order(trial_types, config["blocks"], MAX_RUN, rng, key)
+    return order
+
+
+def encode_order(order, types):
+    # Order -> base64 of its base-k digits (first trial = most significant)
+    number = 0
+    for trial_type in order:
+        number = number * len(types) + types.index(trial_type)
+    packed = number.to_bytes(max(1, (number.bit_length() + 7) // 8), "big")
+    return urlsafe_b64encode(packed).decode("ascii").rstrip("=")
+
+
+def decode_order(text, types, length):
+    number = int.from_bytes(urlsafe_b64decode(text + "=" * (-len(text) % 4)), "big")
+    order = []
+    for _ in range(length):
+        number, digit = divmod(number, len(types))
+        order.append(types[digit])
+    order.reverse()
+    return order
+
+
+class SequenceBank(object):
+    def __init__(self, name, types, counts, group_by, blocks, build_seed, sequences, created=None):
+        self.name = name
+        self.types = types # trial types, in the order used by the encoding
+        self.counts = counts # number of trials of each type
+        self.group_by = group_by
+        self.blocks = blocks
+        self.build_seed = build_seed
+        self.sequences = sequences # rows of BANK_COLUMNS
+        self.created = created or str(date.today())
+        self.length = sum(counts)
+
+    @classmethod
+    def load(cls, name, folder=BANK_FOLDER):
+        # Returns None if there is no bank for this configuration
+        file_loc = os_path.join(folder, f"{name}.json")
+        if not os_path.exists(file_loc):
+            return None
+        with open(file_loc, 'r') as f:
+            saved = load(f)
+        return cls(saved["name"], saved["types"], saved["counts"], saved["group_by"],
+                   saved["blocks"], saved["build_seed"], saved["sequences"], saved["created"])
+
+    def save(self, folder=BANK_FOLDER):
+        makedirs(folder, exist_ok=True)
+        file_loc = os_path.join(folder, f"{self.name}.json")
+        with open(file_loc, 'w') as f:
+            dump({"name": self.name, "types": self.types, "counts": self.counts,
+                  "max_run": MAX_RUN, "group_by": self.group_by, "blocks": self.blocks,
+                  "build_seed": self.build_seed, "created": self.created,
+                  "columns": BANK_COLUMNS, "sequences": self.sequences}, f)
+        return file_loc
+
+    def matches(self, trial_types):
+        # True if the bank's orders are orders of exactly these trials
+        return (len(trial_types) == self.length and
+                all(trial_types.count(t) == n for t, n in zip(self.types, self.counts)))
+
+    def sequence_ID(self, index):
+        return f"{self.name}-{self.build_seed}-{index:05d}"
+
+    def order(self, index):
+        # Decodes (and re-checks) one stored order
+        order = decode_order(self.sequences[index][0], self.types, self.length)
+        key = _prefix if self.group_by == "prefix" else None
+        if not self.matches(order) or max(n for _, n in run_lengths(order, key)) > MAX_RUN:
+            raise ValueError(f"{self.sequence_ID(index)} is not a valid order")
+        return order
+
+    def pick(self, rng):
+        # (SequenceID, order) of a randomly chosen stored order
+        index = rng.randrange(len(self.sequences))
+        return self.sequence_ID(index), self.order(index)
+
+    def summary(self):
+        chi_square = sorted(row[2] for row in self.sequences)
+        deviation = sorted(row[3] for row in self.sequences)
+        return (f"{self.name:>16}: {len(self.sequences)} orders of {self.length} trials | "
+                f"chi-square median {chi_square[len(chi_square) // 2]:.1f}, max {chi_square[-1]:.1f} | "
+                f"max deviation median {deviation[len(deviation) // 2]:.1f}, max {deviation[-1]:.1f}")
+
+
+def banked_order(name, trial_types, rng, folder=BANK_FOLDER):
+    # Called from first_ITI: returns (order, SequenceID) from the bank, or a
+    # freshly generated order and "NA" if the bank is missing/doesn't match
+    bank = SequenceBank.load(name, folder)
+    if bank is not None and bank.matches(trial_types):
+        sequence_ID, order = bank.pick(rng)
+        print(f"Trial order: {sequence_ID} from the {name} sequence bank")
+        return order, sequence_ID
+    print(f"Trial order: no matching {name} sequence bank, generating one now")
+    return generate_order(BANK_CONFIGS[name], trial_types, rng), "NA"
+
+
+def _bank_row(job):
+    name, build_seed, index = job
+    config = BANK_CONFIGS[name]
+    types = list(dict.fromkeys(config["trial_types"]))
+    order = generate_order(config, config["trial_types"], Random(f"{name}-{build_seed}-{index}"))
+    balance = TransitionBalance(order)
+    key = _prefix if config["group_by"] == "prefix" else None
+    return [encode_order(order, types),
+            max(n for _, n in run_lengths(order, key)),
+            round(balance.chi_square, 2), round(balance.max_deviation, 2)]
+
+
+def build_bank(name, size=1000, build_seed=1, workers=None):
+    config = BANK_CONFIGS[name]
+    types = list(dict.fromkeys(config["trial_types"]))
+    counts = [config["trial_types"].count(t) for t in types]
+    jobs = [(name, build_seed, i) for i in range(size)]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        sequences = list(pool.map(_bank_row, jobs, chunksize=25))
+    bank = SequenceBank(name, types, counts, config["group_by"], config["blocks"],
+                        build_seed, sequences)
+    for i in range(size): # every stored order must decode back to a valid order
+        bank.order(i)
+    return bank
+
+
+def main():
+    parser = ArgumentParser(description="Build banks of valid P003 trial orders")
+    parser.add_argument("configs", nargs="*", help=f"configurations to build (default: all of {', '.join(BANK_CONFIGS)})")
+    parser.add_argument("--size", type=int, default=1000, help="orders per bank")
+    parser.add_argument("--seed", type=int, default=1, help="build seed (part of every SequenceID)")
+    parser.add_argument("--workers", type=int, default=None, help="parallel processes (default: all cores)")
+    parser.add_argument("--folder", default=BANK_FOLDER, help="where the banks are stored")
+    parser.add_argument("--summary", action="store_true", help="only print the quality of existing banks")
+    args = parser.parse_args()
+
+    for name in args.configs or BANK_CONFIGS:
+        if args.summary:
+            bank = SequenceBank.load(name, args.folder)
+            print(bank.summary() if bank else f"{name:>16}: no bank")
+            continue
+        bank = build_bank(name, args.size, args.seed, args.workers)
+        file_loc = bank.save(args.folder)
+        print(bank.summary())
+        print(f"{'':>18}written to {file_loc}")
+
+
+if __name__ == '__main__':
+    main()
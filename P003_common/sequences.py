@@ -0,0 +1,425 @@
+# -*- coding: utf-8 -*-
+"""
+Trial-order generation for the P003 programs.
+
+constrained_order
+    Every program orders its trials so that no trial type appears more than
+    three times in a row. Shuffling the whole list and starting over when a
+    run is too long works, but the number of retries grows quickly with
+    session length and with unequal type counts (and it can never tell an
+    impossible request from an unlucky one).
+
+    Instead, valid orders are counted exactly and one is drawn with equal
+    probability. A valid order is a series of runs (1 to max_run trials of
+    one type) where neighbouring runs differ in type, so it is drawn in
+    three steps, each weighted by exact (integer) counts of valid orders:
+        1) how many runs each trial type is split into
+        2) the order of those runs (no two runs of one type side by side),
+           built by inserting one trial type at a time
+        3) how many trials go in each run
+    Everything is a short sum over trial/run counts, so drawing a 180-trial
+    order takes milliseconds rather than a variable number of reshuffles,
+    and impossible requests fail straight away (InfeasibleOrderError).
+
+    With key=..., the run limit applies to groups of trial types (e.g.,
+    P003f's INS_2/INS_5/INS_20 all count as "INS"). The group order is drawn
+    as above and each group's trial types are then shuffled over that
+    group's positions, which is still uniform over all valid orders.
+
+next_block / balanced_order / TransitionBalance
+    Analyses also care about which trial type follows which (e.g., OMS_50
+    after INS_2), and a uniformly drawn order leaves those transition
+    counts to chance. balanced_order() splits the session into blocks with
+    the same mix of trial types, draws each block with next_block() (i.e.,
+    constrained_order(), with the run limit also holding across the block
+    boundary), and then swaps trials within blocks whenever that brings the
+    first-order transition counts closer to their expected values
+    (count(A) * count(B) / total; one fewer B for A -> A). Each swap only
+    changes up to four transitions, so a few thousand swaps take a fraction
+    of a second.
+    TransitionBalance reports how close an order came (chi-square and the
+    largest deviation from the expected counts), before and after.
+"""
+from csv import writer, QUOTE_MINIMAL
+from math import comb
+from random import Random
+
+
+class InfeasibleOrderError(ValueError):
+    # Raised when no order can satisfy the run-length limit
+    pass
+
+
+def constrained_order(trial_types, max_run=3, rng=None, key=None):
+    # Returns a new list with the same trial types as trial_types, in a
+    # uniformly random order where no more than max_run trials in a row
+    # have the same type (or the same key(type), if key is given).
+    if rng is None:
+        rng = Random()
+    trial_types = list(trial_types)
+    if not trial_types:
+        return []
+    if key is None:
+        return _sample_order(trial_types, max_run, rng)
+
+    # Draw the order of the groups, then fill each group's positions
+    groups = {}
+    for trial_type in trial_types:
+        groups.setdefault(key(trial_type), []).append(trial_type)
+    group_order = _sample_order([key(t) for t in trial_types], max_run, rng)
+    for members in groups.values():
+        rng.shuffle(members)
+    return [groups[group].pop() for group in group_order]
+
+
+def check_feasible(counts, max_run):
+    # A valid order exists as long as the most common type can be split
+    # into runs of max_run, with at least one other trial between runs
+    if max_run < 1:
+        raise InfeasibleOrderError("max_run must be at least 1")
+    total = sum(counts.values())
+    for trial_type, n in counts.items():
+        if n > max_run * (total - n + 1):
+            raise InfeasibleOrderError(
+                f"{n} x {trial_type!r} cannot be split into runs of at most "
+                f"{max_run} with only {total - n} other trials")
+
+
+def count_orders(counts, max_run=3):
+    # Number of valid orders of {type: count} (trials of one type are
+    # interchangeable), e.g. for reporting how constrained a design is
+    check_feasible(counts, max_run)
+    n = [count for count in counts.values() if count > 0]
+    tables = _CountTables(max(n, default=0), max_run)
+    total = [1]
+    for count in n:
+        total = _binomial_convolve(total, tables.blocks(count))
+    return sum(total)
+
+
+def run_lengths(order, key=None):
+    # [(type, length), ...] of the runs in an order
+    runs = []
+    for trial_type in order:
+        group = key(trial_type) if key else trial_type
+        if runs and runs[-1][0] == group:
+            runs[-1][1] += 1
+        else:
+            runs.append([group, 1])
+    return [tuple(run) for run in runs]
+
+
+def balanced_order(trial_types, blocks=1, max_run=3, rng=None, key=None, swaps=None):
+    # Returns (order, TransitionBalance of the order, TransitionBalance of
+    # the unbalanced starting order). The run limit applies to key(type)
+    # as in constrained_order; transitions are counted between the trial
+    # types themselves.
+    if rng is None:
+        rng = Random()
+    trial_types = list(trial_types)
+    if not trial_types:
+        return [], TransitionBalance([]), TransitionBalance([])
+    group_of = key or (lambda trial_type: trial_type)
+
+    # 1) Each block gets an equal share of every trial type (leftovers go
+    # to randomly chosen blocks)
+    blocks = max(1, min(blocks, len(trial_types)))
+    block_contents = [[] for _ in range(blocks)]
+    counts = {}
+    for trial_type in trial_types:
+        counts[trial_type] = counts.get(trial_type, 0) + 1
+    for trial_type, n in counts.items():
+        extra_blocks = set(rng.sample(range(blocks), n % blocks))
+        for b in range(blocks):
+            block_contents[b].extend([trial_type] * (n // blocks + (b in extra_blocks)))
+
+    # 2) Draw each block, redrawing it if it would continue the previous
+    # block's last run past max_run
+    order = []
+    block_starts = []
+    for contents in block_contents:
+        block = next_block(contents, order, max_run, rng, key)
+        block_starts.append(len(order))
+        order.extend(block)
+    start_balance = TransitionBalance(order)
+
+    # 3) Swap pairs of trials within a block, keeping any swap that does not
+    # increase the squared distance from the expected transition counts
+    expected = start_balance.expected
+    observed = dict(start_balance.observed)
+    last = len(order) - 1
+    if swaps is None:
+        swaps = 25 * len(order)
+    bounds = list(zip(block_starts, block_starts[1:] + [len(order)]))
+    for _ in range(swaps):
+        start, end = rng.choice(bounds)
+        if end - start < 2:
+            continue
+        i, j = sorted(rng.sample(range(start, end), 2))
+        if order[i] == order[j]:
+            continue
+        touched = {p for p in (i - 1, i, j - 1, j) if 0 <= p < last}
+        before = [(order[p], order[p + 1]) for p in touched]
+        order[i], order[j] = order[j], order[i]
+        after = [(order[p], order[p + 1]) for p in touched]
+
+        change = {}
+        for pair in before:
+            change[pair] = change.get(pair, 0) - 1
+        for pair in after:
+            change[pair] = change.get(pair, 0) + 1
+        cost_change = sum((observed.get(pair, 0) + d - expected[pair]) ** 2 -
+                          (observed.get(pair, 0) - expected[pair]) ** 2
+                          for pair, d in change.items())
+        if cost_change <= 0 and _run_at(order, i, group_of) <= max_run \
+                and _run_at(order, j, group_of) <= max_run:
+            for pair, d in change.items():
+                observed[pair] = observed.get(pair, 0) + d
+        else:
+            order[i], order[j] = order[j], order[i] # undo
+    return order, TransitionBalance(order), start_balance
+
+
+def next_block(trial_types, previous, max_run=3, rng=None, key=None, attempts=1000):
+    # constrained_order() of one block that can follow the trials in
+    # previous without a run longer than max_run across the boundary. Blocks
+    # that would are redrawn, so the block is still uniform over all valid
+    # blocks that join.
+    if rng is None:
+        rng = Random()
+    group_of = key or (lambda trial_type: trial_type)
+    tail = list(previous[-max_run:])
+    for _ in range(attempts):
+        block = constrained_order(trial_types, max_run, rng, key)
+        if not tail or _longest_run(tail + block[:max_run], group_of) <= max_run:
+            return block
+    raise InfeasibleOrderError("could not join blocks without a run longer "
+                               f"than {max_run}; try larger blocks")
+
+
+class TransitionBalance(object):
+    # First-order transition counts of an order vs. their expected values
+    def __init__(self, order):
+        self.types = list(dict.fromkeys(order)) # in order of first appearance
+        self.observed = {} # (from type, to type) -> count
+        for pair in zip(order, order[1:]):
+            self.observed[pair] = self.observed.get(pair, 0) + 1
+        counts = {t: order.count(t) for t in self.types}
+        total = len(order)
+        self.expected = {(a, b): counts[a] * (counts[b] - (a == b)) / total
+                         for a in self.types for b in self.types}
+        deviations = [self.observed.get(pair, 0) - e for pair, e in self.expected.items()]
+        self.max_deviation = max((abs(d) for d in deviations), default=0)
+        self.chi_square = sum((self.observed.get(pair, 0) - e) ** 2 / e
+                              for pair, e in self.expected.items() if e > 0)
+
+    def summary(self):
+        return (f"Transition balance ({len(self.types)} trial types): "
+                f"chi-square {self.chi_square:.1f} | "
+                f"max deviation {self.max_deviation:.1f} transitions")
+
+    def write_matrix(self, file_loc):
+        # Observed and expected count of every ordered pair of trial types
+        with open(file_loc, 'w', newline='') as myFile:
+            w = writer(myFile, quoting=QUOTE_MINIMAL)
+            w.writerow(["FromType", "ToType", "Observed", "Expected"])
+            for (a, b), e in self.expected.items():
+                w.writerow([a, b, self.observed.get((a, b), 0), round(e, 2)])
+
+
+def _run_at(order, position, group_of):
+    # Length of the run (by group) that includes order[position]
+    group = group_of(order[position])
+    start = position
+    while start > 0 and group_of(order[start - 1]) == group:
+        start -= 1
+    end = position
+    while end < len(order) - 1 and group_of(order[end + 1]) == group:
+        end += 1
+    return end - start + 1
+
+
+def _longest_run(order, group_of):
+    return max((length for _, length in run_lengths(order, group_of)), default=0)
+
+
+#%% Counting
+# Orders are counted by inclusion-exclusion over runs: if neighbouring runs
+# of the same type are allowed, runs of one type can be glued into "blocks"
+# and the blocks of all types are freely arranged (a multinomial). Summing
+# with alternating signs over the ways of gluing removes every arrangement
+# with two same-type runs side by side. The sums separate by trial type,
+# which is what makes them cheap.
+
+class _CountTables(object):
+    def __init__(self, max_count, max_run):
+        self.max_run = max_run
+        # compositions[n][r]: ways to split n trials into r runs of 1..max_run
+        self.compositions = [[0] * (max_count + 1) for _ in range(max_count + 1)]
+        self.compositions[0][0] = 1
+        for n in range(1, max_count + 1):
+            for r in range(1, n + 1):
+                self.compositions[n][r] = sum(self.compositions[n - s][r - 1]
+                                              for s in range(1, min(max_run, n) + 1))
+        self._blocks = {}
+
+    def runs_allowed(self, n):
+        # Possible numbers of runs for n trials
+        return range(-(-n // self.max_run), n + 1)
+
+    def blocks(self, n):
+        # Signed count of ways to split n trials into j blocks of glued runs,
+        # for j = 0..n (index = j)
+        if n not in self._blocks:
+            self._blocks[n] = [sum(self.compositions[n][r] * _glue_sign(r, j)
+                                   for r in self.runs_allowed(n))
+                               for j in range(n + 1)]
+        return self._blocks[n]
+
+
+def _glue_sign(r, j):
+    # Signed number of ways to glue r runs (in order) into j blocks
+    if r == 0 or j == 0 or j > r:
+        return 1 if r == j else 0
+    return (-1) ** (r - j) * comb(r - 1, j - 1)
+
+
+def _binomial_convolve(x, y):
+    # Combines block counts of two sets of trial types: z[J] sums over
+    # x[J1] * y[j] * (ways to interleave J1 and j blocks)
+    z = [0] * (len(x) + len(y) - 1)
+    for J1, x_ways in enumerate(x):
+        if x_ways:
+            for j, y_ways in enumerate(y):
+                if y_ways:
+                    z[J1 + j] += x_ways * y_ways * comb(J1 + j, j)
+    return z
+
+
+def _weighted_choice(options, rng):
+    # options: [(integer weight, value), ...]; exact, for any size of weight
+    pick = rng.randrange(sum(weight for weight, _ in options))
+    for weight, value in options:
+        if pick < weight:
+            return value
+        pick -= weight
+
+
+#%% Sampling
+
+def _sample_order(trial_types, max_run, rng):
+    counts = {}
+    for trial_type in trial_types:
+        counts[trial_type] = counts.get(trial_type, 0) + 1
+    check_feasible(counts, max_run)
+    types = list(counts)
+    n = [counts[t] for t in types]
+    tables = _CountTables(max(n), max_run)
+
+    runs_per_type = _sample_run_counts(n, tables, rng)
+    run_types = _sample_run_order(runs_per_type, rng)
+    lengths = [_sample_composition(n[i], runs_per_type[i], tables, rng)
+               for i in range(len(types))]
+    order = []
+    for i in run_types:
+        order.extend([types[i]] * lengths[i].pop())
+    return order
+
+
+def _sample_run_counts(n, tables, rng):
+    # Step 1: number of runs of each type, one type at a time, each weighted
+    # by the number of valid orders it leaves for the remaining types
+    suffixes = [[1]] # suffixes[-1 - i]: block counts of types i+1.. (unfixed)
+    for count in reversed(n[1:]):
+        suffixes.append(_binomial_convolve(suffixes[-1], tables.blocks(count)))
+    suffixes.reverse()
+
+    fixed = [1] # block counts of the types whose run numbers are drawn
+    runs_per_type = []
+    for i, count in enumerate(n):
+        others = _binomial_convolve(fixed, suffixes[i])
+        # Ways to arrange the others' blocks with j blocks of this type
+        with_j_blocks = [sum(ways * comb(j + J, j) for J, ways in enumerate(others))
+                         for j in range(count + 1)]
+        options = []
+        for r in tables.runs_allowed(count):
+            weight = tables.compositions[count][r] * sum(
+                _glue_sign(r, j) * with_j_blocks[j] for j in range(1, r + 1))
+            if weight > 0:
+                options.append((weight, r))
+        r = _weighted_choice(options, rng)
+        runs_per_type.append(r)
+        fixed = _binomial_convolve(fixed, [_glue_sign(r, j) for j in range(r + 1)])
+    return runs_per_type
+
+
+def _sample_run_order(runs_per_type, rng):
+    # Step 2: a uniformly random order of the runs with no two runs of the
+    # same type side by side. Types are inserted one at a time (most runs
+    # first); a new type's runs go into the gaps of the current order in
+    # groups, and any two equal neighbours ("bad" gaps) left must be split
+    # by a later type.
+    insert_order = sorted(range(len(runs_per_type)), key=lambda i: -runs_per_type[i])
+    sizes = [runs_per_type[i] for i in insert_order]
+    remaining = [sum(sizes[s + 1:]) for s in range(len(sizes))]
+    completions = {}
+
+    def moves(step, length, bad):
+        # (weight, groups, bad gaps filled, new bad) for inserting this type
+        r = sizes[step]
+        good = length + 1 - bad
+        for groups in range(1, min(r, length + 1) + 1):
+            for filled in range(max(0, groups - good), min(bad, groups) + 1):
+                new_bad = bad - filled + r - groups
+                if new_bad > remaining[step]:
+                    continue # too many equal neighbours left to split
+                weight = comb(r - 1, groups - 1) * comb(bad, filled) * comb(good, groups - filled)
+                yield weight, groups, filled, new_bad
+
+    def ways(step, length, bad):
+        if step == len(sizes):
+            return 1 if bad == 0 else 0
+        state = (step, bad)
+        if state not in completions:
+            completions[state] = sum(weight * ways(step + 1, length + sizes[step], new_bad)
+                                     for weight, _, _, new_bad in moves(step, length, bad))
+        return completions[state]
+
+    order = []
+    bad = 0
+    for step, i in enumerate(insert_order):
+        length = len(order)
+        options = [(weight * ways(step + 1, length + sizes[step], new_bad), (groups, filled))
+                   for weight, groups, filled, new_bad in moves(step, length, bad)]
+        groups, filled = _weighted_choice([o for o in options if o[0] > 0], rng)
+
+        # Which gaps get a group, and how many runs go in each group
+        bad_gaps = [g for g in range(1, length) if order[g - 1] == order[g]]
+        good_gaps = [g for g in range(length + 1) if g not in set(bad_gaps)]
+        gaps = sorted(rng.sample(bad_gaps, filled) + rng.sample(good_gaps, groups - filled))
+        cuts = sorted(rng.sample(range(1, sizes[step]), groups - 1))
+        group_sizes = [b - a for a, b in zip([0] + cuts, cuts + [sizes[step]])]
+
+        new_order = []
+        previous = 0
+        for gap, size in zip(gaps, group_sizes):
+            new_order.extend(order[previous:gap])
+            new_order.extend([i] * size)
+            previous = gap
+        new_order.extend(order[previous:])
+        order = new_order
+        bad = sum(1 for g in range(1, len(order)) if order[g - 1] == order[g])
+    return order
+
+
+def _sample_composition(n, r, tables, rng):
+    # Step 3: uniformly random lengths (1..max_run) of r runs totalling n
+    lengths = []
+    for runs_left in range(r, 0, -1):
+        options = [(tables.compositions[n - s][runs_left - 1], s)
+                   for s in range(1, min(tables.max_run, n) + 1)
+                   if tables.compositions[n - s][runs_left - 1]]
+        s = _weighted_choice(options, rng)
+        lengths.append(s)
+        n -= s
+    return lengths
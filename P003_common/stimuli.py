@@ -0,0 +1,334 @@
+# -*- coding: utf-8 -*-
+"""
+On-disk cache of pre-resized stimulus images for the P003 programs.
+
+P003Fb, P003Fc, P003B.ii, P003B.iii and P003g open every stimulus PNG
+(400-1280 px) at the spacebar and LANCZOS-resize it down to the 192 px
+key, which takes a noticeable moment on the Pi before the first ITI. The
+cache keeps each resized image as a small PNG, named after the source
+file's content hash, the key size and the color mode:
+
+    stimulus_cache/<sha1 of the source>_192x192_RGBA.png
+
+so a cached image is only rebuilt when the source file itself changes (or
+a program asks for another size/mode). Hashing a source means reading it,
+so the hash of each source is kept in stimulus_cache/index.json along with
+the file's size and mtime, and only recomputed when those change.
+
+In the programs, load_stimulus() replaces Image.open(...).resize(...):
+
+    pil_img = load_stimulus(img_path, (KEY_PIXELS, KEY_PIXELS), "RGBA")
+    self.stimulus_images[tt] = ImageTk.PhotoImage(pil_img)
+
+and returns the same pixels the live resize would. If the cache folder
+cannot be written (e.g., a read-only copy of the repo), the image is
+resized live as before.
+
+key_frame() then composites a stimulus into the whole key graphic (black
+outline disc, stimulus, fine inner outline, midpoint dot) as one RGBA
+image, transparent outside the key. Each trial shows a single Tk image
+item instead of layering four canvas items over each other, e.g.:
+
+    self.stimulus_pil_images[tt] = key_frame(pil_img) # prepare_session
+
+Each experiment's cached images are also packed into one atlas PNG, with
+the offset of every image (by cache file name) in a text chunk of the same
+file:
+
+    stimulus_cache/<experiment>_192x192_atlas.png
+
+load_stimulus() looks in the atlas of the source's experiment first. The
+atlas is read with one sequential read and decoded once per process, and
+each stimulus is cropped out of it when it is asked for, instead of
+opening one small PNG per stimulus on the SD card. A source that changed
+after the atlas was built is simply not in it, and comes from its own
+cache file (or a live resize) as before.
+
+Prewarm the cache and rebuild the atlases for every stimulus of every
+experiment (which covers all subjects' assignments), e.g. after copying new
+PNGs onto a Pi:
+
+    python -m P003_common.stimuli
+    python -m P003_common.stimuli P003g --clean
+"""
+from argparse import ArgumentParser
+from glob import glob
+from hashlib import sha1
+from io import BytesIO
+from json import dump, dumps, load, loads
+from math import ceil, sqrt
+from os import listdir, makedirs, remove, replace, stat, path as os_path
+
+from PIL import Image, ImageDraw
+from PIL.PngImagePlugin import PngInfo
+
+CACHE_FOLDER = os_path.join(os_path.dirname(os_path.abspath(__file__)), "stimulus_cache")
+INDEX_FILE = "index.json"
+KEY_PIXELS = 192
+
+_P003_FOLDER = os_path.dirname(os_path.dirname(os_path.abspath(__file__)))
+# Stimulus folders and color mode of every experiment that shows images
+# (mode None: the source's own mode, as P003g does not convert its PNGs)
+EXPERIMENTS = {
+    "P003Fb": (["stimuli"], "RGBA"),
+    "P003Fc": (["stimuli"], "RGBA"),
+    "P003B.ii": (["stimuli"], "RGBA"),
+    "P003B.iii": (["stimuli"], "RGBA"),
+    "P003g": (["stimuli", "stimuli (master phase)"], None),
+    }
+
+ATLAS_TEXT_KEY = "P003 atlas" # PNG text chunk holding an atlas' offset index
+# Modes an image keeps exactly through the atlas' RGBA (others are not packed)
+ATLAS_MODES = ("RGBA", "RGB", "L")
+
+_index = None # source path -> {"size", "mtime_ns", "sha1"} (loaded once)
+_atlases = {} # atlas file location -> StimulusAtlas (None: no usable atlas)
+
+
+def _load_index():
+    global _index
+    if _index is None:
+        try:
+            with open(os_path.join(CACHE_FOLDER, INDEX_FILE), 'r') as f:
+                _index = load(f)
+        except (OSError, ValueError):
+            _index = {}
+    return _index
+
+
+def _save_index():
+    temp_loc = os_path.join(CACHE_FOLDER, INDEX_FILE + ".tmp")
+    with open(temp_loc, 'w') as f:
+        dump(_index, f, indent=1)
+    replace(temp_loc, os_path.join(CACHE_FOLDER, INDEX_FILE))
+
+
+def source_hash(src_path):
+    # sha1 of a source file's content, re-hashed only when its size or
+    # mtime changed since it was last seen
+    src_path = os_path.abspath(src_path)
+    info = stat(src_path)
+    index = _load_index()
+    known = index.get(src_path)
+    if known and known["size"] == info.st_size and known["mtime_ns"] == info.st_mtime_ns:
+        return known["sha1"]
+    with open(src_path, 'rb') as f:
+        digest = sha1(f.read()).hexdigest()
+    index[src_path] = {"size": info.st_size, "mtime_ns": info.st_mtime_ns, "sha1": digest}
+    try:
+        makedirs(CACHE_FOLDER, exist_ok=True)
+        _save_index()
+    except OSError:
+        pass # read-only: the hash is still remembered for this session
+    return digest
+
+
+def cache_file_loc(src_path, size, mode):
+    width, height = size
+    return os_path.join(CACHE_FOLDER,
+                        f"{source_hash(src_path)}_{width}x{height}_{mode or 'source'}.png")
+
+
+def resize_stimulus(src_path, size, mode):
+    # What the programs used to do at every session start
+    image = Image.open(src_path)
+    if mode is not None:
+        image = image.convert(mode)
+    return image.resize(size, Image.LANCZOS)
+
+
+def atlas_file_loc(experiment, size):
+    width, height = size
+    return os_path.join(CACHE_FOLDER, f"{experiment}_{width}x{height}_atlas.png")
+
+
+class StimulusAtlas(object):
+    # One experiment's cached stimuli packed into a single image. The file is
+    # read at once; its pixels are decoded on the first crop and kept
+    def __init__(self, atlas_loc):
+        with open(atlas_loc, 'rb') as f:
+            self._image = Image.open(BytesIO(f.read()))
+        # cache file name -> [x, y, width, height, mode]
+        self.offsets = loads(self._image.info[ATLAS_TEXT_KEY])
+        self._decoded = False
+
+    def crop(self, name):
+        # PIL image of a packed cache entry, or None if it is not packed
+        if name not in self.offsets:
+            return None
+        if not self._decoded:
+            self._image.load()
+            self._decoded = True
+        x, y, width, height, mode = self.offsets[name]
+        image = self._image.crop((x, y, x + width, y + height))
+        return image if mode == image.mode else image.convert(mode)
+
+
+def source_experiment(src_path):
+    # Experiment whose folder src_path is in (None: not one with stimuli)
+    # (real paths, as the programs may load through a link to the repo)
+    relative = os_path.relpath(os_path.realpath(src_path), os_path.realpath(_P003_FOLDER))
+    experiment = relative.split(os_path.sep)[0]
+    return experiment if experiment in EXPERIMENTS else None
+
+
+def experiment_atlas(experiment, size=(KEY_PIXELS, KEY_PIXELS)):
+    # The experiment's StimulusAtlas (opened once per process), or None if
+    # it was never built or cannot be read
+    atlas_loc = atlas_file_loc(experiment, size)
+    if atlas_loc not in _atlases:
+        try:
+            _atlases[atlas_loc] = StimulusAtlas(atlas_loc)
+        except (OSError, KeyError, ValueError):
+            _atlases[atlas_loc] = None
+    return _atlases[atlas_loc]
+
+
+def load_stimulus(src_path, size=(KEY_PIXELS, KEY_PIXELS), mode="RGBA"):
+    # PIL image of src_path resized to size (and converted to mode, unless
+    # None), from the experiment's atlas or the cache if it is there; builds
+    # the cache entry if not
+    size = tuple(size)
+    cache_loc = cache_file_loc(src_path, size, mode)
+    experiment = source_experiment(src_path)
+    atlas = experiment_atlas(experiment, size) if experiment else None
+    if atlas is not None:
+        image = atlas.crop(os_path.basename(cache_loc))
+        if image is not None:
+            return image
+    if os_path.exists(cache_loc):
+        with Image.open(cache_loc) as cached:
+            cached.load()
+            return cached.copy()
+    image = resize_stimulus(src_path, size, mode)
+    try:
+        makedirs(CACHE_FOLDER, exist_ok=True)
+        temp_loc = cache_loc + ".tmp"
+        image.save(temp_loc, format="PNG", compress_level=1)
+        replace(temp_loc, cache_loc)
+    except OSError as error:
+        print(f"Stimulus cache not written ({error}); resized {os_path.basename(src_path)} live")
+    return image
+
+
+def key_frame(stimulus, key_pixels=KEY_PIXELS, outline_size=20, midpoint_diameter=10,
+              inner_outline=True):
+    # RGBA image of the whole key, to be centered on the key's center: the
+    # black disc (key + outline_size px all around), the stimulus (None: no
+    # stimulus) pasted over it, the inner outline and the midpoint. Same
+    # geometry as the canvas items build_scene used to layer for it
+    size = key_pixels + (2 * outline_size)
+    center = size // 2
+    frame = Image.new("RGBA", (size, size), (0, 0, 0, 0))
+    draw = ImageDraw.Draw(frame)
+    draw.ellipse([0, 0, size - 1, size - 1], fill="black", outline="black")
+    if stimulus is not None:
+        frame.alpha_composite(stimulus.convert("RGBA"), (outline_size, outline_size))
+        draw = ImageDraw.Draw(frame)
+    if inner_outline:
+        draw.ellipse([outline_size, outline_size,
+                      outline_size + key_pixels - 1, outline_size + key_pixels - 1],
+                     outline="black")
+    draw.ellipse([center - (midpoint_diameter // 2), center - (midpoint_diameter // 2),
+                  center + (midpoint_diameter // 2), center + (midpoint_diameter // 2)],
+                 fill="black", outline="black")
+    return frame
+
+
+def experiment_stimuli(experiment):
+    # Every PNG an experiment can show, whoever the subject
+    folders, _ = EXPERIMENTS[experiment]
+    files = []
+    for folder in folders:
+        files += sorted(glob(os_path.join(_P003_FOLDER, experiment, folder, "*.png")))
+    return files
+
+
+def prewarm(experiments, size=(KEY_PIXELS, KEY_PIXELS)):
+    # Fills the cache for experiments; returns (built, already cached) counts
+    built, cached = 0, 0
+    for experiment in experiments:
+        _, mode = EXPERIMENTS[experiment]
+        for src_path in experiment_stimuli(experiment):
+            if os_path.exists(cache_file_loc(src_path, size, mode)):
+                cached += 1
+            else:
+                load_stimulus(src_path, size, mode)
+                built += 1
+    return built, cached
+
+
+def build_atlas(experiment, size=(KEY_PIXELS, KEY_PIXELS)):
+    # Packs the experiment's (prewarmed) cache entries into its atlas, in a
+    # near-square grid; returns the number of images packed. Sources with
+    # the same content share one entry
+    _, mode = EXPERIMENTS[experiment]
+    entries = {} # cache file name -> image
+    for src_path in experiment_stimuli(experiment):
+        image = load_stimulus(src_path, size, mode)
+        if image.mode in ATLAS_MODES:
+            entries[os_path.basename(cache_file_loc(src_path, size, mode))] = image
+    width, height = size
+    columns = max(1, ceil(sqrt(len(entries))))
+    rows = max(1, ceil(len(entries) / columns))
+    atlas = Image.new("RGBA", (columns * width, rows * height), (0, 0, 0, 0))
+    offsets = {}
+    for i, (name, image) in enumerate(sorted(entries.items())):
+        x, y = (i % columns) * width, (i // columns) * height
+        atlas.paste(image.convert("RGBA"), (x, y))
+        offsets[name] = [x, y, width, height, image.mode]
+    info = PngInfo()
+    info.add_text(ATLAS_TEXT_KEY, dumps(offsets))
+    atlas_loc = atlas_file_loc(experiment, size)
+    temp_loc = atlas_loc + ".tmp"
+    atlas.save(temp_loc, format="PNG", compress_level=1, pnginfo=info)
+    replace(temp_loc, atlas_loc)
+    _atlases.pop(atlas_loc, None) # reopened when next needed
+    return len(offsets)
+
+
+def clean(size=(KEY_PIXELS, KEY_PIXELS)):
+    # Deletes cached images (and atlases) that no current source of any
+    # experiment maps to
+    keep = {INDEX_FILE}
+    for experiment in EXPERIMENTS:
+        _, mode = EXPERIMENTS[experiment]
+        keep.add(os_path.basename(atlas_file_loc(experiment, size)))
+        keep.update(os_path.basename(cache_file_loc(src_path, size, mode))
+                    for src_path in experiment_stimuli(experiment))
+    removed = 0
+    if os_path.isdir(CACHE_FOLDER):
+        for name in listdir(CACHE_FOLDER):
+            if name not in keep:
+                remove(os_path.join(CACHE_FOLDER, name))
+                removed += 1
+    return removed
+
+
+def main():
+    parser = ArgumentParser(description="Prewarm the pre-resized stimulus cache (and atlases) of the P003 programs")
+    parser.add_argument("experiments", nargs="*",
+                        help=f"experiments to prewarm: {', '.join(EXPERIMENTS)} (default: all)")
+    parser.add_argument("--size", type=int, default=KEY_PIXELS, help="key size in pixels")
+    parser.add_argument("--clean", action="store_true",
+                        help="also delete cached images of sources that changed or are gone "
+                             "(and of other key sizes than --size)")
+    args = parser.parse_args()
+    for experiment in args.experiments:
+        if experiment not in EXPERIMENTS:
+            parser.error(f"no stimuli to cache for {experiment}")
+
+    size = (args.size, args.size)
+    experiments = args.experiments or list(EXPERIMENTS)
+    built, cached = prewarm(experiments, size)
+    print(f"{built} stimuli resized and cached, {cached} already cached ({CACHE_FOLDER})")
+    for experiment in experiments:
+        packed = build_atlas(experiment, size)
+        print(f"{experiment}: {packed} stimuli packed into "
+              f"{os_path.basename(atlas_file_loc(experiment, size))}")
+    if args.clean:
+        print(f"{clean(size)} stale cache files deleted")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,331 @@
+# -*- coding: utf-8 -*-
+"""
+High-peck-rate stress test for the P003 programs' Tk runtime.
+
+Runs a TEST session of a program with real Tk and feeds the canvas
+synthetic <Button-1> touches at fixed rates (5, 20 and 50 Hz by default).
+Touches go through Tk's own event queue (event_generate(..., when="tail")),
+so they are picked, dispatched and logged exactly like a bird's pecks, and
+they wait behind whatever else Tk is busy with.
+
+Every touch is stamped with its generation time (event.time) and matched to
+the data row that write_data() makes for it. For each rate it checks:
+    - dropped pecks: touches on a bound item that never produced a data row
+    - misclassified pecks: logged Event does not match what is under the
+      touch when it was handled (key vs. bkgrd vs. hidden_patch), by the
+      programs' fixed geometry (key and its outline ring, start signal
+      square, P003f's hidden patch rectangles) rather than by the scene's
+      own region lookup, so a wrong region shape shows up here
+    - counter consistency: TargetPeckNum/BackgroundPeckNum (and P003f's
+      hidden patch counter) vs. the rows actually logged for that trial
+    - callback latency: generation -> write_data(), overall and whether it
+      grows over the run (i.e., Tk is falling behind)
+    - achieved touch rate vs. the requested one
+and exits with status 1 if any rate fails.
+
+Needs a display (run it on a box, or under xvfb-run). --headless runs the
+same checks on the virtual-clock runtime instead; latency is then always 0,
+but peck classification and counters are still checked. E.g.:
+
+    python -m P003_common.stress P003f/P003F_ExpProgram_RP.py
+    python -m P003_common.stress P003e/P003E_ExpProgram_RP.py --option exp_phase_name=RR2
+"""
+from argparse import ArgumentParser
+from contextlib import nullcontext, redirect_stdout
+from os import devnull, path as os_path
+from random import Random
+from sys import exit as sys_exit
+from time import monotonic
+from tkinter import Tk, Toplevel
+
+from P003_common.headless import HeadlessSession, load_program, \
+     mainscreen_kwargs, working_directory
+from P003_common.scene import Disc, Rect
+
+# Events that a touch on an item with each tag may legitimately be logged as
+EVENTS_FOR_TAG = {"key": ("key_peck", "start_signal_press"),
+                  "bkgrd": ("background_peck", "ITI_peck"),
+                  "hidden_patch": ("hidden_patch_peck",)}
+KEY_CENTER = (512, 384) # every program's key is a 192 px circle here
+KEY_RADIUS = 96
+KEY_OUTLINE = 20 # the ring around the key also counts as the key
+START_SIGNAL = Rect(416, 288, 608, 480) # start signal square, also on the key's handler
+
+
+class Touch(object):
+    def __init__(self, stamp, x, y, planned, generated, expected_tag):
+        self.stamp = stamp # event.time given to Tk (ms); matches the data row
+        self.x = x
+        self.y = y
+        self.planned = planned # when the driver meant to generate it (s)
+        self.generated = generated # when it was actually generated (s)
+        self.expected_tag = expected_tag # tag under the touch when generated
+        self.handled = None # when write_data() ran for it (s)
+        self.event = None # logged Event
+        self.handled_tag = None # tag under the touch when it was handled
+        # (tags from expected_tag(), not from the program's scene)
+
+
+class _Toplevel(Toplevel):
+    # Keeps the Python callbacks bound to the window, so the session can be
+    # started without a real space bar press
+    def __init__(self, *args, **kwargs):
+        self.python_bindings = {}
+        super().__init__(*args, **kwargs)
+
+    def bind(self, sequence=None, func=None, add=None):
+        if func is not None:
+            self.python_bindings[sequence] = func
+        return super().bind(sequence, func, add)
+
+
+class TkSession(object):
+    # A program's MainScreen on the real Tk mainloop (same interface as the
+    # parts of HeadlessSession used below)
+    def __init__(self, program_path, subject_ID, session_seed=None, **options):
+        self.program = load_program(program_path, headless=False)
+        self.program.Toplevel = _Toplevel
+        self.tk_root = Tk()
+        self.tk_root.withdraw() # only the program's own window is shown
+        self.screen = self.program.MainScreen(
+            **mainscreen_kwargs(self.program, subject_ID, session_seed, **options))
+        self.root = self.screen.root
+        self.canvas = self.screen.mastercanvas
+
+    def clock(self):
+        return monotonic()
+
+    def start(self):
+        self.root.python_bindings["<space>"](None)
+
+    def after(self, ms, func, *args):
+        return self.root.after(ms, func, *args)
+
+    def run_for(self, seconds):
+        self.tk_root.after(int(seconds * 1000), self.tk_root.quit)
+        self.tk_root.mainloop()
+
+    def close(self):
+        if self.root.winfo_exists():
+            self.screen.exit_program("event")
+        self.tk_root.destroy()
+
+
+class _HeadlessStressSession(HeadlessSession):
+    def clock(self):
+        return self.root.clock()
+
+    def run_for(self, seconds):
+        self.run(self.root.now_ms + (seconds * 1000))
+
+    def close(self):
+        if not self.finished:
+            self.screen.exit_program("event")
+
+
+class PeckStressTest(object):
+    def __init__(self, session, rate_hz, duration_s, seed=0,
+                 key_fraction=0.5):
+        self.session = session
+        self.screen = session.screen
+        self.canvas = session.canvas
+        self.rate_hz = rate_hz
+        self.duration_s = duration_s
+        self.key_fraction = key_fraction # share of touches aimed at the key
+        self.rng = Random(seed)
+        self.key = Disc(KEY_CENTER[0], KEY_CENTER[1], KEY_RADIUS + KEY_OUTLINE)
+        self.touches = []
+        self.by_stamp = {} # event.time -> [Touch, ...] not yet handled
+        self.unmatched_rows = 0 # rows with a Tk event we did not generate
+        self.counter_errors = [] # (TrialNum, counter, logged, rows)
+        self.trial_rows = {} # TrialNum -> {Event: count}
+
+        # Watch every data row the program writes
+        program_write_data = self.screen.write_data
+        def write_data(event, outcome, *args):
+            self._on_write_data(event, outcome)
+            program_write_data(event, outcome, *args)
+        self.screen.write_data = write_data
+
+    def expected_tag(self, x, y):
+        # Handler tag a touch at (x, y) should go to right now, from the
+        # groups the scene shows and this module's own copy of the geometry
+        # (so it is independent of the scene's regions and masks)
+        shown = self.screen.scene.visible
+        if "start_signal" in shown and START_SIGNAL.contains(x, y):
+            return "key"
+        if "keys" in shown and self.key.contains(x, y):
+            return "key"
+        patches = getattr(self.screen, "hidden_patches", None) # P003f
+        if "hidden_patch" in shown and patches is not None and \
+                any(rect.contains(x, y) for rect in patches.patches.values()):
+            return "hidden_patch"
+        if "background" in shown and 0 <= x <= self.screen.mainscreen_width \
+                and 0 <= y <= self.screen.mainscreen_height:
+            return "bkgrd"
+        return None
+
+    def _on_write_data(self, event, outcome):
+        trial = self.screen.current_trial_counter
+        if event is not None:
+            rows = self.trial_rows.setdefault(trial, {})
+            rows[outcome] = rows.get(outcome, 0) + 1
+            pending = self.by_stamp.get(getattr(event, "time", None))
+            if not pending:
+                self.unmatched_rows += 1
+                return
+            touch = pending.pop(0)
+            touch.handled = self.session.clock()
+            touch.event = outcome
+            touch.handled_tag = self.expected_tag(touch.x, touch.y)
+        elif outcome in ("reinforced_trial", "nonreinforced_trial"):
+            rows = self.trial_rows.get(trial, {})
+            counters = [("trial_peck_counter", "key_peck"),
+                        ("background_peck_counter", "background_peck"),
+                        ("hidden_patch_peck_counter", "hidden_patch_peck")]
+            for counter, row_event in counters:
+                if not hasattr(self.screen, counter):
+                    continue
+                logged = getattr(self.screen, counter)
+                if logged != rows.get(row_event, 0):
+                    self.counter_errors.append((trial, counter, logged,
+                                                rows.get(row_event, 0)))
+
+    def _next_point(self):
+        if self.rng.random() < self.key_fraction:
+            # Uniform inside the key circle
+            while True:
+                dx = self.rng.uniform(-KEY_RADIUS, KEY_RADIUS)
+                dy = self.rng.uniform(-KEY_RADIUS, KEY_RADIUS)
+                if (dx * dx) + (dy * dy) <= KEY_RADIUS ** 2:
+                    return int(KEY_CENTER[0] + dx), int(KEY_CENTER[1] + dy)
+        return (self.rng.randrange(self.screen.mainscreen_width),
+                self.rng.randrange(self.screen.mainscreen_height))
+
+    def _generate(self, k):
+        # Generates touch k, then schedules touch k + 1 at its absolute time
+        # (so a busy Tk shows up as lateness, not as a lower rate)
+        planned = self.start + (k / self.rate_hz)
+        now = self.session.clock()
+        if now - self.start >= self.duration_s:
+            return
+        x, y = self._next_point()
+        stamp = max(1, int(now * 1000) % (2 ** 32))
+        touch = Touch(stamp, x, y, planned, now, self.expected_tag(x, y))
+        self.touches.append(touch)
+        self.by_stamp.setdefault(stamp, []).append(touch)
+        self.canvas.event_generate("<Button-1>", x=x, y=y, time=stamp,
+                                   when="tail")
+        next_planned = self.start + ((k + 1) / self.rate_hz)
+        delay_ms = max(0, int(round((next_planned - self.session.clock()) * 1000)))
+        self.session.after(delay_ms, self._generate, k + 1)
+
+    def run(self, drain_s=2.0):
+        self.session.start()
+        self.start = self.session.clock()
+        self.session.after(0, self._generate, 0)
+        self.session.run_for(self.duration_s + drain_s)
+        return self.report()
+
+    def report(self):
+        # Only touches that landed on a bound item should produce a row
+        expected = [t for t in self.touches if t.expected_tag in EVENTS_FOR_TAG]
+        handled = [t for t in self.touches if t.handled is not None]
+        dropped = [t for t in expected if t.handled is None]
+        misclassified = [t for t in handled
+                         if t.event not in EVENTS_FOR_TAG.get(t.handled_tag, ())]
+        stale = [t for t in handled
+                 if t.expected_tag != t.handled_tag] # screen changed while queued
+        latencies = [(t.handled - t.generated) * 1000 for t in handled]
+        lateness = [(t.generated - t.planned) * 1000 for t in self.touches]
+        third = max(1, len(latencies) // 3)
+        early, late = sorted(latencies[:third]), sorted(latencies[-third:])
+        return {"rate_hz": self.rate_hz,
+                "touches": len(self.touches),
+                "achieved_hz": len(self.touches) / self.duration_s,
+                "handled": len(handled),
+                "dropped": len(dropped),
+                "misclassified": len(misclassified),
+                "stale": len(stale),
+                "unmatched_rows": self.unmatched_rows,
+                "counter_errors": self.counter_errors,
+                "latency_median_ms": _percentile(sorted(latencies), 0.5),
+                "latency_p95_ms": _percentile(sorted(latencies), 0.95),
+                "latency_max_ms": max(latencies, default=0.0),
+                "latency_growth_ms": _percentile(late, 0.5) - _percentile(early, 0.5),
+                "generation_lateness_max_ms": max(lateness, default=0.0)}
+
+
+def _percentile(sorted_values, q):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(q * len(sorted_values)))]
+
+
+def failures(report, max_latency_ms=50, max_growth_ms=20, min_rate_fraction=0.9):
+    # Reasons this rate failed (empty if it passed)
+    reasons = []
+    if report["dropped"]:
+        reasons.append(f"{report['dropped']} dropped pecks")
+    if report["misclassified"]:
+        reasons.append(f"{report['misclassified']} misclassified pecks")
+    if report["unmatched_rows"]:
+        reasons.append(f"{report['unmatched_rows']} rows not matched to a touch")
+    if report["counter_errors"]:
+        reasons.append(f"{len(report['counter_errors'])} trials with peck counters out of step with the data rows")
+    if report["latency_p95_ms"] > max_latency_ms:
+        reasons.append(f"95th percentile latency {report['latency_p95_ms']:.1f} ms > {max_latency_ms} ms")
+    if report["latency_growth_ms"] > max_growth_ms:
+        reasons.append(f"latency grew by {report['latency_growth_ms']:.1f} ms over the run")
+    if report["achieved_hz"] < min_rate_fraction * report["rate_hz"]:
+        reasons.append(f"only {report['achieved_hz']:.1f} of {report['rate_hz']} Hz generated")
+    return reasons
+
+
+def main():
+    parser = ArgumentParser(description="Stress a P003 program with synthetic touches at high peck rates")
+    parser.add_argument("program", help="experiment script, e.g. P003f/P003F_ExpProgram_RP.py")
+    parser.add_argument("--rates", type=float, nargs="+", default=[5, 20, 50], help="touch rates (Hz)")
+    parser.add_argument("--seconds", type=float, default=60, help="duration of each rate (s)")
+    parser.add_argument("--subject", default="TEST")
+    parser.add_argument("--option", action="append", default=[], metavar="NAME=VALUE",
+                        help="extra MainScreen argument, e.g. exp_phase_name=RR2 or phase_type=INS")
+    parser.add_argument("--max-latency-ms", type=float, default=50)
+    parser.add_argument("--max-growth-ms", type=float, default=20)
+    parser.add_argument("--headless", action="store_true", help="virtual-clock runtime (no display needed)")
+    parser.add_argument("--show-output", action="store_true", help="keep the program's own terminal output")
+    args = parser.parse_args()
+
+    options = dict(option.split("=", 1) for option in args.option)
+    program_path = os_path.abspath(args.program)
+    failed = False
+    for i, rate_hz in enumerate(args.rates):
+        with working_directory(os_path.dirname(program_path)), \
+                open(devnull, "w") as sink, \
+                (nullcontext() if args.show_output else redirect_stdout(sink)):
+            if args.headless:
+                session = _HeadlessStressSession(program_path, args.subject,
+                                                 session_seed=i, **options)
+            else:
+                session = TkSession(program_path, args.subject,
+                                    session_seed=i, **options)
+            test = PeckStressTest(session, rate_hz, args.seconds, seed=i)
+            report = test.run()
+            session.close()
+
+        reasons = failures(report, args.max_latency_ms, args.max_growth_ms)
+        failed = failed or bool(reasons)
+        print(f"{rate_hz:>5g} Hz | {report['touches']} touches ({report['achieved_hz']:.1f} Hz) | "
+              f"handled {report['handled']} | dropped {report['dropped']} | "
+              f"misclassified {report['misclassified']} | stale {report['stale']} | "
+              f"latency median {report['latency_median_ms']:.1f} / 95th {report['latency_p95_ms']:.1f} / "
+              f"max {report['latency_max_ms']:.1f} ms | growth {report['latency_growth_ms']:.1f} ms")
+        for trial, counter, logged, rows in report["counter_errors"][:5]:
+            print(f"        trial {trial}: {counter} = {logged}, but {rows} rows logged")
+        print("        FAIL: " + "; ".join(reasons) if reasons else "        ok")
+
+    sys_exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,179 @@
+# -*- coding: utf-8 -*-
+"""
+Design sweeps of P003Fc schedule parameters on the headless engine.
+
+Choosing the VR band, the schedule values, the trial duration and the
+number of trials per type used to be done by hand. A sweep runs whole
+P003Fc sessions on the virtual clock (HeadlessSession) for every point of
+a grid of these parameters, with a virtual pigeon doing the pecking, in a
+process pool. Each session's trial list, schedules and VR requirement
+tables are rebuilt for its design point right after the spacebar, so
+everything else (ITI, start signal, trial timer, hopper, outcome logic)
+is the program's own code.
+
+VirtualPigeon pecks at a steady Poisson rate while a key is on the screen
+(start signal or trial), never during the ITI; a key_share of its pecks
+land on the key and the rest on the background.
+
+One row per session and trial code goes into a single results table:
+trials, observed and expected reinforcers (exact, from the probability
+tables in schedules.py) and the session's duration. E.g.:
+
+    python -m P003_common.sweep --band 0.2 0.3 0.4 --ratios 2,5,20,50 3,6,15,40 \\
+        --trial-seconds 5 10 --peck-rate 0.5 1 2 --sessions 3 --workers 4
+"""
+from argparse import ArgumentParser
+from concurrent.futures import ProcessPoolExecutor
+from csv import writer, QUOTE_MINIMAL
+from itertools import product
+from math import cos, pi, sin
+from os import path as os_path
+from random import Random
+
+from P003_common.headless import HeadlessSession
+from P003_common.schedules import VariableRatio
+from P003_common.sequences import balanced_order, TransitionBalance
+from P003_common.trial_plan import TrialPlan
+
+PROGRAM = os_path.join(os_path.dirname(os_path.dirname(os_path.abspath(__file__))),
+                       "P003Fc", "P003Fc_ExpProgram_RP.py")
+SUBJECTS = {"INS": "Herriot", "OMS": "Kurt"} # regular (non-TEST) birds of each condition
+KEY_CENTER = (512, 384)
+KEY_RADIUS = 96
+
+SWEEP_COLUMNS = ["Contingency", "Band", "Ratios", "TrialSeconds", "TrialsPerType",
+                 "PeckRate", "KeyShare", "Seed", "TrialType", "Ratio", "Trials",
+                 "Reinforced", "Expected", "ReinforcementRate", "SessionMinutes"]
+
+
+class VirtualPigeon(object):
+    def __init__(self, peck_rate, key_share, rng):
+        self.peck_rate = peck_rate # pecks per second while a key is up
+        self.key_share = key_share # fraction of pecks aimed at the key
+        self.rng = rng
+
+    def next_peck_ms(self, now_ms):
+        return now_ms + self.rng.expovariate(self.peck_rate) * 1000
+
+    def peck_location(self):
+        if self.rng.random() < self.key_share:
+            # Somewhere on the key (uniform over the disk)
+            radius = KEY_RADIUS * self.rng.random() ** 0.5
+            angle = self.rng.uniform(0, 2 * pi)
+            return (int(KEY_CENTER[0] + radius * cos(angle)),
+                    int(KEY_CENTER[1] + radius * sin(angle)))
+        return self.rng.randrange(1024), self.rng.randrange(768)
+
+
+def design_points(contingencies, bands, ratio_sets, trial_seconds, trials_per_type,
+                  peck_rates, key_shares):
+    # Every combination of the swept parameters, as dicts
+    names = ["contingency", "band", "ratios", "trial_seconds", "trials_per_type",
+             "peck_rate", "key_share"]
+    return [dict(zip(names, values))
+            for values in product(contingencies, bands, ratio_sets, trial_seconds,
+                                  trials_per_type, peck_rates, key_shares)]
+
+
+def apply_design(screen, point):
+    # Rebuilds a started (spacebar pressed) P003Fc session for a design
+    # point, the same way first_ITI builds it
+    codes = [f"{point['contingency']}_{ratio}" for ratio in point["ratios"]]
+    for code in codes: # trial codes outside the stimulus table get no image
+        screen.stimulus_assignments_dict.setdefault(code, "NA")
+    trial_types = codes * point["trials_per_type"]
+    blocks = 4 if point["trials_per_type"] % 4 == 0 else 1
+    order, _, _ = balanced_order(trial_types, blocks, 3, screen.rng.order)
+    screen.schedules = {code: VariableRatio(ratio, point["contingency"], point["band"])
+                        for code, ratio in zip(codes, point["ratios"])}
+    tables = {code: iter(screen.schedules[code].requirement_table(order.count(code), screen.rng.outcome))
+              for code in codes}
+    screen.trial_assignment_list = order
+    screen.max_trials = len(order)
+    screen.transition_balance = TransitionBalance(order)
+    screen.trial_plan = TrialPlan(order=order, requirements=[next(tables[code]) for code in order])
+    screen.trial_timer_duration = int(point["trial_seconds"] * 1000)
+    return dict(zip(codes, point["ratios"]))
+
+
+def run_point(job):
+    # One session of one design point; returns its SWEEP_COLUMNS rows
+    point, seed = job
+    session = HeadlessSession(PROGRAM, SUBJECTS[point["contingency"]], session_seed=seed,
+                              phase_type=point["contingency"])
+    session.start()
+    ratio_of = apply_design(session.screen, point)
+    pigeon = VirtualPigeon(point["peck_rate"], point["key_share"], Random(f"pigeon-{seed}"))
+    next_peck = pigeon.next_peck_ms(session.now_ms)
+    while not session.finished:
+        session.run(until_ms=next_peck)
+        if session.finished:
+            break
+        if session.screen.scene.tag_at(*KEY_CENTER) == "key": # only pecks while a key is up
+            session.touch(*pigeon.peck_location())
+        next_peck = pigeon.next_peck_ms(next_peck)
+    session.run()
+
+    minutes = round(session.now_ms / 60000, 2)
+    ratios = "/".join(str(r) for r in point["ratios"])
+    rows = []
+    for trial_type, trials, reinforced, expected, _ in session.screen.reinforcement_tally.rows():
+        rows.append([point["contingency"], point["band"], ratios, point["trial_seconds"],
+                     point["trials_per_type"], point["peck_rate"], point["key_share"], seed,
+                     trial_type, ratio_of[trial_type], trials, reinforced, expected,
+                     round(reinforced / trials, 3), minutes])
+    return rows
+
+
+def run_sweep(points, sessions=1, workers=None, base_seed=1):
+    # Every design point x session, in parallel; rows of SWEEP_COLUMNS
+    jobs = [(point, base_seed + s) for point in points for s in range(sessions)]
+    results = []
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for rows in pool.map(run_point, jobs):
+            results.extend(rows)
+    return results
+
+
+def main():
+    parser = ArgumentParser(description="Sweep P003Fc schedule parameters with virtual pigeons on the headless engine")
+    parser.add_argument("--contingency", nargs="+", default=["INS", "OMS"], choices=["INS", "OMS"])
+    parser.add_argument("--band", nargs="+", type=float, default=[0.30], help="VR bands (fraction of the ratio)")
+    parser.add_argument("--ratios", nargs="+", default=["2,5,20,50"], help="comma-separated schedule values, one set per design")
+    parser.add_argument("--trial-seconds", nargs="+", type=float, default=[10])
+    parser.add_argument("--trials-per-type", nargs="+", type=int, default=[20])
+    parser.add_argument("--peck-rate", nargs="+", type=float, default=[1.0], help="virtual pigeon pecks/s while a key is up")
+    parser.add_argument("--key-share", nargs="+", type=float, default=[0.8], help="fraction of pecks on the key")
+    parser.add_argument("--sessions", type=int, default=1, help="sessions (seeds) per design point")
+    parser.add_argument("--seed", type=int, default=1, help="first session seed")
+    parser.add_argument("--workers", type=int, default=None, help="parallel processes (default: all cores)")
+    parser.add_argument("--out", default="sweep_results.csv")
+    args = parser.parse_args()
+
+    ratio_sets = [tuple(int(r) for r in ratios.split(",")) for ratios in args.ratios]
+    points = design_points(args.contingency, args.band, ratio_sets, args.trial_seconds,
+                           args.trials_per_type, args.peck_rate, args.key_share)
+    print(f"Sweeping {len(points)} design points x {args.sessions} sessions")
+    results = run_sweep(points, args.sessions, args.workers, args.seed)
+    with open(args.out, 'w', newline='') as myFile:
+        w = writer(myFile, quoting=QUOTE_MINIMAL)
+        w.writerow(SWEEP_COLUMNS)
+        w.writerows(results)
+
+    # Terminal summary: mean reinforcement rate and session length per design point
+    per_point = {}
+    for row in results:
+        key = tuple(row[:7])
+        trials, reinforced, expected, minutes = per_point.get(key, (0, 0, 0.0, []))
+        per_point[key] = (trials + row[10], reinforced + row[11], expected + row[12], minutes + [row[14]])
+    print(f"{'Cont':>4} | {'Band':>4} | {'Ratios':>12} | {'Trial s':>7} | {'/type':>5} | "
+          f"{'Pecks/s':>7} | {'Key':>4} | {'Reinf. rate':>11} | {'Expected':>8} | {'Minutes':>7}")
+    for key, (trials, reinforced, expected, minutes) in per_point.items():
+        print(f"{key[0]:>4} | {key[1]:>4} | {key[2]:>12} | {key[3]:>7} | {key[4]:>5} | "
+              f"{key[5]:>7} | {key[6]:>4} | {reinforced / trials:>11.3f} | {expected / trials:>8.3f} | "
+              f"{sum(minutes) / len(minutes):>7.1f}")
+    print(f"\n- Sweep results written to {args.out}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,191 @@
+# -*- coding: utf-8 -*-
+"""
+Timing helpers for the P003 programs.
+
+TouchLatencyLog
+    Every peck handler ends up in write_data(), which stamps the row with
+    time() at the moment the *callback* runs. If Tk is busy (redrawing the
+    canvas, writing the .csv during the ITI, etc.) a touch can sit in the
+    event queue before its callback runs, and that wait silently ends up in
+    TrialTime. Tk also hands us the X server timestamp of the touch itself
+    (event.time, in ms), so we keep both and log the difference.
+
+    The server clock and our clock have an unknown fixed offset, so the
+    smallest (callback - event) gap seen in the session is treated as "no
+    queueing". Each row gets the delay relative to the smallest gap seen *so
+    far*; the end-of-session histogram is rebuilt with the final smallest gap,
+    so it is exact for the whole session.
+
+DeadlineScheduler
+    Trials are a chain of root.after() timers (ITI -> build_keys -> trial
+    timer -> hopper -> ITI ...). Each after() only starts counting once the
+    previous callback has run, so any callback latency is added on top of
+    every phase and builds up over a 180-trial session. The scheduler keeps
+    an *ideal* timeline instead: every phase ends at (ideal start of the
+    phase + its duration) on the monotonic clock, and the after() delay is
+    shortened by however late we already are. Phases that start on a peck
+    (start signal, FR2 reinforcement) re-anchor the timeline with restart().
+    Requested vs. actual duration of every phase is kept for the session log.
+
+    onset() is called once a trial's keys have actually been drawn (after
+    update_idletasks() has flushed the canvas): it returns, and keeps, how
+    long after its scheduled start (the ideal start of the phase) the
+    stimulus went up. The programs log it on a stimulus_onset row, whose
+    TrialTime is the true onset for latency-to-first-peck measures.
+"""
+from csv import writer, QUOTE_MINIMAL
+from time import monotonic, time
+
+# X server timestamps are unsigned 32-bit milliseconds and wrap every ~49.7 days
+SERVER_TIME_WRAP = 2 ** 32
+
+
+class TouchLatencyLog(object):
+    def __init__(self, bin_width_ms=5, max_delay_ms=250, clock=monotonic):
+        self.clock = clock # seconds; swapped for a virtual clock when run headless
+        self.bin_width_ms = bin_width_ms # width of each histogram bin (ms)
+        self.max_delay_ms = max_delay_ms # anything above this goes in the last bin
+        self.gaps = [] # (callback - event) gap for every touch this session (ms)
+        self.min_gap = None # smallest gap seen so far = zero queueing delay
+        self.last_event_time = None # for catching the 32-bit wraparound
+        self.wrap_count = 0
+
+    def record(self, event):
+        # Called from write_data() with the Tk event (or None for non-peck
+        # rows). Returns the raw event time and the queueing delay (ms) for
+        # the data row.
+        event_time = getattr(event, "time", None)
+        if event is None or not isinstance(event_time, int) or event_time <= 0:
+            return "NA", "NA"
+        callback_ms = self.clock() * 1000
+
+        # Unwrap the server clock if it rolled over since the last touch
+        if self.last_event_time is not None and \
+                event_time < self.last_event_time - (SERVER_TIME_WRAP // 2):
+            self.wrap_count += 1
+        self.last_event_time = event_time
+        unwrapped_event_ms = event_time + (self.wrap_count * SERVER_TIME_WRAP)
+
+        gap = callback_ms - unwrapped_event_ms
+        self.gaps.append(gap)
+        if self.min_gap is None or gap < self.min_gap:
+            self.min_gap = gap
+        return event_time, round(gap - self.min_gap, 2)
+
+    def delays(self):
+        # Queueing delay of every touch relative to the session's final baseline
+        if not self.gaps:
+            return []
+        return [gap - self.min_gap for gap in self.gaps]
+
+    def histogram(self):
+        # List of [bin start, bin end, count] rows; the last bin is open-ended
+        n_bins = (self.max_delay_ms // self.bin_width_ms) + 1
+        counts = [0] * n_bins
+        for delay in self.delays():
+            counts[min(int(delay // self.bin_width_ms), n_bins - 1)] += 1
+        rows = []
+        for i, count in enumerate(counts):
+            bin_start = i * self.bin_width_ms
+            bin_end = "inf" if i == n_bins - 1 else bin_start + self.bin_width_ms
+            rows.append([bin_start, bin_end, count])
+        return rows
+
+    def summary(self):
+        # Short terminal summary (n, median, 95th percentile, max) in ms
+        delays = sorted(self.delays())
+        if not delays:
+            return "Touch queueing delay: no touches recorded"
+        def percentile(q):
+            return delays[min(len(delays) - 1, int(q * len(delays)))]
+        return (f"Touch queueing delay (n = {len(delays)}): "
+                f"median {percentile(0.5):.1f} ms | "
+                f"95th {percentile(0.95):.1f} ms | "
+                f"max {delays[-1]:.1f} ms")
+
+    def write_histogram(self, file_loc):
+        # Writes the per-session histogram next to the session data file
+        with open(file_loc, 'w', newline='') as myFile:
+            w = writer(myFile, quoting=QUOTE_MINIMAL)
+            w.writerow(["DelayBinStart_ms", "DelayBinEnd_ms", "TouchCount"])
+            w.writerows(self.histogram())
+
+
+class DeadlineScheduler(object):
+    def __init__(self, root, trial_counter=None, clock=monotonic, wall_clock=time):
+        self.root = root # Tk window that owns the after() timers
+        self.trial_counter = trial_counter # callable returning the current trial number
+        self.clock = clock # seconds; swapped for a virtual clock when run headless
+        self.wall_clock = wall_clock # time() equivalent of clock, for anchor_time()
+        self.anchor = None # ideal (monotonic) start time of the current phase
+        self.actual_start = None # when the current phase actually started
+        self.phase_log = [] # [TrialNum, Phase, Requested_ms, Actual_ms, Lateness_ms]
+        self.onset_delays = [] # ms from each stimulus' scheduled to actual onset
+
+    def restart(self):
+        # Re-anchors the ideal timeline to right now. Called at session start
+        # and whenever a phase is started by a peck rather than by a timer.
+        self.anchor = self.actual_start = self.clock()
+
+    def after(self, phase, duration_ms, callback):
+        # Drop-in for root.after(duration_ms, callback) that ends the phase
+        # at its absolute deadline. Returns the Tk after ID so it can still
+        # be cancelled with root.after_cancel().
+        if self.anchor is None:
+            self.restart()
+        deadline = self.anchor + (duration_ms / 1000)
+        phase_start = self.actual_start
+        delay_ms = max(0, int(round((deadline - self.clock()) * 1000)))
+
+        def end_of_phase():
+            now = self.clock()
+            trial_num = self.trial_counter() if self.trial_counter else "NA"
+            self.phase_log.append([trial_num,
+                                   phase,
+                                   duration_ms,
+                                   round((now - phase_start) * 1000, 2),
+                                   round((now - deadline) * 1000, 2)])
+            # The next phase starts from the deadline, not from "now", so
+            # lateness here is not carried forward into the next phase
+            self.anchor = deadline
+            self.actual_start = now
+            callback()
+
+        return self.root.after(delay_ms, end_of_phase)
+
+    def anchor_time(self):
+        # Wall-clock (time()) equivalent of the ideal start of the current phase
+        if self.anchor is None:
+            return self.wall_clock()
+        return self.wall_clock() - (self.clock() - self.anchor)
+
+    def onset(self):
+        # ms between the current phase's ideal start and now, i.e. how late
+        # a stimulus that has just been flushed to the screen went up
+        if self.anchor is None:
+            self.restart()
+        delay = round((self.clock() - self.anchor) * 1000, 2)
+        self.onset_delays.append(delay)
+        return delay
+
+    def summary(self):
+        if not self.phase_log:
+            return "Phase timing: no timed phases completed"
+        lateness = [row[4] for row in self.phase_log]
+        summary = (f"Phase timing ({len(lateness)} phases): "
+                   f"mean lateness {sum(lateness) / len(lateness):.1f} ms | "
+                   f"max {max(lateness):.1f} ms | "
+                   f"final {lateness[-1]:.1f} ms")
+        if self.onset_delays:
+            summary += (f"\nStimulus onset ({len(self.onset_delays)} trials): "
+                        f"mean delay {sum(self.onset_delays) / len(self.onset_delays):.1f} ms | "
+                        f"max {max(self.onset_delays):.1f} ms")
+        return summary
+
+    def write_phase_log(self, file_loc):
+        # Requested vs. actual duration of every timed phase this session
+        with open(file_loc, 'w', newline='') as myFile:
+            w = writer(myFile, quoting=QUOTE_MINIMAL)
+            w.writerow(["TrialNum", "Phase", "Requested_ms", "Actual_ms",
+                        "Lateness_ms"])
+            w.writerows(self.phase_log)
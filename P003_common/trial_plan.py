@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+"""
+Streaming trial plan for the P003 programs.
+
+Sessions used to build trial_assignment_list up front, which needs a fixed
+max_trials. A TrialPlan instead hands out the next trial when the ITI asks
+for one, so a session can also end on elapsed time or reinforcers earned
+without knowing in advance how many trials that will be.
+
+Trials come either from a fixed order (e.g., one picked from the sequence
+bank, optionally with a pre-drawn response requirement per trial, such as
+P003Fc's VR table) or, for open-ended sessions, from a block of trial types
+that is re-drawn with next_block() each time it runs out. Each new block is drawn
+only when it is needed, and the run-length limit also holds across block
+boundaries (sequences.next_block).
+
+The ITI checks stop_reason() before starting a trial:
+    "Trial max reached" / "Time limit reached" / "Reinforcer max reached"
+or None to carry on, and then calls next_trial().
+"""
+from time import monotonic
+
+from P003_common.sequences import next_block
+
+
+class TrialSpec(object):
+    def __init__(self, trial_num, trial_type, block_num, requirement=None):
+        self.trial_num = trial_num # 1, 2, ... within the session
+        self.trial_type = trial_type
+        self.block_num = block_num # 1, 2, ... (always 1 for a fixed order)
+        self.requirement = requirement # pre-drawn response requirement (e.g. VR), if any
+
+
+class TrialPlan(object):
+    def __init__(self, rng=None, order=None, block=None, max_run=3, key=None,
+                 max_trials=None, max_minutes=None, max_reinforcers=None,
+                 clock=monotonic, requirements=None):
+        # Give either order (a fixed list of trial types) or block (the trial
+        # types of one block, repeated as long as the session lasts).
+        # requirements: optional per-trial requirements to go with order
+        if (order is None) == (block is None):
+            raise ValueError("TrialPlan needs either an order or a block")
+        if block is not None and rng is None:
+            raise ValueError("an open-ended TrialPlan needs an rng to draw blocks")
+        self.rng = rng # e.g., SessionRNG.order
+        self.block = None if block is None else list(block)
+        self.max_run = max_run
+        self.key = key
+        self.clock = clock # seconds; swapped for a virtual clock when run headless
+        if order is not None:
+            # A fixed order can never run longer than its own length
+            order = list(order)
+            max_trials = len(order) if max_trials is None else min(max_trials, len(order))
+        self.max_trials = max_trials # None = no limit
+        self.max_minutes = max_minutes # None = no limit
+        self.max_reinforcers = max_reinforcers # None = no limit
+
+        if requirements is not None and (order is None or len(requirements) != len(order)):
+            raise ValueError("requirements need a fixed order of the same length")
+
+        self.start_time = None
+        self.reinforcers = 0
+        self.trials_started = 0
+        self._specs = self._stream(order, requirements)
+
+    def _stream(self, order, requirements):
+        # Generator of TrialSpecs; blocks are only drawn once they are needed
+        trial_num = 0
+        if order is not None:
+            if requirements is None:
+                requirements = [None] * len(order)
+            for trial_type, requirement in zip(order, requirements):
+                trial_num += 1
+                yield TrialSpec(trial_num, trial_type, 1, requirement)
+            return
+        recent = [] # the last max_run trials, for joining the next block
+        block_num = 0
+        while True:
+            block_num += 1
+            trial_types = next_block(self.block, recent, self.max_run, self.rng, self.key)
+            recent = trial_types[-self.max_run:]
+            for trial_type in trial_types:
+                trial_num += 1
+                yield TrialSpec(trial_num, trial_type, block_num)
+
+    def start(self):
+        # Starts the session clock for max_minutes (called at the spacebar)
+        self.start_time = self.clock()
+
+    def reinforcer_earned(self):
+        self.reinforcers += 1
+
+    def minutes_elapsed(self):
+        if self.start_time is None:
+            return 0
+        return (self.clock() - self.start_time) / 60
+
+    def stop_reason(self, trials_done=None):
+        # Why the session should end before another trial, or None. trials_done
+        # defaults to the number of trials handed out so far.
+        if trials_done is None:
+            trials_done = self.trials_started
+        if self.max_trials is not None and trials_done >= self.max_trials:
+            return "Trial max reached"
+        if self.max_minutes is not None and self.minutes_elapsed() >= self.max_minutes:
+            return "Time limit reached"
+        if self.max_reinforcers is not None and self.reinforcers >= self.max_reinforcers:
+            return "Reinforcer max reached"
+        return None
+
+    def next_trial(self):
+        # TrialSpec of the next trial (does not check the session limits)
+        self.trials_started += 1
+        return next(self._specs)
+
+    def __iter__(self):
+        # for spec in plan: ... runs until a session limit is reached
+        while self.stop_reason() is None:
+            yield self.next_trial()
+
+    def summary(self):
+        limits = [f"{self.max_trials} trials" if self.max_trials is not None else None,
+                  f"{self.max_minutes} min" if self.max_minutes is not None else None,
+                  f"{self.max_reinforcers} reinforcers" if self.max_reinforcers is not None else None]
+        limits = [limit for limit in limits if limit]
+        source = "fixed order" if self.block is None else f"blocks of {len(self.block)} trials"
+        return (f"Trial plan: {source} | session ends at "
+                f"{' or '.join(limits) if limits else 'manual exit only'}")
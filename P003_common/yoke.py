@@ -0,0 +1,162 @@
+# -*- coding: utf-8 -*-
+"""
+Trial-by-trial yoke files for P003g.
+
+In the Yoked phase, a bird should get food on the same trial-by-trial
+schedule as its own Master phase, whatever it pecks now. Drawing each
+Yoked trial from the bird's average obtained ratio per trial type
+(YOKED_REINFORCEMENT_RATIOS) only matches that schedule on average. A yoke
+file holds the actual schedule instead: for every Master session, the
+trial type and outcome (reinforced or not) of each trial, in order.
+
+The Yoked MainScreen loads the bird's yoke file once at the spacebar. Yoked
+session n replays Master session n (counting the bird's Yoked data files
+already in its data folder; it wraps around if there are more Yoked than
+Master sessions). It takes that session's trial types as its own trial
+order, and each trial's outcome is a list lookup. The Master session used
+is logged in every data row (YokeSession).
+
+Like the sequence banks, each session is packed as base64 digits (see
+sequence_bank.encode_order): trial types in base 3, outcomes in base 2. A
+180-trial session then takes ~70 characters.
+
+Compile yoke files from the Master data in the terminal, e.g.:
+
+    python -m P003_common.yoke ~/Desktop/Data/P003g_data
+    python -m P003_common.yoke ~/Desktop/Data/P003g_data Peach Kurt
+"""
+from argparse import ArgumentParser
+from csv import DictReader
+from datetime import date
+from glob import glob
+from json import dump, load
+from os import listdir, path as os_path
+
+from P003_common.sequence_bank import decode_order, encode_order
+
+TRIAL_TYPES = ["PAV", "INS", "OMS"]
+OUTCOMES = [False, True] # nonreinforced, reinforced
+OUTCOME_EVENTS = {"reinforced_trial": True, "nonreinforced_trial": False}
+
+
+def yoke_file_loc(subject_folder, subject_ID):
+    # The yoke file lives with the bird's data, e.g. P003g_data/Peach/Peach_P003g_yoke.json
+    return os_path.join(subject_folder, f"{subject_ID}_P003g_yoke.json")
+
+
+def session_files(subject_folder, exp_phase_name):
+    # A bird's P003g data files from one phase, oldest first (the file
+    # names start with the session's start time)
+    files = []
+    for file_loc in sorted(glob(os_path.join(subject_folder, "*_P003g_data.csv"))):
+        with open(file_loc, 'r', encoding='utf-8-sig') as f:
+            first_row = next(DictReader(f), None)
+        if first_row is not None and first_row.get("ExpPhase") == exp_phase_name:
+            files.append(file_loc)
+    return files
+
+
+def session_outcomes(csv_path):
+    # [(trial type, reinforced), ...] of every completed trial of a session
+    trials = {}
+    with open(csv_path, 'r', encoding='utf-8-sig') as f:
+        for row in DictReader(f):
+            if row["Event"] in OUTCOME_EVENTS:
+                trials[int(row["TrialNum"])] = (row["TrialType"], OUTCOME_EVENTS[row["Event"]])
+    return [trials[n] for n in sorted(trials)]
+
+
+class YokeFile(object):
+    def __init__(self, subject_ID, sessions, created=None):
+        self.subject_ID = subject_ID
+        self.sessions = sessions # [{"Source", "Trials", "TrialTypes", "Outcomes"}, ...]
+        self.created = created or str(date.today())
+
+    @classmethod
+    def load(cls, file_loc):
+        # Returns None if the bird has no yoke file
+        if not os_path.exists(file_loc):
+            return None
+        with open(file_loc, 'r') as f:
+            saved = load(f)
+        return cls(saved["subject"], saved["sessions"], saved["created"])
+
+    def save(self, file_loc):
+        with open(file_loc, 'w') as f:
+            dump({"subject": self.subject_ID, "created": self.created,
+                  "trial_types": TRIAL_TYPES, "sessions": self.sessions}, f)
+        return file_loc
+
+    def __len__(self):
+        return len(self.sessions)
+
+    def session(self, index):
+        # (source, trial types, outcomes) of one Master session
+        session = self.sessions[index]
+        return (session["Source"],
+                decode_order(session["TrialTypes"], TRIAL_TYPES, session["Trials"]),
+                decode_order(session["Outcomes"], OUTCOMES, session["Trials"]))
+
+    def summary(self):
+        # Obtained reinforcement ratio per trial type over all sessions
+        reinforced = {trial_type: [0, 0] for trial_type in TRIAL_TYPES}
+        for index in range(len(self)):
+            _, trial_types, outcomes = self.session(index)
+            for trial_type, outcome in zip(trial_types, outcomes):
+                reinforced[trial_type][0] += outcome
+                reinforced[trial_type][1] += 1
+        ratios = " | ".join(f"{t} {n / max(1, total):.3f}" for t, (n, total) in reinforced.items())
+        return (f"{self.subject_ID:>12}: {len(self)} Master sessions, "
+                f"{sum(s['Trials'] for s in self.sessions)} trials | {ratios}")
+
+
+def compile_yoke(subject_folder, subject_ID):
+    # YokeFile from all of a bird's Master sessions (None if there are none)
+    sessions = []
+    for csv_path in session_files(subject_folder, "Master"):
+        trials = session_outcomes(csv_path)
+        if not trials:
+            continue
+        trial_types = [trial_type for trial_type, _ in trials]
+        outcomes = [outcome for _, outcome in trials]
+        sessions.append({"Source": os_path.basename(csv_path).replace("_P003g_data.csv", ""),
+                         "Trials": len(trials),
+                         "TrialTypes": encode_order(trial_types, TRIAL_TYPES),
+                         "Outcomes": encode_order(outcomes, OUTCOMES)})
+    return YokeFile(subject_ID, sessions) if sessions else None
+
+
+def yoked_session(subject_folder, subject_ID):
+    # Called from the Yoked first_ITI: (source, trial types, outcomes) of the
+    # Master session this Yoked session replays, or None without a yoke file
+    yoke = YokeFile.load(yoke_file_loc(subject_folder, subject_ID))
+    if yoke is None or len(yoke) == 0:
+        return None
+    yoked_sessions_run = len(session_files(subject_folder, "Yoked"))
+    if yoked_sessions_run >= len(yoke):
+        print(f"{subject_ID} has run {yoked_sessions_run} Yoked sessions but only has "
+              f"{len(yoke)} Master sessions; starting over from the first")
+    return yoke.session(yoked_sessions_run % len(yoke))
+
+
+def main():
+    parser = ArgumentParser(description="Compile P003g yoke files from each bird's Master sessions")
+    parser.add_argument("data_folder", help="P003g data folder (one subfolder per bird)")
+    parser.add_argument("subjects", nargs="*", help="birds to compile (default: every subfolder)")
+    args = parser.parse_args()
+
+    subjects = args.subjects or sorted(name for name in listdir(args.data_folder)
+                                       if os_path.isdir(os_path.join(args.data_folder, name)))
+    for subject_ID in subjects:
+        subject_folder = os_path.join(args.data_folder, subject_ID)
+        yoke = compile_yoke(subject_folder, subject_ID)
+        if yoke is None:
+            print(f"{subject_ID:>12}: no Master sessions")
+            continue
+        file_loc = yoke.save(yoke_file_loc(subject_folder, subject_ID))
+        print(yoke.summary())
+        print(f"{'':>14}written to {file_loc}")
+
+
+if __name__ == '__main__':
+    main()
@@ -35,8 +35,19 @@ from tkinter import Toplevel, Canvas, BOTH, TclError, Tk, Label, Button, \
      StringVar, OptionMenu, IntVar, Radiobutton
 from time import time, sleep
 from os import getcwd, popen, mkdir, path as os_path
-from random import choice, shuffle
-from PIL import ImageTk, Image  
+
+# Shared P003 helpers live in the P003_common folder, one level up from this
+# script's folder (e.g., ~/Desktop/Experiments/P003/P003_common/)
+sys_path.insert(0, os_path.dirname(os_path.dirname(os_path.abspath(__file__))))
+from P003_common.timing import TouchLatencyLog, DeadlineScheduler
+from P003_common.data_files import side_file_loc
+from P003_common.scene import CanvasScene, Disc, Rect
+from P003_common.preload import SessionPreload
+from P003_common.resources import ResourceMonitor
+from P003_common.randomness import SessionRNG
+from P003_common.schedules import schedule_for_code, ReinforcementTally
+from P003_common.sequence_bank import banked_order
+from P003_common.trial_plan import TrialPlan
 
 # The first variable declared is whether the program is the operant box version
 # for pigeons, or the test version for humans to view. The variable below is 
@@ -234,7 +245,9 @@ class MainScreen(object):
     # run when the object is first built:
     
     def __init__(self, subject_ID, record_data, data_folder_directory,
-                 exp_phase_name, exp_phase_num):
+                 exp_phase_name, exp_phase_num,
+                 session_seed=None, max_trials=180, max_session_minutes=None,
+                 max_reinforcers=None):
         ## Firstly, we need to set up all the variables passed from within
         # the control panel object to this MainScreen object. We do this 
         # by setting each argument as "self." objects to make them global
@@ -301,20 +314,174 @@ class MainScreen(object):
             self.hopper_duration = 4000 # duration of accessible hopper(ms)
 
         # These are additional "under the hood" variables that need to be declared
-        self.max_trials = 180 # Max number of trials within a session
+        self.max_trials = max_trials # Max number of trials within a session (None = no trial limit)
+        self.max_session_minutes = max_session_minutes # Session time limit in minutes (None = no limit)
+        self.max_reinforcers = max_reinforcers # Max number of reinforced trials (None = no limit)
         self.session_data_frame = [] #This where trial-by-trial data is stored
         self.current_trial_counter = 0 # This counts the number of trials that have passed
         header_list = ["SessionTime", "Xcord","Ycord", "Event", "TrialTime", 
                        "TrialType","TargetPeckNum", "BackgroundPeckNum",
                        "TrialNum", "TrialColor", "Subject", "ExpPhase",
-                       "Date"] # Column headers
+                       "Date", "TouchEventTime", "QueueDelay",
+                       "SessionSeed", "SequenceID", "Region", "OnsetDelay"] # Column headers
         self.session_data_frame.append(header_list) # First row of matrix is the column headers
         self.date = date.today().strftime("%y-%m-%d")
         self.myFile_loc = 'FILL' # To be filled later on after Pig. ID is provided (in set vars func below)
+        self.touch_latency_log = TouchLatencyLog() # Tk event-queue delay of every touch
+        self.scheduler = DeadlineScheduler(self.root, lambda: self.current_trial_counter) # drift-free phase timers
+        self.rng = SessionRNG(session_seed) # seeded RNG streams for this session (seed is logged)
+        self.reinforcement_tally = ReinforcementTally() # expected vs. observed reinforcers (printed every ITI and at session end)
+        self.onset_delay = "NA" # ms the stimulus went up after its scheduled onset (stimulus_onset row only)
+        self.sequence_ID = "NA" # ID of the trial order in the sequence bank (set in first_ITI)
+
+        self.build_scene() # every canvas item of the session, built once (hidden)
+        self.resource_monitor = ResourceMonitor(self.root, self.mastercanvas, self.scene,
+                                                kept = lambda: len(self.session_data_frame) + len(self.scheduler.phase_log)) # per-trial leak check
+
+        self.preload = SessionPreload(self.prepare_session) # stimuli and trial order, prepared before the spacebar
 
         ## Finally, start the recursive loop that runs the program:
         self.place_birds_in_box()
 
+    def build_scene(self):
+        # Builds every item the Canvas uses during the session once, hidden
+        # (see P003_common/scene.py). The ITI, start signal and trials then
+        # only show the groups they need and swap the stimulus color, instead
+        # of deleting and rebuilding everything (and re-binding each tag)
+        # every time. Order is important here, as shapes built on top of each
+        # other will overlap/cover each other.
+        self.scene = CanvasScene(self.mastercanvas)
+        
+        # First, the background. This basically is a button the size of 
+        # screen to track any pecks; buttons built on top of this button will
+        # NOT count as background pecks but as key pecks, because the object is
+        # covering that part of the background.
+        self.scene.add("background",
+                       self.mastercanvas.create_rectangle(0,0,
+                                                          self.mainscreen_width,
+                                                          self.mainscreen_height,
+                                                          fill = "black",
+                                                          outline = "black",
+                                                          tag = "bkgrd"))
+        
+        # The start signal key (a white square)
+        self.scene.add("start_signal",
+                       self.mastercanvas.create_rectangle([416, 288, 608, 480],
+                                                          outline = "black",
+                                                          fill = "white",
+                                                          tag = "key"))
+        
+        # Coordinates for all the keys
+        # key_coord_list =  [384, 256, 640, 512]
+        key_coord_list =  [416, 288, 608, 480] # 75% = 192 d
+        #key_coord_list =  [448, 320, 576, 448] # 50% = 128 d
+        midpoint_diameter = 10
+        midpoint_coord_list = [
+            key_coord_list[0] + ((key_coord_list[2] - key_coord_list[0]) // 2) - (midpoint_diameter//2),
+            key_coord_list[1] + ((key_coord_list[3] - key_coord_list[1]) // 2) - (midpoint_diameter//2),
+            key_coord_list[0] + ((key_coord_list[2] - key_coord_list[0]) // 2) + (midpoint_diameter//2),
+            key_coord_list[1] + ((key_coord_list[3] - key_coord_list[1]) // 2) + (midpoint_diameter//2)
+            ]
+        
+        # Key outline around the key
+        outline_size = 20 # 25 pixels in every direction
+        outline_coords_list = [
+            key_coord_list[0] - outline_size,
+            key_coord_list[1] - outline_size,
+            key_coord_list[2] + outline_size,
+            key_coord_list[3] + outline_size
+            ]
+        
+        # First up, build the actual circle that is the key and will
+        # contain the stimulus.
+        self.scene.add("keys",
+                       self.mastercanvas.create_oval(outline_coords_list, 
+                                                     outline = "black",
+                                                     fill = "black",
+                                                     tag = "key"))
+        
+        # The key itself (its fill is the trial's stimulus color, set each
+        # trial in build_keys)
+        self.stimulus_item = self.scene.add("keys",
+                                            self.mastercanvas.create_oval(key_coord_list,
+                                                                          outline = "black",
+                                                                          fill = "black",
+                                                                          tag = "key"))
+        
+        # Then the midpoint
+        self.scene.add("keys",
+                       self.mastercanvas.create_oval(midpoint_coord_list,
+                                                     fill = "black",
+                                                     outline = "black",
+                                                     tag = "key"))
+
+        # Touch regions, checked in this order (see P003_common/scene.py):
+        # pecks are classified by these shapes, not by which item is on top
+        key_center_x = (key_coord_list[0] + key_coord_list[2]) / 2
+        key_center_y = (key_coord_list[1] + key_coord_list[3]) / 2
+        key_radius = (key_coord_list[2] - key_coord_list[0]) / 2
+        self.scene.add_region("start_signal", "start_signal", Rect(416, 288, 608, 480), "key")
+        self.scene.add_region("keys", "key_midpoint", Disc(key_center_x, key_center_y, midpoint_diameter / 2), "key")
+        self.scene.add_region("keys", "key_disc", Disc(key_center_x, key_center_y, key_radius), "key")
+        self.scene.add_region("keys", "key_outline", Disc(key_center_x, key_center_y, key_radius + outline_size), "key")
+        self.scene.add_region("background", "background",
+                              Rect(0, 0, self.mainscreen_width, self.mainscreen_height), "bkgrd")
+    
+    def prepare_session(self):
+        # Everything the session needs that only depends on the subject and
+        # condition: stimulus colors and trial order. It runs on a worker thread,
+        # started at the end of __init__ while the bird is put in the box
+        # (see P003_common/preload.py), so nothing here may touch Tk.
+        # first_ITI waits for it and then builds the trial plan.
+
+        # First set up the path to the stimulus identity .csv document
+        stimuli_csv_path = getcwd() + "/P003E_stimuli_assignments.csv"
+            
+        # Import the used sample stimuli, their respective key assignments,
+        # and conditional assignments as a lists of dictionaries that are 
+        # structured as {'Name': 'C2_Phase1.bmp', 'Key': 'L', 'Group': 'E'}. 
+        # The list will be equal to the number of elements in the .csv file
+        # and doesn't actually take into account any of the literal files.
+        with open(stimuli_csv_path, 'r', encoding='utf-8-sig') as f:
+            dict_reader = DictReader(f) 
+            all_stimulus_assignment_list = list(dict_reader)
+    
+        
+        # After that, let's just pick out the stimuli for a single subject
+        for d in all_stimulus_assignment_list:
+            if d["Subject"] == self.subject_ID:
+                all_stimulus_assignments_dict = d
+                
+        # Next, pick out the specific stimuli colors for that specific 
+        # subject and phase. We can do this by making a dictionary of three
+        # entries for each bird: one for PAV, INS, and OMS
+        self.stimulus_assignments_dict = {}
+        for entry in all_stimulus_assignments_dict:
+            if entry.split("_")[0] == self.exp_phase_name:
+                self.stimulus_assignments_dict[entry.split("_")[1]] = all_stimulus_assignments_dict[entry]
+
+        # Once we have the three stimuli colors for each bird and phase,
+        # we can order all the trials within a session. These should be
+        # quasi-randomly ordered, such that there were no more than three 
+        # of a single cue across consecutive trials (e.g., never PAV, PAV,
+        # PAV, PAV).
+        if self.max_trials is not None:
+            potential_trial_assignments = ["PAV", "INS", "OMS"] * (self.max_trials // 3) # This will be shuffled around...
+            # The order is picked from a bank of pre-generated, checked orders
+            # (P003_common/sequence_bank.py), or drawn now if there is none
+            self.trial_order, self.sequence_ID = banked_order("P003e",
+                                                              potential_trial_assignments,
+                                                              self.rng.order)
+        else:
+            self.trial_order = None # open-ended session (see first_ITI)
+
+        # Touch region label masks of every screen the session shows, so a
+        # peck is classified with one array lookup (P003_common/region_mask.py)
+        self.scene.prepare_masks(("background",),
+                                 ("background", "start_signal"),
+                                 ("background", "keys"))
+
+
     def place_birds_in_box(self):
         # This is the default screen run until the birds are placed into the
         # box and the space bar is pressed. It then proceedes to the ITI. It only
@@ -327,75 +494,56 @@ class MainScreen(object):
             # the first_ITI link, followed by a 30s pause before the first trial to 
             # let birds settle in and acclimate.
             print("Spacebar pressed -- SESSION STARTED") 
-            self.mastercanvas.delete("all")
+            print(f"Session seed: {self.rng.seed}")
+            self.clear_canvas()
             self.root.unbind("<space>")
             self.start_time = datetime.now() # Set start time
             self.trial_cue_color = None
             self.trial_type = "NA"
             
-            # First set up the path to the stimulus identity .csv document
-            stimuli_csv_path = getcwd() + "/P003E_stimuli_assignments.csv"
-                
-            # Import the used sample stimuli, their respective key assignments,
-            # and conditional assignments as a lists of dictionaries that are 
-            # structured as {'Name': 'C2_Phase1.bmp', 'Key': 'L', 'Group': 'E'}. 
-            # The list will be equal to the number of elements in the .csv file
-            # and doesn't actually take into account any of the literal files.
-            with open(stimuli_csv_path, 'r', encoding='utf-8-sig') as f:
-                dict_reader = DictReader(f) 
-                all_stimulus_assignment_list = list(dict_reader)
-        
-            
-            # After that, let's just pick out the stimuli for a single subject
-            for d in all_stimulus_assignment_list:
-                if d["Subject"] == self.subject_ID:
-                    all_stimulus_assignments_dict = d
-                    
-            # Next, pick out the specific stimuli colors for that specific 
-            # subject and phase. We can do this by making a dictionary of three
-            # entries for each bird: one for PAV, INS, and OMS
-            self.stimulus_assignments_dict = {}
-            for entry in all_stimulus_assignments_dict:
-                if entry.split("_")[0] == self.exp_phase_name:
-                    self.stimulus_assignments_dict[entry.split("_")[1]] = all_stimulus_assignments_dict[entry]
-
-            # Once we have the three stimuli colors for each bird and phase,
-            # we can order all the trials within a session. These should be
-            # quasi-randomly ordered, such that there were no more than three 
-            # of a single cue across consecutive trials (e.g., never PAV, PAV,
-            # PAV, PAV).
-            potential_trial_assignments = ["PAV", "INS", "OMS"] * (self.max_trials // 3) # This will be shuffled around...
-            self.trial_assignment_list = []
-
-            while len(self.trial_assignment_list) != self.max_trials:
-                shuffle(potential_trial_assignments) # shuffle
-                approved = True
-                c = 0  # counter
-                while c < len(potential_trial_assignments) and approved:
-                    if c > 3:
-                        a = potential_trial_assignments[c]
-                        if a == potential_trial_assignments[c-1] and a == potential_trial_assignments[c-2] and a == potential_trial_assignments[c-3]:
-                            approved = False
-                            break
-                    c += 1
-                # If passes with approved still true...
-                if approved:
-                    for i in potential_trial_assignments:
-                        self.trial_assignment_list.append(i)
-                    
+            # The stimuli and trial order were prepared before the spacebar
+            # (prepare_session); wait for them if they aren't ready yet
+            self.preload.result()
+
+            # Trials are handed out one at a time by a TrialPlan, which also
+            # knows the session limits (P003_common/trial_plan.py).
+            if self.trial_order is not None:
+                self.trial_plan = TrialPlan(order = self.trial_order,
+                                            max_minutes = self.max_session_minutes,
+                                            max_reinforcers = self.max_reinforcers,
+                                            clock = self.scheduler.clock)
+            else:
+                # Open-ended session (ends on time/reinforcers): trials come
+                # in blocks of 30 that are only drawn once they are needed
+                self.trial_plan = TrialPlan(rng = self.rng.order,
+                                            block = ["PAV", "INS", "OMS"] * 10,
+                                            max_minutes = self.max_session_minutes,
+                                            max_reinforcers = self.max_reinforcers,
+                                            clock = self.scheduler.clock)
+            print(self.trial_plan.summary())
+
+            # Reinforcement schedule of each trial type: PAV is always
+            # reinforced, INS/OMS are RR (see P003_common/schedules.py)
+            rr_sched = int(self.exp_phase_name[2:]) # 2, 5, or 20
+            self.schedules = {trial_type: schedule_for_code(trial_type, "RR", rr_sched)
+                              for trial_type in ["PAV", "INS", "OMS"]}
+
             # After the order of stimuli per trial is determined, we can start.
             # If running a test session, the duration of intervals can be 
             # lowered significantly to make more efficient
+            self.scheduler.restart() # The session timeline starts now
+            self.trial_plan.start() # ...and so does the session time limit
             if self.subject_ID == "TEST": # If test, don't worry about ITI delays
                 self.ITI_duration = 1000
                 self.hopper_duration = 1000
-                self.root.after(1000, self.ITI)
+                self.scheduler.after("session_start", 1000, self.ITI)
             else:
-                self.root.after(30000, self.ITI)
+                self.scheduler.after("session_start", 30000, self.ITI)
 
 
         # The runs first, setting up the spacebar trigger
         self.root.bind("<space>", first_ITI) # bind cursor state to "space" key
+        self.preload.show_status(self.root, self.mastercanvas) # ready indicator
         self.mastercanvas.create_text(512,374,
                                       fill="white",
                                       font="Times 25 italic bold",
@@ -414,17 +562,9 @@ class MainScreen(object):
         self.clear_canvas()
         
         # Make sure pecks during ITI are saved
-        self.mastercanvas.create_rectangle(0,0,
-                                           self.mainscreen_width,
-                                           self.mainscreen_height,
-                                           fill = "black",
-                                           outline = "black",
-                                           tag = "bkgrd")
-        self.mastercanvas.tag_bind("bkgrd",
-                                   "<Button-1>",
-                                   lambda event, 
-                                   event_type = "ITI_peck": 
-                                       self.write_data(event, event_type))
+        self.scene.show("background")
+        self.scene.on_press("bkgrd",
+                            lambda event: self.write_data(event, "ITI_peck"))
             
         # This turns all the stimuli off from the previous trial (during the
         # ITI). Needs to happen every ITI.
@@ -439,8 +579,9 @@ class MainScreen(object):
 
         # First, check to see if any session limits have been reached (e.g.,
         # if the max time or reinforcers earned limits are reached).
-        if self.current_trial_counter == self.max_trials:
-            print("Trial max reached")
+        stop_reason = self.trial_plan.stop_reason(self.current_trial_counter)
+        if stop_reason:
+            print(stop_reason)
             self.exit_program("event")
         
         # Else, after a timer move on to the next trial. Note that,
@@ -455,23 +596,25 @@ class MainScreen(object):
                                               text=f"ITI ({int(self.ITI_duration/1000)} sec.)")
                 
             # Reset other variables for the following trial.
-            self.trial_start = time() # Set trial start time (note that it includes the ITI, which is subtracted later)
+            self.trial_start = self.scheduler.anchor_time() # Set trial start time at this ITI's scheduled start (note that it includes the ITI, which is subtracted later)
             self.trial_peck_counter = 0 # Reset trial peck counter each trial
             self.background_peck_counter = 0 # Also reset background counter
             
             self.write_comp_data(False) # update data .csv with trial data from the previous trial
+            self.resource_monitor.sample(self.current_trial_counter) # canvas items, bindings, timers and objects (warns on growth)
+            print(self.reinforcement_tally.status()) # expected vs. observed reinforcers so far
             
-            # First pick the trial type from the prexisting list....
-            self.trial_type = self.trial_assignment_list[self.current_trial_counter - 1]
+            # First pick the trial type from the trial plan....
+            self.trial_type = self.trial_plan.next_trial().trial_type
    
             # Increase trial counter by one
             self.current_trial_counter += 1
             
             if self.current_trial_counter == 1:
-                self.root.after(self.ITI_duration, self.start_signal_period)
+                self.scheduler.after("ITI", self.ITI_duration, self.start_signal_period)
             else:
                 # Next, set a delay timer to proceed to the next trial
-                self.root.after(self.ITI_duration, self.build_keys)
+                self.scheduler.after("ITI", self.ITI_duration, self.build_keys)
                 
             # Finally, print terminal feedback "headers" for each event within the next trial
             print(f"\n{'*'*30} Trial {self.current_trial_counter} begins {'*'*30}") # Terminal feedback...
@@ -490,39 +633,20 @@ class MainScreen(object):
         # We need to turn on the houselight as soon as the trial starts
         if operant_box_version:
             rpi_board.write(house_light_GPIO_num, True) # Turn off house light
-        # Border...
-        self.mastercanvas.create_rectangle(0,0,
-                                           self.mainscreen_width,
-                                           self.mainscreen_height,
-                                           fill = "black",
-                                           outline = "black",
-                                           tag = "bkgrd")
-        # Make it a button
-        self.mastercanvas.tag_bind("bkgrd",
-                                   "<Button-1>",
-                                   lambda event: 
-                                       self.background_press(event))
-        
-        # Next build the actual cue
-        key_coord_list =  [416, 288, 608, 480]
-        self.mastercanvas.create_rectangle(key_coord_list,
-                                      outline = "black",
-                                      fill = "white",
-                                      tag = "key")
-
-        # Then bind a function to a key press!
-        self.mastercanvas.tag_bind("key",
-                                   "<Button-1>",
-                                   lambda event, 
-                                   event_type = "start_signal_press": 
-                                       self.start_signal_press(event, event_type))
-            
+        # Show the background and the start signal key (built once in
+        # build_scene), then make them buttons
+        self.scene.show("background", "start_signal")
+        self.scene.on_press("bkgrd", self.background_press)
+        self.scene.on_press("key",
+                            lambda event: self.start_signal_press(event, "start_signal_press"))
+
     def start_signal_press(self, event, event_type):
         # Write data for the peck
         self.write_data(event, event_type)
         self.clear_canvas()
-        # Proceed to the first trial after 1 s
-        self.root.after(1000, self.build_keys)
+        # Proceed to the first trial after 1 s (timed from this peck)
+        self.scheduler.restart()
+        self.scheduler.after("start_signal_delay", 1000, self.build_keys)
         
     
     """
@@ -548,76 +672,26 @@ class MainScreen(object):
         if operant_box_version:
             rpi_board.write(house_light_GPIO_num, True) # Turn off house light
         
-        # First, build the background. This basically builds a button the size of 
-        # screen to track any pecks; buttons built on top of this button will
-        # NOT count as background pecks but as key pecks, because the object is
-        # covering that part of the background. Once a peck is made, an event line
-        # is appended to the data matrix.
-        
-        # Border...
-        self.mastercanvas.create_rectangle(0,0,
-                                           self.mainscreen_width,
-                                           self.mainscreen_height,
-                                           fill = "black",
-                                           outline = "black",
-                                           tag = "bkgrd")
-        # Button...
-        self.mastercanvas.tag_bind("bkgrd",
-                                   "<Button-1>",
-                                   lambda event: 
-                                       self.background_press(event))
-        
-        # Coordinates for all the keys
-        # key_coord_list =  [384, 256, 640, 512]
-        key_coord_list =  [416, 288, 608, 480] # 75% = 192 d
-        #key_coord_list =  [448, 320, 576, 448] # 50% = 128 d
-        midpoint_diameter = 10
-        midpoint_coord_list = [
-            key_coord_list[0] + ((key_coord_list[2] - key_coord_list[0]) // 2) - (midpoint_diameter//2),
-            key_coord_list[1] + ((key_coord_list[3] - key_coord_list[1]) // 2) - (midpoint_diameter//2),
-            key_coord_list[0] + ((key_coord_list[2] - key_coord_list[0]) // 2) + (midpoint_diameter//2),
-            key_coord_list[1] + ((key_coord_list[3] - key_coord_list[1]) // 2) + (midpoint_diameter//2)
-            ]
-        
-        # Key outline around the key
-        outline_size = 20 # 25 pixels in every direction
-        outline_coords_list = [
-            key_coord_list[0] - outline_size,
-            key_coord_list[1] - outline_size,
-            key_coord_list[2] + outline_size,
-            key_coord_list[3] + outline_size
-            ]
-        
-        # First up, build the actual circle that is the key and will
-        # contain the stimulus. Order is important here, as shapes built
-        # on top of each other will overlap/cover each other.
-        
-        self.mastercanvas.create_oval(outline_coords_list, 
-                                      outline = "black",
-                                      fill = "black",
-                                      tag = "key")
-        
-        self.mastercanvas.create_oval(key_coord_list,
-                                      outline = "black",
-                                      fill = self.stimulus_assignments_dict[self.trial_type],
-                                      tag = "key")
-        # Then create the midpoint...
-        self.mastercanvas.create_oval(midpoint_coord_list,
-                                      fill = "black",
-                                      outline = "black",
-                                      tag = "key")
-        
-        # Then bind a function to each key press!
-        self.mastercanvas.tag_bind("key",
-                                   "<Button-1>",
-                                   lambda event, 
-                                   event_type = "key_peck": 
-                                       self.key_press(event, event_type))
+        # Show the background and the key (built once in build_scene) in
+        # this trial's stimulus color, then make them buttons
+        self.scene.show("background", "keys")
+        self.scene.configure(self.stimulus_item,
+                             fill = self.stimulus_assignments_dict[self.trial_type])
+        self.scene.on_press("bkgrd", self.background_press)
+        self.scene.on_press("key",
+                            lambda event: self.key_press(event, "key_peck"))
             
                     
+        # Flush the draw, then log when the stimulus actually went up and
+        # how long after its scheduled onset (see P003_common/timing.py)
+        self.root.update_idletasks()
+        self.onset_delay = self.scheduler.onset()
+        self.write_data(None, "stimulus_onset")
+        self.onset_delay = "NA"
+
         # Lastly, start a timer for the trial
-        self.trial_timer = self.root.after(self.trial_timer_duration,
-                                           self.calculate_trial_outcome)
+        self.trial_timer = self.scheduler.after("trial", self.trial_timer_duration,
+                                                self.calculate_trial_outcome)
     
     def key_press(self, event, event_type):
         # This is the function that is called whenever a key is pressed. It
@@ -643,31 +717,18 @@ class MainScreen(object):
         
         self.clear_canvas()
         
-        # Always reinforce PAV trials
-        if self.trial_type == "PAV":
-            reinforced = True
-        
-        # If INS/OMS trial, reinforcement is probabalistic
-        else:
-            # Starts out with preset reinforcement ideals...
-            if self.trial_type == "INS":
-                reinforced = False
-            elif self.trial_type == "OMS":
-                reinforced = True
-            
-            # Run a simulation of a dice being rolled...
-            rr_sched = int(self.exp_phase_name[2:]) # 2, 5, or 20
-            # Roll a die a number of times equal to the number of pecks
-            # recorded within that trial
-            for iteration in list(range(0, self.trial_peck_counter)): 
-                if choice(list(range(0, rr_sched))) == 0:
-                    if self.trial_type == "INS":
-                        reinforced = True
-                    elif self.trial_type == "OMS":
-                        reinforced = False
+        # PAV trials are always reinforced. INS/OMS trials are RR: the chance
+        # that at least one peck "hits" is 1 - (1 - 1/RR)^pecks, which is
+        # decided with a single draw (INS: reinforced on a hit; OMS:
+        # reinforcement is cancelled by a hit)
+        reinforced = self.schedules[self.trial_type].outcome(self.trial_peck_counter,
+                                                             self.rng.outcome)
+        self.reinforcement_tally.record(self.trial_type, self.schedules[self.trial_type],
+                                        self.trial_peck_counter, reinforced)
         
         # If a reinforcement is earned...
         if reinforced:
+            self.trial_plan.reinforcer_earned()
             self.write_data(None, "reinforced_trial")
             if not operant_box_version or self.subject_ID == "TEST":
                 self.mastercanvas.create_text(512,374,
@@ -684,7 +745,7 @@ class MainScreen(object):
                 rpi_board.set_servo_pulsewidth(servo_GPIO_num,
                                                hopper_up_val) # Move hopper to up position
             
-            self.root.after(self.hopper_duration, lambda: self.ITI())
+            self.scheduler.after("hopper", self.hopper_duration, self.ITI)
         
         # If not reinforced, just proceed to the ITI
         else:
@@ -711,15 +772,13 @@ class MainScreen(object):
     
     def clear_canvas(self):
          # This is by far the most called function across the program. It
-         # deletes all the objects currently on the Canvas. A finer point to 
-         # note here is that objects still exist onscreen if they are covered
-         # up (rendering them invisible and inaccessible); if too many objects
-         # are stacked upon each other, it can may be too difficult to track/
-         # project at once (especially if many of the objects have functions 
-         # tied to them. Therefore, its important to frequently clean up the 
-         # Canvas by literally deleting every element.
+         # hides everything in the scene (see build_scene) so nothing can be
+         # seen or pecked, and deletes anything else drawn on the Canvas
+         # (e.g., onscreen feedback text). The scene's items are only
+         # hidden, not deleted, so the next phase just shows them again
+         # instead of rebuilding them.
         try:
-            self.mastercanvas.delete("all")
+            self.scene.clear()
         except TclError:
             print("No screen to exit")
         
@@ -775,6 +834,9 @@ class MainScreen(object):
                 x, y = event.x, event.y
             else: # There are certain data events that are not pecks.
                 x, y = "NA", "NA"   
+
+            # Tk's own timestamp of the touch vs. when this callback actually ran
+            event_time, queue_delay = self.touch_latency_log.record(event)
                 
             print(f"{outcome:>30} | x: {x: ^3} y: {y:^3} | {self.trial_type:^5} | {str(datetime.now() - self.start_time)}")
             # print(f"{outcome:>30} | x: {x: ^3} y: {y:^3} | Target: {self.current_target_location: ^2} | {str(datetime.now() - self.start_time)}")
@@ -791,13 +853,20 @@ class MainScreen(object):
                 self.stimulus_assignments_dict[self.trial_type], # Trial color
                 self.subject_ID, # Name of subject (same across datasheet)
                 self.exp_phase_name, # Phase name (e.g., RR2)
-                date.today() # Today's date as "MM-DD-YYYY"
+                date.today(), # Today's date as "MM-DD-YYYY"
+                event_time, # Tk server timestamp of the touch (ms)
+                queue_delay, # Time the touch waited in the Tk event queue (ms)
+                self.rng.seed, # Session seed (regenerates trial order and outcomes)
+                self.sequence_ID, # Trial order ID in the sequence bank ("NA" if generated live)
+                getattr(event, "region", "NA"), # Region (touch region, see build_scene)
+                self.onset_delay # OnsetDelay (ms, stimulus onset after its scheduled time; onset row only)
                 ])
         
             header_list = ["SessionTime", "Xcord","Ycord", "Event", "TrialTime", 
                            "TrialType","TargetPeckNum", "BackgroundPeckNum",
                            "TrialNum", "TrialColor", "Subject", "ExpPhase",
-                           "Date"] # Column headers
+                           "Date", "TouchEventTime", "QueueDelay",
+                           "SessionSeed", "SequenceID", "Region", "OnsetDelay"] # Column headers
 
         
     def write_comp_data(self, SessionEnded):
@@ -810,6 +879,10 @@ class MainScreen(object):
         # write over the existing document.
         if SessionEnded:
             self.write_data(None, "SessionEnds") # Writes end of session to df
+            print(self.touch_latency_log.summary())
+            print(self.scheduler.summary())
+            print(self.resource_monitor.summary())
+            print(self.reinforcement_tally.summary())
         if self.record_data : # If experimenter has choosen to automatically record data in seperate sheet:
             myFile_loc = f"{self.data_folder_directory}/{self.subject_ID}/{self.subject_ID}_{self.start_time.strftime('%Y-%m-%d_%H.%M.%S')}_P003e_data-Phase-{self.exp_phase_name}.csv" # location of written .csv
             # This loop writes the data in the matrix to the .csv              
@@ -818,6 +891,11 @@ class MainScreen(object):
                 w = writer(myFile, quoting=QUOTE_MINIMAL)
                 w.writerows(self.session_data_frame) # Write all event/trial data 
             print(f"\n- Data file written to {myFile_loc}")
+            if SessionEnded: # Per-session touch-delay histogram, phase timing log and reinforcement check
+                self.touch_latency_log.write_histogram(side_file_loc(myFile_loc, "touch-latency"))
+                self.scheduler.write_phase_log(side_file_loc(myFile_loc, "phase-timing"))
+                self.resource_monitor.write(side_file_loc(myFile_loc, "resources"))
+                self.reinforcement_tally.write(side_file_loc(myFile_loc, "reinforcement-check"))
                 
 #%% Finally, this is the code that actually runs:
 try:   
@@ -39,8 +39,20 @@ from tkinter import Toplevel, Canvas, BOTH, TclError, Tk, Label, Button, \
      StringVar, OptionMenu, IntVar, Radiobutton
 from time import time, sleep
 from os import getcwd, popen, mkdir, path as os_path
-from random import choice, shuffle
-from PIL import ImageTk, Image  
+
+# Shared P003 helpers live in the P003_common folder, one level up from this
+# script's folder (e.g., ~/Desktop/Experiments/P003/P003_common/)
+sys_path.insert(0, os_path.dirname(os_path.dirname(os_path.abspath(__file__))))
+from P003_common.timing import TouchLatencyLog, DeadlineScheduler
+from P003_common.data_files import side_file_loc
+from P003_common.scene import CanvasScene, Disc, Rect
+from P003_common.preload import SessionPreload
+from P003_common.resources import ResourceMonitor
+from P003_common.patches import COMPASS, compass_layout, PatchGrid
+from P003_common.randomness import SessionRNG
+from P003_common.schedules import schedule_for_code, ReinforcementTally
+from P003_common.sequences import TransitionBalance
+from P003_common.sequence_bank import banked_order
 
 # The first variable declared is whether the program is the operant box version
 # for pigeons, or the test version for humans to view. The variable below is 
@@ -237,7 +249,8 @@ class MainScreen(object):
     # called within the initial __init__() function that is 
     # run when the object is first built:
     
-    def __init__(self, subject_ID, record_data, data_folder_directory):
+    def __init__(self, subject_ID, record_data, data_folder_directory,
+                 session_seed=None, hidden_patch_count=1):
         ## Firstly, we need to set up all the variables passed from within
         # the control panel object to this MainScreen object. We do this 
         # by setting each argument as "self." objects to make them global
@@ -254,6 +267,12 @@ class MainScreen(object):
         self.subject_ID = subject_ID
         self.record_data = record_data
         
+        # Number of hidden patch locations used at once (1 to 8; picked at
+        # the spacebar, see build_scene). Checked before anything is built
+        if not isinstance(hidden_patch_count, int) or not 1 <= hidden_patch_count <= len(COMPASS):
+            raise ValueError(f"hidden_patch_count must be 1 to {len(COMPASS)}, not {hidden_patch_count!r}")
+        self.hidden_patch_count = hidden_patch_count
+        
         ## Set up the visual Canvas
         self.root = Toplevel()
         self.root.title(f"P003f: Spatial Variability") # this is the title of the window
@@ -309,14 +328,209 @@ class MainScreen(object):
         header_list = ["SessionTime", "Xcord","Ycord", "Event", "TrialTime", 
                        "TrialType","TargetPeckNum", "BackgroundPeckNum",
                        "TrialNum", "TrialColor", "Subject",
-                       "HiddenPatch", "Date"] # Column headers
+                       "HiddenPatch", "Date", "TouchEventTime", "QueueDelay",
+                       "SessionSeed", "SequenceID", "Region", "OnsetDelay"] # Column headers
         self.session_data_frame.append(header_list) # First row of matrix is the column headers
         self.date = date.today().strftime("%y-%m-%d")
         self.myFile_loc = 'FILL' # To be filled later on after Pig. ID is provided (in set vars func below)
+        self.touch_latency_log = TouchLatencyLog() # Tk event-queue delay of every touch
+        self.scheduler = DeadlineScheduler(self.root, lambda: self.current_trial_counter) # drift-free phase timers
+        self.rng = SessionRNG(session_seed) # seeded RNG streams for this session (seed is logged)
+        self.reinforcement_tally = ReinforcementTally() # expected vs. observed reinforcers (printed every ITI and at session end)
+        self.onset_delay = "NA" # ms the stimulus went up after its scheduled onset (stimulus_onset row only)
+        self.sequence_ID = "NA" # ID of the trial order in the sequence bank (set in first_ITI)
+
+        self.build_scene() # every canvas item of the session, built once (hidden)
+        self.resource_monitor = ResourceMonitor(self.root, self.mastercanvas, self.scene,
+                                                kept = lambda: len(self.session_data_frame) + len(self.scheduler.phase_log)) # per-trial leak check
+
+        self.preload = SessionPreload(self.prepare_session) # stimuli and trial order, prepared before the spacebar
 
         ## Finally, start the recursive loop that runs the program:
         self.place_birds_in_box()
 
+    def build_scene(self):
+        # Builds every item the Canvas uses during the session once, hidden
+        # (see P003_common/scene.py). The ITI, start signal and trials then
+        # only show the groups they need and swap the stimulus color, instead
+        # of deleting and rebuilding everything (and re-binding each tag)
+        # every time. Order is important here, as shapes built on top of each
+        # other will overlap/cover each other.
+        self.scene = CanvasScene(self.mastercanvas)
+        
+        # First, the background. This basically is a button the size of 
+        # screen to track any pecks; buttons built on top of this button will
+        # NOT count as background pecks but as key pecks, because the object is
+        # covering that part of the background.
+        self.scene.add("background",
+                       self.mastercanvas.create_rectangle(0,0,
+                                                          self.mainscreen_width,
+                                                          self.mainscreen_height,
+                                                          fill = "black",
+                                                          outline = "black",
+                                                          tag = "bkgrd"))
+        
+        # The start signal key (a white square)
+        self.scene.add("start_signal",
+                       self.mastercanvas.create_rectangle([416, 288, 608, 480],
+                                                          outline = "black",
+                                                          fill = "white",
+                                                          tag = "key"))
+        
+        # Coordinates for all the keys
+        # key_coord_list =  [384, 256, 640, 512]
+        key_coord_list =  [416, 288, 608, 480] # 75% = 192 d
+        #key_coord_list =  [448, 320, 576, 448] # 50% = 128 d
+        midpoint_diameter = 10
+        midpoint_coord_list = [
+            key_coord_list[0] + ((key_coord_list[2] - key_coord_list[0]) // 2) - (midpoint_diameter//2),
+            key_coord_list[1] + ((key_coord_list[3] - key_coord_list[1]) // 2) - (midpoint_diameter//2),
+            key_coord_list[0] + ((key_coord_list[2] - key_coord_list[0]) // 2) + (midpoint_diameter//2),
+            key_coord_list[1] + ((key_coord_list[3] - key_coord_list[1]) // 2) + (midpoint_diameter//2)
+            ]
+        
+        # Key outline around the key
+        outline_size = 20 # 25 pixels in every direction
+        outline_coords_list = [
+            key_coord_list[0] - outline_size,
+            key_coord_list[1] - outline_size,
+            key_coord_list[2] + outline_size,
+            key_coord_list[3] + outline_size
+            ]
+        
+        # First up, build the actual circle that is the key and will
+        # contain the stimulus.
+        self.scene.add("keys",
+                       self.mastercanvas.create_oval(outline_coords_list, 
+                                                     outline = "black",
+                                                     fill = "black",
+                                                     tag = "key"))
+        
+        # The key itself (its fill is the trial's stimulus color, set each
+        # trial in build_keys)
+        self.stimulus_item = self.scene.add("keys",
+                                            self.mastercanvas.create_oval(key_coord_list,
+                                                                          outline = "black",
+                                                                          fill = "black",
+                                                                          tag = "key"))
+        
+        # Then the midpoint
+        self.scene.add("keys",
+                       self.mastercanvas.create_oval(midpoint_coord_list,
+                                                     fill = "black",
+                                                     outline = "black",
+                                                     tag = "key"))
+        
+        # Lastly, the hidden patch (just for funsies for now). Its eight
+        # possible locations (north, north-east, ..., north-west) are worked
+        # out and checked once here (see P003_common/patches.py), each with
+        # its own canvas item; the session's location(s) are picked at the
+        # spacebar (place_hidden_patches)
+        key_center_x = (key_coord_list[0] + key_coord_list[2]) / 2
+        key_center_y = (key_coord_list[1] + key_coord_list[3]) / 2
+        key_radius = (key_coord_list[2] - key_coord_list[0]) / 2
+        key_outline = Disc(key_center_x, key_center_y, key_radius + outline_size)
+        self.hidden_patch_layout = compass_layout((self.mainscreen_width // 2, self.mainscreen_height // 2),
+                                                  distance = 300, # px from the center, on each axis
+                                                  size = 100,
+                                                  avoid = [key_outline])
+        for location, rect in self.hidden_patch_layout.items():
+            self.scene.add(f"hidden_patch:{location}",
+                           self.mastercanvas.create_rectangle(rect.x1, rect.y1, rect.x2, rect.y2,
+                                                              outline = "black",
+                                                              fill = "black",
+                                                              tag = "hidden_patch"))
+        self.hidden_patch_locations = [] # set in place_hidden_patches
+        self.hidden_patches = PatchGrid({}) # (idem)
+
+        # Touch regions, checked in this order (see P003_common/scene.py):
+        # pecks are classified by these shapes, not by which item is on top
+        self.scene.add_region("start_signal", "start_signal", Rect(416, 288, 608, 480), "key")
+        self.scene.add_region("keys", "key_midpoint", Disc(key_center_x, key_center_y, midpoint_diameter / 2), "key")
+        self.scene.add_region("keys", "key_disc", Disc(key_center_x, key_center_y, key_radius), "key")
+        self.scene.add_region("keys", "key_outline", key_outline, "key")
+        self.scene.add_region("hidden_patch", "hidden_patch", self.hidden_patches, "hidden_patch")
+        self.scene.add_region("background", "background",
+                              Rect(0, 0, self.mainscreen_width, self.mainscreen_height), "bkgrd")
+    
+    def prepare_session(self):
+        # Everything the session needs that only depends on the subject and
+        # condition: stimulus colors and trial order. It runs on a worker thread,
+        # started at the end of __init__ while the bird is put in the box
+        # (see P003_common/preload.py), so nothing here may touch Tk.
+        # first_ITI waits for it and then picks the hidden patch.
+
+        # First set up the path to the stimulus identity .csv document
+        stimuli_csv_path = getcwd() + "/P003F_stimuli_assignments.csv"
+            
+        # Import the used sample stimuli, their respective key assignments,
+        # and conditional assignments as a lists of dictionaries that are 
+        # structured as {'Name': 'C2_Phase1.bmp', 'Key': 'L', 'Group': 'E'}. 
+        # The list will be equal to the number of elements in the .csv file
+        # and doesn't actually take into account any of the literal files.
+        with open(stimuli_csv_path, 'r', encoding='utf-8-sig') as f:
+            dict_reader = DictReader(f) 
+            all_stimulus_assignment_list = list(dict_reader)
+    
+        
+        # After that, let's just pick out the stimuli for a single subject
+        for d in all_stimulus_assignment_list:
+            if d["Subject"] == self.subject_ID:
+                all_stimulus_assignments_dict = d
+                
+        # Next, pick out the specific stimuli colors for that specific 
+        # subject and phase. We can do this by making a dictionary of three
+        # entries for each bird: one for PAV, INS, and OMS
+        # Extract all stimuli assignments for the subject (no exp_phase_name filtering)
+        self.stimulus_assignments_dict = {}
+        for entry in all_stimulus_assignments_dict:
+            if entry != "Subject":  # Skip subject column
+                self.stimulus_assignments_dict[entry] = all_stimulus_assignments_dict[entry]
+
+        # Once we have the three stimuli colors for each bird and phase,
+        # we can order all the trials within a session. These should be
+        # quasi-randomly ordered, such that there were no more than three 
+        # of a single cue across consecutive trials (e.g., never PAV, PAV,
+        # PAV, PAV).
+        potential_trial_assignments = ["INS_2", "INS_5", "INS_20",
+                                       "OMS_2", "OMS_5", "OMS_20",
+                                       "PAV",
+                                       "EXT"] * (20) # This will be shuffled around...
+
+        # No more than 3 trials of the same type (INS, OMS, PAV, EXT) in a
+        # row, regardless of FR value. Within 4 blocks of 40 trials, the
+        # order is also balanced so every trial code follows every other
+        # about as often as expected (see P003_common/sequences.py). It
+        # is picked from a bank of pre-generated orders (or drawn now if
+        # there is none; P003_common/sequence_bank.py).
+        trial_order, self.sequence_ID = banked_order("P003f",
+                                                     potential_trial_assignments,
+                                                     self.rng.order)
+        self.trial_assignment_list = trial_order[:self.max_trials]
+        self.transition_balance = TransitionBalance(self.trial_assignment_list)
+
+        # Touch region label masks of every screen the session shows, so a
+        # peck is classified with one array lookup (P003_common/region_mask.py)
+        self.scene.prepare_masks(("background",),
+                                 ("background", "start_signal"),
+                                 ("background", "keys"))
+        # The trial screen with the hidden patch at each of its locations
+        # (sessions with several patches at once find theirs with the
+        # patches' grid instead)
+        for location, rect in self.hidden_patch_layout.items():
+            self.scene.prepare_mask(("background", "keys", "hidden_patch"),
+                                    hidden_patch = PatchGrid({location: rect}))
+
+
+    def place_hidden_patches(self, locations):
+        # Makes the patches at locations the session's hidden patches: they
+        # are shown each trial, and a peck on them is matched through their
+        # grid (which also counts the pecks on each)
+        self.hidden_patch_locations = list(locations)
+        self.hidden_patches = PatchGrid({location: self.hidden_patch_layout[location]
+                                         for location in self.hidden_patch_locations})
+        self.scene.reshape("hidden_patch", self.hidden_patches)
+
     def place_birds_in_box(self):
         # This is the default screen run until the birds are placed into the
         # box and the space bar is pressed. It then proceedes to the ITI. It only
@@ -329,88 +543,46 @@ class MainScreen(object):
             # the first_ITI link, followed by a 30s pause before the first trial to 
             # let birds settle in and acclimate.
             print("Spacebar pressed -- SESSION STARTED") 
-            self.mastercanvas.delete("all")
+            self.clear_canvas()
             self.root.unbind("<space>")
             self.start_time = datetime.now() # Set start time
             self.trial_cue_color = None
             self.trial_type = "NA"
             
-            # First set up the path to the stimulus identity .csv document
-            stimuli_csv_path = getcwd() + "/P003F_stimuli_assignments.csv"
-                
-            # Import the used sample stimuli, their respective key assignments,
-            # and conditional assignments as a lists of dictionaries that are 
-            # structured as {'Name': 'C2_Phase1.bmp', 'Key': 'L', 'Group': 'E'}. 
-            # The list will be equal to the number of elements in the .csv file
-            # and doesn't actually take into account any of the literal files.
-            with open(stimuli_csv_path, 'r', encoding='utf-8-sig') as f:
-                dict_reader = DictReader(f) 
-                all_stimulus_assignment_list = list(dict_reader)
-        
-            
-            # After that, let's just pick out the stimuli for a single subject
-            for d in all_stimulus_assignment_list:
-                if d["Subject"] == self.subject_ID:
-                    all_stimulus_assignments_dict = d
+            # The stimuli and trial order were prepared before the spacebar
+            # (prepare_session); wait for them if they aren't ready yet
+            self.preload.result()
+            print(f"Session seed: {self.rng.seed}")
+            print(self.transition_balance.summary())
                     
-            # Next, pick out the specific stimuli colors for that specific 
-            # subject and phase. We can do this by making a dictionary of three
-            # entries for each bird: one for PAV, INS, and OMS
-            # Extract all stimuli assignments for the subject (no exp_phase_name filtering)
-            self.stimulus_assignments_dict = {}
-            for entry in all_stimulus_assignments_dict:
-                if entry != "Subject":  # Skip subject column
-                    self.stimulus_assignments_dict[entry] = all_stimulus_assignments_dict[entry]
-
-            # Once we have the three stimuli colors for each bird and phase,
-            # we can order all the trials within a session. These should be
-            # quasi-randomly ordered, such that there were no more than three 
-            # of a single cue across consecutive trials (e.g., never PAV, PAV,
-            # PAV, PAV).
-            potential_trial_assignments = ["INS_2", "INS_5", "INS_20",
-                                           "OMS_2", "OMS_5", "OMS_20",
-                                           "PAV",
-                                           "EXT"] * (20) # This will be shuffled around...
-            self.trial_assignment_list = []
-
-            # Shuffle and enforce the rule that no trial type appears more than 3 times in a row
-            while len(self.trial_assignment_list) != self.max_trials:
-                shuffle(potential_trial_assignments)  # Randomize the trial order
-                approved = True
-                c = 0  # Counter
-    
-                while c < len(potential_trial_assignments) and approved:
-                    if c >= 3:
-                        # Ensure no more than 3 consecutive trials of the same type
-                        a = potential_trial_assignments[c].split("_")[0]
-                        a1 = potential_trial_assignments[c-1].split("_")[0]
-                        a2 = potential_trial_assignments[c-2].split("_")[0]
-                        a3 = potential_trial_assignments[c-3].split("_")[0]
-                        if a == a1 and a == a2 and a == a3:
-                            approved = False
-                            break
-                    c += 1
-
-                # If valid, store as session trial order
-                if approved:
-                    self.trial_assignment_list = potential_trial_assignments[:self.max_trials]
                     
-            # Select hidden patch
-            self.hidden_patch_location = choice(["north", "north-east", "east", "south-east", "south", "south-west", "west", "north-west"])
+            # Select hidden patch(es)
+            locations = list(self.hidden_patch_layout)
+            if self.hidden_patch_count == 1:
+                self.place_hidden_patches([self.rng.order.choice(locations)])
+            else:
+                self.place_hidden_patches(self.rng.order.sample(locations, self.hidden_patch_count))
                         
+            # Reinforcement schedule of each trial code: PAV always, EXT
+            # never, INS_n/OMS_n are RRn (see P003_common/schedules.py)
+            self.schedules = {code: schedule_for_code(code, "RR")
+                              for code in set(self.trial_assignment_list)}
+
             # After the order of stimuli per trial is determined, we can start.
             # If running a test session, the duration of intervals can be 
             # lowered significantly to make more efficient
+            self.scheduler.restart() # The session timeline starts now
             if self.subject_ID == "TEST": # If test, don't worry about ITI delays
                 self.ITI_duration = 1000
                 self.hopper_duration = 1000
-                self.root.after(1000, self.ITI)
+                self.scheduler.after("session_start", 1000, self.ITI)
             else:
-                self.root.after(30000, self.ITI)
+                self.scheduler.after("session_start", 30000, self.ITI)
 
 
         # The runs first, setting up the spacebar trigger
         self.root.bind("<space>", first_ITI) # bind cursor state to "space" key
+        self.preload.show_status(self.root, self.mastercanvas) # ready indicator
         self.mastercanvas.create_text(512,374,
                                       fill="white",
                                       font="Times 25 italic bold",
@@ -429,17 +601,9 @@ class MainScreen(object):
         self.clear_canvas()
         
         # Make sure pecks during ITI are saved
-        self.mastercanvas.create_rectangle(0,0,
-                                           self.mainscreen_width,
-                                           self.mainscreen_height,
-                                           fill = "black",
-                                           outline = "black",
-                                           tag = "bkgrd")
-        self.mastercanvas.tag_bind("bkgrd",
-                                   "<Button-1>",
-                                   lambda event, 
-                                   event_type = "ITI_peck": 
-                                       self.write_data(event, event_type))
+        self.scene.show("background")
+        self.scene.on_press("bkgrd",
+                            lambda event: self.write_data(event, "ITI_peck"))
             
         # This turns all the stimuli off from the previous trial (during the
         # ITI). Needs to happen every ITI.
@@ -470,12 +634,14 @@ class MainScreen(object):
                                               text=f"ITI ({int(self.ITI_duration/1000)} sec.)")
                 
             # Reset other variables for the following trial.
-            self.trial_start = time() # Set trial start time (note that it includes the ITI, which is subtracted later)
+            self.trial_start = self.scheduler.anchor_time() # Set trial start time at this ITI's scheduled start (note that it includes the ITI, which is subtracted later)
             self.trial_peck_counter = 0 # Reset trial peck counter each trial
             self.background_peck_counter = 0 # Also reset background counter
             self.hidden_patch_peck_counter = 0 # And hidden patch trials
             
             self.write_comp_data(False) # update data .csv with trial data from the previous trial
+            self.resource_monitor.sample(self.current_trial_counter) # canvas items, bindings, timers and objects (warns on growth)
+            print(self.reinforcement_tally.status()) # expected vs. observed reinforcers so far
             
             # First pick the trial type from the prexisting list....
             self.trial_type = self.trial_assignment_list[self.current_trial_counter]
@@ -484,10 +650,10 @@ class MainScreen(object):
             self.current_trial_counter += 1
             
             if self.current_trial_counter == 1:
-                self.root.after(self.ITI_duration, self.start_signal_period)
+                self.scheduler.after("ITI", self.ITI_duration, self.start_signal_period)
             else:
                 # Next, set a delay timer to proceed to the next trial
-                self.root.after(self.ITI_duration, self.build_keys)
+                self.scheduler.after("ITI", self.ITI_duration, self.build_keys)
                 
             # Finally, print terminal feedback "headers" for each event within the next trial
             print(f"\n{'*'*30} Trial {self.current_trial_counter} begins {'*'*30}") # Terminal feedback...
@@ -506,39 +672,20 @@ class MainScreen(object):
         # We need to turn on the houselight as soon as the trial starts
         if operant_box_version:
             rpi_board.write(house_light_GPIO_num, True) # Turn off house light
-        # Border...
-        self.mastercanvas.create_rectangle(0,0,
-                                           self.mainscreen_width,
-                                           self.mainscreen_height,
-                                           fill = "black",
-                                           outline = "black",
-                                           tag = "bkgrd")
-        # Make it a button
-        self.mastercanvas.tag_bind("bkgrd",
-                                   "<Button-1>",
-                                   lambda event: 
-                                       self.background_press(event))
-        
-        # Next build the actual cue
-        key_coord_list =  [416, 288, 608, 480]
-        self.mastercanvas.create_rectangle(key_coord_list,
-                                      outline = "black",
-                                      fill = "white",
-                                      tag = "key")
-
-        # Then bind a function to a key press!
-        self.mastercanvas.tag_bind("key",
-                                   "<Button-1>",
-                                   lambda event, 
-                                   event_type = "start_signal_press": 
-                                       self.start_signal_press(event, event_type))
-            
+        # Show the background and the start signal key (built once in
+        # build_scene), then make them buttons
+        self.scene.show("background", "start_signal")
+        self.scene.on_press("bkgrd", self.background_press)
+        self.scene.on_press("key",
+                            lambda event: self.start_signal_press(event, "start_signal_press"))
+
     def start_signal_press(self, event, event_type):
         # Write data for the peck
         self.write_data(event, event_type)
         self.clear_canvas()
-        # Proceed to the first trial after 1 s
-        self.root.after(1000, self.build_keys)
+        # Proceed to the first trial after 1 s (timed from this peck)
+        self.scheduler.restart()
+        self.scheduler.after("start_signal_delay", 1000, self.build_keys)
         
     
     """
@@ -564,134 +711,30 @@ class MainScreen(object):
         if operant_box_version:
             rpi_board.write(house_light_GPIO_num, True) # Turn off house light
         
-        # First, build the background. This basically builds a button the size of 
-        # screen to track any pecks; buttons built on top of this button will
-        # NOT count as background pecks but as key pecks, because the object is
-        # covering that part of the background. Once a peck is made, an event line
-        # is appended to the data matrix.
-        
-        # Border...
-        self.mastercanvas.create_rectangle(0,0,
-                                           self.mainscreen_width,
-                                           self.mainscreen_height,
-                                           fill = "black",
-                                           outline = "black",
-                                           tag = "bkgrd")
-        # Button...
-        self.mastercanvas.tag_bind("bkgrd",
-                                   "<Button-1>",
-                                   lambda event: 
-                                       self.background_press(event))
-        
-        # Coordinates for all the keys
-        # key_coord_list =  [384, 256, 640, 512]
-        key_coord_list =  [416, 288, 608, 480] # 75% = 192 d
-        #key_coord_list =  [448, 320, 576, 448] # 50% = 128 d
-        midpoint_diameter = 10
-        midpoint_coord_list = [
-            key_coord_list[0] + ((key_coord_list[2] - key_coord_list[0]) // 2) - (midpoint_diameter//2),
-            key_coord_list[1] + ((key_coord_list[3] - key_coord_list[1]) // 2) - (midpoint_diameter//2),
-            key_coord_list[0] + ((key_coord_list[2] - key_coord_list[0]) // 2) + (midpoint_diameter//2),
-            key_coord_list[1] + ((key_coord_list[3] - key_coord_list[1]) // 2) + (midpoint_diameter//2)
-            ]
-        
-        # Key outline around the key
-        outline_size = 20 # 25 pixels in every direction
-        outline_coords_list = [
-            key_coord_list[0] - outline_size,
-            key_coord_list[1] - outline_size,
-            key_coord_list[2] + outline_size,
-            key_coord_list[3] + outline_size
-            ]
-        
-        # First up, build the actual circle that is the key and will
-        # contain the stimulus. Order is important here, as shapes built
-        # on top of each other will overlap/cover each other.
-        
-        self.mastercanvas.create_oval(outline_coords_list, 
-                                      outline = "black",
-                                      fill = "black",
-                                      tag = "key")
-        
-        self.mastercanvas.create_oval(key_coord_list,
-                                      outline = "black",
-                                      fill = self.stimulus_assignments_dict[self.trial_type],
-                                      tag = "key")
-        # Then create the midpoint...
-        self.mastercanvas.create_oval(midpoint_coord_list,
-                                      fill = "black",
-                                      outline = "black",
-                                      tag = "key")
-        
-        # Then bind a function to each key press!
-        self.mastercanvas.tag_bind("key",
-                                   "<Button-1>",
-                                   lambda event, 
-                                   event_type = "key_peck": 
-                                       self.key_press(event, event_type))
-            
-        # After all our onscreen stimuli are built, add in the hidden patch (just for funsies for now)
-        x_screen_midpoint = self.mainscreen_width // 2
-        y_screen_midpoint = self.mainscreen_height // 2
-        hidden_patch_size = 100
-        hidden_patch_distance_from_center = 300
-        
-        # X1, Y1, X2, Y2
-        hidden_patch_coordinate_dict = {
-            "north": [x_screen_midpoint - (hidden_patch_size/2),
-                      y_screen_midpoint - hidden_patch_distance_from_center - (hidden_patch_size/2),
-                      x_screen_midpoint + (hidden_patch_size/2),
-                      y_screen_midpoint - hidden_patch_distance_from_center + (hidden_patch_size/2)],
-            "north-east": [x_screen_midpoint + hidden_patch_distance_from_center - (hidden_patch_size/2),
-                      y_screen_midpoint - hidden_patch_distance_from_center - (hidden_patch_size/2),
-                      x_screen_midpoint + hidden_patch_distance_from_center + (hidden_patch_size/2),
-                      y_screen_midpoint - hidden_patch_distance_from_center + (hidden_patch_size/2)],
-            "east" : [x_screen_midpoint + hidden_patch_distance_from_center - (hidden_patch_size/2),
-                      y_screen_midpoint - (hidden_patch_size/2),
-                      x_screen_midpoint + hidden_patch_distance_from_center + (hidden_patch_size/2),
-                      y_screen_midpoint + (hidden_patch_size/2)],
-            "south-east": [x_screen_midpoint + hidden_patch_distance_from_center - (hidden_patch_size/2),
-               y_screen_midpoint + hidden_patch_distance_from_center - (hidden_patch_size/2),
-               x_screen_midpoint + hidden_patch_distance_from_center + (hidden_patch_size/2),
-               y_screen_midpoint + hidden_patch_distance_from_center + (hidden_patch_size/2)],
-            "south": [x_screen_midpoint - (hidden_patch_size/2),
-                      y_screen_midpoint + hidden_patch_distance_from_center + (hidden_patch_size/2),
-                      x_screen_midpoint + (hidden_patch_size/2),
-                      y_screen_midpoint + hidden_patch_distance_from_center - (hidden_patch_size/2)],
-            "south-west": [x_screen_midpoint - hidden_patch_distance_from_center - (hidden_patch_size/2),
-               y_screen_midpoint + hidden_patch_distance_from_center - (hidden_patch_size/2),
-               x_screen_midpoint - hidden_patch_distance_from_center + (hidden_patch_size/2),
-               y_screen_midpoint + hidden_patch_distance_from_center + (hidden_patch_size/2)],
-            "west" : [x_screen_midpoint - hidden_patch_distance_from_center - (hidden_patch_size/2),
-                      y_screen_midpoint - (hidden_patch_size/2),
-                      x_screen_midpoint - hidden_patch_distance_from_center + (hidden_patch_size/2),
-                      y_screen_midpoint + (hidden_patch_size/2)],
-            "north-west": [x_screen_midpoint - hidden_patch_distance_from_center - (hidden_patch_size/2),
-               y_screen_midpoint - hidden_patch_distance_from_center - (hidden_patch_size/2),
-               x_screen_midpoint - hidden_patch_distance_from_center + (hidden_patch_size/2),
-               y_screen_midpoint - hidden_patch_distance_from_center + (hidden_patch_size/2)],
-            
-        
-            
-            } # i put everyrhing in order you're welcome Cyrus 
+        # Show the background and the key (built once in build_scene) in
+        # this trial's stimulus color, then make them buttons
+        self.scene.show("background", "keys")
+        self.scene.configure(self.stimulus_item,
+                             fill = self.stimulus_assignments_dict[self.trial_type])
+        self.scene.on_press("bkgrd", self.background_press)
+        self.scene.on_press("key",
+                            lambda event: self.key_press(event, "key_peck"))
             
-        # self.hidden_patch_location = "north-east"  # Delete me when done (don't forget to update list above with all the direction names)
-        hidden_patch_coords = hidden_patch_coordinate_dict[self.hidden_patch_location]
-        
-        self.mastercanvas.create_rectangle(hidden_patch_coords, 
-                                           outline = "black",
-                                           fill = "black",
-                                           tag = "hidden_patch")
-                    
-        # Then bind a function to each key press!
-        self.mastercanvas.tag_bind("hidden_patch",
-                                   "<Button-1>",
-                                   lambda event: 
-                                       self.hidden_patch_press(event))
+        # The hidden patch(es) (always black) go on too
+        self.scene.show("hidden_patch",
+                        *(f"hidden_patch:{location}" for location in self.hidden_patch_locations))
+        self.scene.on_press("hidden_patch", self.hidden_patch_press)
                     
+        # Flush the draw, then log when the stimulus actually went up and
+        # how long after its scheduled onset (see P003_common/timing.py)
+        self.root.update_idletasks()
+        self.onset_delay = self.scheduler.onset()
+        self.write_data(None, "stimulus_onset")
+        self.onset_delay = "NA"
+
         # Lastly, start a timer for the trial
-        self.trial_timer = self.root.after(self.trial_timer_duration,
-                                           self.calculate_trial_outcome)
+        self.trial_timer = self.scheduler.after("trial", self.trial_timer_duration,
+                                                self.calculate_trial_outcome)
     
     def key_press(self, event, event_type):
         # This is the function that is called whenever a key is pressed. It
@@ -714,8 +757,8 @@ class MainScreen(object):
         # This is the function that is called whenever the hidden patch is
         # pressed. It simply increments the counter and writes a line of data.
         self.hidden_patch_peck_counter += 1
-        # Write data for the peck
-        self.write_data(event, "hidden_patch_peck", self.hidden_patch_location)
+        # Write data for the peck, with the patch that was pecked
+        self.write_data(event, "hidden_patch_peck", self.hidden_patches.hit(event.x, event.y))
         
         
 
@@ -725,32 +768,13 @@ class MainScreen(object):
     
         self.clear_canvas()
 
-    # Always reinforce PAV trials
-        if self.trial_type == "PAV":
-            reinforced = True
-
-    # Never reinforce EXT trials
-        elif self.trial_type == "EXT":
-            reinforced = False
-
-    # If INS/OMS trial, reinforcement is probabilistic
-        else:
-            # Extract the RR value from the trial type (e.g., INS_2 → rr_sched = 2)
-            rr_sched = int(self.trial_type.split("_")[1])  # Extract 2, 5, or 20
-
-            # Determine default reinforcement status
-            if "INS" in self.trial_type:
-                reinforced = False
-            elif "OMS" in self.trial_type:
-                reinforced = True
-
-            # Roll a dice a number of times equal to the number of pecks in the trial
-            for _ in range(self.trial_peck_counter): 
-                if choice(range(rr_sched)) == 0:  # Simulates a die roll (0 = reinforcement occurs)
-                    if "INS" in self.trial_type:
-                        reinforced = True
-                    elif "OMS" in self.trial_type:
-                        reinforced = False
+    # PAV trials are always reinforced and EXT trials never are. INS/OMS
+    # trials are RR (e.g., INS_2 -> RR2), decided with a single draw from
+    # 1 - (1 - 1/RR)^pecks (INS: reinforced on a hit; OMS: cancelled by one)
+        reinforced = self.schedules[self.trial_type].outcome(self.trial_peck_counter,
+                                                             self.rng.outcome)
+        self.reinforcement_tally.record(self.trial_type, self.schedules[self.trial_type],
+                                        self.trial_peck_counter, reinforced)
         
         # If a reinforcement is earned...
         if reinforced:
@@ -770,7 +794,7 @@ class MainScreen(object):
                 rpi_board.set_servo_pulsewidth(servo_GPIO_num,
                                                hopper_up_val) # Move hopper to up position
             
-            self.root.after(self.hopper_duration, lambda: self.ITI())
+            self.scheduler.after("hopper", self.hopper_duration, self.ITI)
         
         # If not reinforced, just proceed to the ITI
         else:
@@ -797,15 +821,13 @@ class MainScreen(object):
     
     def clear_canvas(self):
          # This is by far the most called function across the program. It
-         # deletes all the objects currently on the Canvas. A finer point to 
-         # note here is that objects still exist onscreen if they are covered
-         # up (rendering them invisible and inaccessible); if too many objects
-         # are stacked upon each other, it can may be too difficult to track/
-         # project at once (especially if many of the objects have functions 
-         # tied to them. Therefore, its important to frequently clean up the 
-         # Canvas by literally deleting every element.
+         # hides everything in the scene (see build_scene) so nothing can be
+         # seen or pecked, and deletes anything else drawn on the Canvas
+         # (e.g., onscreen feedback text). The scene's items are only
+         # hidden, not deleted, so the next phase just shows them again
+         # instead of rebuilding them.
         try:
-            self.mastercanvas.delete("all")
+            self.scene.clear()
         except TclError:
             print("No screen to exit")
         
@@ -861,6 +883,9 @@ class MainScreen(object):
                 x, y = event.x, event.y
             else: # There are certain data events that are not pecks.
                 x, y = "NA", "NA"   
+
+            # Tk's own timestamp of the touch vs. when this callback actually ran
+            event_time, queue_delay = self.touch_latency_log.record(event)
                 
             print(f"{outcome:>30} | x: {x: ^3} y: {y:^3} | {self.trial_type:^5} | {str(datetime.now() - self.start_time)}")
             # print(f"{outcome:>30} | x: {x: ^3} y: {y:^3} | Target: {self.current_target_location: ^2} | {str(datetime.now() - self.start_time)}")
@@ -877,13 +902,20 @@ class MainScreen(object):
                 self.stimulus_assignments_dict[self.trial_type], # Trial color
                 self.subject_ID, # Name of subject (same across datasheet)
                 hidden_patch, # Hidden Patch
-                date.today() # Today's date as "MM-DD-YYYY"
+                date.today(), # Today's date as "MM-DD-YYYY"
+                event_time, # Tk server timestamp of the touch (ms)
+                queue_delay, # Time the touch waited in the Tk event queue (ms)
+                self.rng.seed, # Session seed (regenerates trial order and outcomes)
+                self.sequence_ID, # Trial order ID in the sequence bank ("NA" if generated live)
+                getattr(event, "region", "NA"), # Region (touch region, see build_scene)
+                self.onset_delay # OnsetDelay (ms, stimulus onset after its scheduled time; onset row only)
                 ])
         
             header_list = ["SessionTime", "Xcord","Ycord", "Event", "TrialTime", 
                            "TrialType","TargetPeckNum", "BackgroundPeckNum",
                            "TrialNum", "TrialColor",
-                           "Subject", "HiddenPatch", "Date"] # Column headers
+                           "Subject", "HiddenPatch", "Date", "TouchEventTime", "QueueDelay",
+                           "SessionSeed", "SequenceID", "Region", "OnsetDelay"] # Column headers
 
         
     def write_comp_data(self, SessionEnded):
@@ -896,6 +928,11 @@ class MainScreen(object):
         # write over the existing document.
         if SessionEnded:
             self.write_data(None, "SessionEnds") # Writes end of session to df
+            print(self.touch_latency_log.summary())
+            print(self.scheduler.summary())
+            print(self.resource_monitor.summary())
+            print(self.hidden_patches.summary())
+            print(self.reinforcement_tally.summary())
         if self.record_data : # If experimenter has choosen to automatically record data in seperate sheet:
             myFile_loc = f"{self.data_folder_directory}/{self.subject_ID}/{self.subject_ID}_{self.start_time.strftime('%Y-%m-%d_%H.%M.%S')}_P003F_data.csv"
             # This loop writes the data in the matrix to the .csv              
@@ -904,6 +941,13 @@ class MainScreen(object):
                 w = writer(myFile, quoting=QUOTE_MINIMAL)
                 w.writerows(self.session_data_frame) # Write all event/trial data 
             print(f"\n- Data file written to {myFile_loc}")
+            if SessionEnded: # Per-session touch-delay histogram, phase timing log, transition counts and reinforcement check
+                self.touch_latency_log.write_histogram(side_file_loc(myFile_loc, "touch-latency"))
+                self.scheduler.write_phase_log(side_file_loc(myFile_loc, "phase-timing"))
+                self.resource_monitor.write(side_file_loc(myFile_loc, "resources"))
+                self.hidden_patches.write(side_file_loc(myFile_loc, "hidden-patches"))
+                self.reinforcement_tally.write(side_file_loc(myFile_loc, "reinforcement-check"))
+                self.transition_balance.write_matrix(side_file_loc(myFile_loc, "transitions"))
                 
 #%% Finally, this is the code that actually runs:
 try:   
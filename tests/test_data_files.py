@@ -0,0 +1,22 @@
+# -*- coding: utf-8 -*-
+# Names of the files written next to a session's data file
+# (P003_common/data_files.py).
+from P003_common.data_files import side_file_loc
+
+
+def test_only_the_file_name_changes():
+    # The data folders are named "..._data" too
+    assert (side_file_loc("/home/blaisdelllab/Desktop/Data/P003f_data/Joplin/"
+                          "Joplin_2026-01-05_09.00.00_P003F_data.csv", "touch-latency")
+            == "/home/blaisdelllab/Desktop/Data/P003f_data/Joplin/"
+               "Joplin_2026-01-05_09.00.00_P003F_touch-latency.csv")
+
+
+def test_p003e_phase_suffix_is_kept():
+    assert (side_file_loc("/Data/P003e_data/Kurt/Kurt_2026-01-05_09.00.00_P003e_data-Phase-RR5.csv",
+                          "phase-timing")
+            == "/Data/P003e_data/Kurt/Kurt_2026-01-05_09.00.00_P003e_phase-timing-Phase-RR5.csv")
+
+
+def test_file_name_without_data():
+    assert side_file_loc("/x/P003f_data/session.csv", "resources") == "/x/P003f_data/session_resources.csv"
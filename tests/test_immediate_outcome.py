@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+# Checks of P003Fc's immediate outcome mode (trials end on the peck that
+# meets the requirement) and its CriterionLatency column.
+from os import path as os_path
+
+import pytest
+
+P003FC = os_path.join(os_path.dirname(os_path.dirname(os_path.abspath(__file__))),
+                      "P003Fc", "P003Fc_ExpProgram_RP.py")
+ROW_COST_MS = 3 # virtual time each data row takes to write
+
+
+@pytest.fixture
+def headless_home(tmp_path, monkeypatch):
+    # The programs read the user name from the home folder at import
+    monkeypatch.setenv("HOME", str(tmp_path))
+
+
+def test_criterion_latency_starts_at_the_peck(headless_home):
+    # Every data row costs ROW_COST_MS of virtual time, so the latency from
+    # the criterion peck includes the peck's own row: it has to be counted
+    # from when the peck's callback started, not from after its row was
+    # written (which always gave ~0 ms)
+    from P003_common.headless import HeadlessSession
+    session = HeadlessSession(P003FC, "Peach", session_seed = 1, phase_type = "OMS",
+                              immediate_outcome = True)
+    write_data = session.screen.write_data
+    def slow_write_data(event, outcome="NA"):
+        session.root.now_ms += ROW_COST_MS
+        write_data(event, outcome)
+    session.screen.write_data = slow_write_data
+    session.start()
+    for step in range(1, 600):
+        session.run(until_ms = step * 300)
+        session.touch(512, 384)
+    latencies = {(row["TrialType"] == "INSFR_2", row["CriterionLatency"]) for row in session.data()
+                 if row["Event"] in ("reinforced_trial", "nonreinforced_trial")
+                 and row["CriterionLatency"] != "NA"}
+    # Both FR2 (second key peck) and VR trials ending on the criterion peck
+    assert latencies == {(True, float(ROW_COST_MS)), (False, float(ROW_COST_MS))}
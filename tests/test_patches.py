@@ -0,0 +1,160 @@
+# -*- coding: utf-8 -*-
+# Checks of P003f's hidden patch geometry and grid lookup
+# (P003_common/patches.py).
+from itertools import product
+from os import path as os_path
+
+import pytest
+
+from P003_common.patches import COMPASS, PatchGrid, compass_layout
+from P003_common.region_mask import SCREEN_SIZE
+from P003_common.scene import Disc, Rect
+
+KEY_OUTLINE = Disc(512, 384, 116) # P003f's key + outline ring
+P003F = os_path.join(os_path.dirname(os_path.dirname(os_path.abspath(__file__))),
+                     "P003f", "P003F_ExpProgram_RP.py")
+
+
+def brute_force(patches, x, y):
+    # First patch (in order) whose Rect contains (x, y), or None
+    return next((patch_id for patch_id, rect in patches.items() if rect.contains(x, y)), None)
+
+
+def screen_points(patches, step=3):
+    # A grid of points over the whole screen, plus every pixel within one of
+    # a patch's edges (and half-pixel touches on the edges themselves)
+    points = set(product(range(0, SCREEN_SIZE[0], step), range(0, SCREEN_SIZE[1], step)))
+    for rect in patches.values():
+        for x in (rect.x1 - 1, rect.x1 - 0.5, rect.x1, rect.x1 + 1, rect.x2 - 1, rect.x2, rect.x2 + 0.5, rect.x2 + 1):
+            points.update((x, y) for y in range(int(rect.y1) - 2, int(rect.y2) + 3))
+        for y in (rect.y1 - 1, rect.y1 - 0.5, rect.y1, rect.y1 + 1, rect.y2 - 1, rect.y2, rect.y2 + 0.5, rect.y2 + 1):
+            points.update((x, y) for x in range(int(rect.x1) - 2, int(rect.x2) + 3))
+    return points
+
+
+@pytest.mark.parametrize("cell", [16, 64, 100, 300])
+def test_grid_matches_brute_force_for_the_compass_layout(cell):
+    patches = compass_layout((512, 384), distance = 300, size = 100, avoid = [KEY_OUTLINE])
+    grid = PatchGrid(patches, cell)
+    for x, y in screen_points(patches):
+        assert grid.patch_at(x, y) == brute_force(patches, x, y), (x, y)
+
+
+def test_grid_matches_brute_force_for_many_overlapping_patches():
+    # 40 patches of mixed sizes, some overlapping (the first one added wins)
+    patches = {f"p{i}": Rect((i * 97) % 900, (i * 61) % 650, (i * 97) % 900 + 20 + (i * 13) % 110,
+                             (i * 61) % 650 + 15 + (i * 29) % 100)
+               for i in range(40)}
+    grid = PatchGrid(patches)
+    for x, y in screen_points(patches):
+        assert grid.patch_at(x, y) == brute_force(patches, x, y), (x, y)
+
+
+def test_grid_is_a_scene_shape():
+    patches = compass_layout((512, 384), distance = 300, size = 100)
+    grid = PatchGrid({location: patches[location] for location in ("north", "west")})
+    assert grid.contains(512, 84) and grid.contains(212, 384)
+    assert not grid.contains(812, 384) and not grid.contains(512, 384)
+    assert grid.key == PatchGrid({"north": patches["north"], "west": patches["west"]}).key
+    assert grid.key != PatchGrid({"north": patches["north"]}).key
+    assert grid.hit(512, 84) == "north" and grid.hit(0, 0) == "NA"
+    assert grid.pecks == {"north": 1, "west": 0}
+
+
+def test_compass_layout_geometry():
+    layout = compass_layout((512, 384), distance = 300, size = 100, avoid = [KEY_OUTLINE])
+    assert list(layout) == list(COMPASS)
+    for rect in layout.values():
+        assert rect.x1 < rect.x2 and rect.y1 < rect.y2
+        assert (rect.x2 - rect.x1, rect.y2 - rect.y1) == (100, 100)
+    # "south" is below the key, with its corners in order
+    assert layout["south"].key == ("rect", 462, 634, 562, 734)
+
+
+@pytest.mark.parametrize("options", [
+    dict(distance = 400, size = 100), # north/south off the screen
+    dict(distance = 340, size = 100), # south bottom edge at 774
+    dict(distance = 60, size = 100), # neighbouring patches overlap
+    dict(distance = 100, size = 100), # ...edge to edge counts as touching
+    dict(distance = 150, size = 100, avoid = [KEY_OUTLINE]), # on the key's outline
+    ])
+def test_bad_layouts_raise(options):
+    with pytest.raises(ValueError):
+        compass_layout((512, 384), **options)
+
+
+@pytest.fixture
+def headless_home(tmp_path, monkeypatch):
+    # The programs read the user name from the home folder at import
+    monkeypatch.setenv("HOME", str(tmp_path))
+
+
+@pytest.mark.parametrize("count", [0, 9, -1, 2.0, None])
+def test_p003f_rejects_bad_hidden_patch_counts(headless_home, count):
+    from P003_common.headless import HeadlessSession
+    with pytest.raises(ValueError):
+        HeadlessSession(P003F, "Joplin", hidden_patch_count = count)
+
+
+def test_p003f_places_several_hidden_patches(headless_home):
+    from P003_common.headless import HeadlessSession
+    session = HeadlessSession(P003F, "Joplin", session_seed = 50, hidden_patch_count = 3)
+    session.start()
+    screen = session.screen
+    assert len(set(screen.hidden_patch_locations)) == 3
+    assert list(screen.hidden_patches.patches) == screen.hidden_patch_locations
+    region_shapes = {region_id: shape for _, region_id, shape, _ in screen.scene.regions}
+    assert region_shapes["hidden_patch"] is screen.hidden_patches
+
+
+@pytest.fixture
+def recorded_p003f(headless_home, tmp_path):
+    # A recorded 3-patch P003f session in which no hidden patch was pecked
+    # (every touch is on the key); returns (data file, patches shown)
+    from P003_common.headless import HeadlessSession
+    subject_folder = tmp_path / "P003f_data" / "Joplin"
+    subject_folder.mkdir(parents = True)
+    session = HeadlessSession(P003F, "Joplin", session_seed = 50, hidden_patch_count = 3,
+                              record_data = True, data_folder_directory = str(tmp_path / "P003f_data"))
+    session.start()
+    for second in range(1, 150):
+        session.run(until_ms = second * 1000)
+        session.touch(512, 384)
+    session.screen.exit_program(None)
+    data_file, = subject_folder.glob("*_data.csv")
+    return str(data_file), session.screen.hidden_patch_locations
+
+
+def test_replay_rebuilds_unpecked_patches(recorded_p003f):
+    from os import remove
+    from P003_common.data_files import side_file_loc
+    from P003_common.replay import RecordedSession, replay_session
+    data_file, shown = recorded_p003f
+    assert RecordedSession(data_file).hidden_patch_locations == shown
+    completed = [row for row in replay_session(P003F, data_file) if row[3] != "NA"]
+    assert completed and all(row[-1] for row in completed)
+    # Older data: only the patches logged on hidden patch pecks (none here)
+    remove(side_file_loc(data_file, "hidden-patches"))
+    assert RecordedSession(data_file).hidden_patch_locations == []
+
+
+def test_region_mask_uses_every_shown_patch(recorded_p003f):
+    pytest.importorskip("numpy")
+    from P003_common.headless import HeadlessSession
+    from P003_common.patches import session_patches
+    from P003_common.region_mask import assign_regions
+    data_file, shown = recorded_p003f
+    screen = HeadlessSession(P003F, "Joplin").screen
+    shown_patches = session_patches(data_file)
+    assert list(shown_patches) == shown
+    assert {location: rect.key for location, rect in shown_patches.items()} == \
+        {location: screen.hidden_patch_layout[location].key for location in shown}
+    # A touch at the center of each patch (none of them pecked in the data)
+    centers = [((rect.x1 + rect.x2) / 2, (rect.y1 + rect.y2) / 2) for rect in shown_patches.values()]
+    rows = [{"Event": "start_signal_press", "Xcord": "512", "Ycord": "384"}]
+    rows += [{"Event": "background_peck", "Xcord": str(x), "Ycord": str(y)} for x, y in centers]
+    regions = assign_regions(screen.scene, rows, screen.hidden_patch_layout, shown_patches)
+    assert list(regions[1:]) == ["hidden_patch"] * 3
+    # Without the patch file, only pecked patches (none) are known
+    regions = assign_regions(screen.scene, rows, screen.hidden_patch_layout)
+    assert list(regions[1:]) == ["background"] * 3
@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+# Checks of the exact reinforcement-probability tables and of the session
+# check built on them (P003_common/schedules.py).
+from csv import writer
+from math import isclose
+from os import path as os_path
+
+import pytest
+
+from P003_common.schedules import (Extinction, FixedRatio, RandomRatio, ReinforcementTally,
+                                   VariableRatio, check_schedules, probability_table,
+                                   schedule_for_code, tally_session)
+
+P003FC = os_path.join(os_path.dirname(os_path.dirname(os_path.abspath(__file__))),
+                      "P003Fc", "P003Fc_ExpProgram_RP.py")
+
+
+@pytest.mark.parametrize("ratio", [2, 5, 20, 50])
+def test_rr_table_is_closed_form(ratio):
+    ins = probability_table(RandomRatio(ratio, "INS"))
+    oms = probability_table(RandomRatio(ratio, "OMS"))
+    for k in range(len(ins)):
+        assert isclose(ins[k], 1 - (1 - 1 / ratio) ** k, abs_tol=1e-12)
+        assert isclose(oms[k], (1 - 1 / ratio) ** k, abs_tol=1e-12)
+
+
+@pytest.mark.parametrize("ratio", [2, 5, 20, 50])
+def test_vr_table_is_closed_form(ratio):
+    # Requirement uniform over low..high: met by k pecks for k - low + 1 values
+    schedule = VariableRatio(ratio)
+    values = schedule.high - schedule.low + 1
+    for k, p in enumerate(probability_table(schedule)):
+        assert isclose(p, min(values, max(0, k - schedule.low + 1)) / values)
+
+
+def test_fr2_table():
+    assert probability_table(FixedRatio(2))[:5] == [0.0, 0.0, 1.0, 1.0, 1.0]
+
+
+def test_equal_schedules_share_one_table():
+    assert probability_table(RandomRatio(5)) is probability_table(schedule_for_code("INS_5"))
+    assert probability_table(RandomRatio(5)) is not probability_table(RandomRatio(5, "OMS"))
+
+
+def test_tables_agree_with_seeded_simulation():
+    schedules = [RandomRatio(5), RandomRatio(20, "OMS"), VariableRatio(5),
+                 VariableRatio(20, "OMS"), FixedRatio(2)]
+    rows = check_schedules(schedules, (0, 1, 3, 10, 40), trials=5000, seed=39)
+    for schedule, pecks, p, from_outcome, simulated, ok in rows:
+        assert p == probability_table(schedule)[pecks]
+        assert ok, (schedule, pecks, p, from_outcome, simulated)
+
+
+def write_session(file_loc, trials):
+    # Minimal data file: [(trial type, target pecks, reinforced), ...]
+    with open(file_loc, 'w', newline='') as f:
+        w = writer(f)
+        w.writerow(["TrialNum", "TrialType", "Event", "TargetPeckNum", "BackgroundPeckNum"])
+        for n, (trial_type, pecks, reinforced) in enumerate(trials, 1):
+            w.writerow([n, trial_type, "key_peck", pecks, 0])
+            w.writerow([n, trial_type, "reinforced_trial" if reinforced else "nonreinforced_trial",
+                        pecks, 0])
+    return file_loc
+
+
+def z_scores(tally):
+    return {row[0]: row[4] for row in tally.rows()}
+
+
+def test_tally_passes_correct_outcomes(tmp_path):
+    # FR2 and EXT outcomes as the rules give them; RR5 at 10 pecks
+    # (p = 0.89) reinforced 9 times out of 10
+    trials = ([("INSFR_2", 1, False), ("INSFR_2", 2, True)] * 5 + [("EXT", 8, False)] * 5
+              + [("INS_5", 10, True)] * 9 + [("INS_5", 10, False)])
+    tally = tally_session(write_session(tmp_path / "ok.csv", trials), schedule_for_code)
+    assert all(abs(z) < 3 for z in z_scores(tally).values())
+    assert "CHECK" not in tally.summary()
+
+
+def test_tally_flags_wrong_outcomes(tmp_path):
+    # One reinforced EXT trial, one FR2 trial reinforced after a single
+    # peck, and OMS_5 reinforced every time after 20 pecks (p = 0.012)
+    trials = ([("EXT", 3, False)] * 9 + [("EXT", 3, True)]
+              + [("INSFR_2", 2, True)] * 9 + [("INSFR_2", 1, True)]
+              + [("OMS_5", 20, True)] * 10)
+    tally = tally_session(write_session(tmp_path / "wrong.csv", trials), schedule_for_code)
+    z = z_scores(tally)
+    assert z["EXT"] > 3 and z["INSFR_2"] > 3 and z["OMS_5"] > 3
+    assert tally.summary().count("CHECK") == 3
+    assert tally.status().count("CHECK") == 3
+
+
+def test_tally_status_line():
+    tally = ReinforcementTally()
+    assert tally.status() == "Reinforcement check: no trials yet"
+    tally.record("INSFR_2", FixedRatio(2), 2, True)
+    tally.record("EXT", Extinction(), 3, False)
+    assert tally.status() == ("Reinforcement check: EXT 0/1 (exp. 0.0, z +0.00) | "
+                              "INSFR_2 1/1 (exp. 1.0, z +0.00)")
+
+
+def test_tally_record_matches_table():
+    tally = ReinforcementTally()
+    for pecks in range(10):
+        tally.record("INS_20", RandomRatio(20), pecks, False)
+    trials, observed, expected, variance = tally.trial_types["INS_20"]
+    assert (trials, observed) == (10, 0)
+    assert isclose(expected, sum(probability_table(RandomRatio(20))[:10]))
+    tally.record("EXT", Extinction(), 4, False)
+    assert z_scores(tally)["EXT"] == 0.0
+
+
+@pytest.mark.parametrize("immediate_outcome", [False, True])
+def test_p003fc_tallies_fr2_trials(tmp_path, monkeypatch, immediate_outcome):
+    # Peach runs 20 INSFR_2 trials per session; each ends on its second key
+    # peck (not on the trial timer) and still has to reach the tally
+    monkeypatch.setenv("HOME", str(tmp_path)) # (read at import)
+    from P003_common.headless import HeadlessSession
+    session = HeadlessSession(P003FC, "Peach", session_seed = 1, phase_type = "OMS",
+                              immediate_outcome = immediate_outcome)
+    session.start()
+    step = 0
+    while not session.finished and step < 20000:
+        step += 1
+        session.run(until_ms = step * 400)
+        session.touch(512, 384)
+    assert session.screen.reinforcement_tally.trial_types["INSFR_2"][:2] == [20, 20]
+    assert z_scores(session.screen.reinforcement_tally)["INSFR_2"] == 0.0
@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+# Checks of the per-trial resource counts (P003_common/resources.py).
+from gc import collect
+from os import path as os_path
+
+import pytest
+
+from P003_common import resources
+from P003_common.resources import RESOURCE_COLUMNS
+
+P003F = os_path.join(os_path.dirname(os_path.dirname(os_path.abspath(__file__))),
+                     "P003f", "P003F_ExpProgram_RP.py")
+OBJECTS = RESOURCE_COLUMNS.index("PythonObjects")
+
+
+@pytest.fixture
+def p003f_screen(tmp_path, monkeypatch):
+    # A P003f MainScreen on the virtual clock, counting get_objects() calls
+    monkeypatch.setenv("HOME", str(tmp_path)) # (read at import)
+    from P003_common.headless import HeadlessSession
+    calls = []
+    get_objects = resources.get_objects
+    def counted_get_objects():
+        calls.append(1)
+        return get_objects()
+    monkeypatch.setattr(resources, "get_objects", counted_get_objects)
+    return HeadlessSession(P003F, "Joplin", session_seed = 1).screen, calls
+
+
+def test_objects_are_counted_in_the_warmup_and_every_n_trials(p003f_screen):
+    screen, calls = p003f_screen
+    monitor = resources.ResourceMonitor(screen.root, screen.mastercanvas, screen.scene,
+                                        warmup = 3, object_every = 20)
+    for trial in range(1, 61):
+        monitor.sample(trial)
+    counted = [row[0] for row in monitor.log if row[OBJECTS] != "NA"]
+    assert counted == [1, 2, 3, 21, 41]
+    assert len(calls) == len(counted)
+    # The Tk counts are still taken every trial
+    assert all(row[i] != "NA" for row in monitor.log for i in range(1, OBJECTS))
+    assert "PythonObjects" in monitor.summary() and "NA ->" not in monitor.summary()
+
+
+def test_object_count_can_be_turned_off(p003f_screen):
+    screen, calls = p003f_screen
+    monitor = resources.ResourceMonitor(screen.root, screen.mastercanvas, screen.scene,
+                                        object_every = 0)
+    for trial in range(1, 11):
+        monitor.sample(trial)
+    assert not calls
+    assert {row[OBJECTS] for row in monitor.log} == {"NA"}
+    assert monitor.summary().endswith("PythonObjects NA")
+
+
+def test_object_growth_is_still_reported(p003f_screen):
+    screen, calls = p003f_screen
+    monitor = resources.ResourceMonitor(screen.root, screen.mastercanvas, screen.scene,
+                                        warmup = 3, object_slack = 200, object_every = 5)
+    collect() # (garbage left by other tests would shrink the count)
+    leaked = []
+    for trial in range(1, 21):
+        leaked += [[] for _ in range(1000)] # 1000 more tracked objects a trial
+        monitor.sample(trial)
+    assert [warning[1] for warning in monitor.warnings] == ["PythonObjects"] * 3
@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+# Checks of the shared reinforcement schedules (P003_common/schedules.py)
+# that every program's calculate_trial_outcome() goes through.
+from collections import Counter
+from random import Random
+
+import pytest
+
+from P003_common.schedules import (Extinction, FixedRatio, Pavlovian, RandomRatio,
+                                   VariableRatio, schedule_for_code)
+
+
+@pytest.mark.parametrize("code, kind, schedule_type, ratio, contingency", [
+    ("INS_2", "RR", RandomRatio, 2, "INS"),
+    ("INS_20", "RR", RandomRatio, 20, "INS"),
+    ("OMS_5", "RR", RandomRatio, 5, "OMS"),
+    ("INS_50", "VR", VariableRatio, 50, "INS"),
+    ("OMS_20", "VR", VariableRatio, 20, "OMS"),
+    ("INSFR_2", "VR", FixedRatio, 2, "INS"),
+    ("INSFR_2", "RR", FixedRatio, 2, "INS"), # FR whatever the ratio kind
+    ])
+def test_ratio_codes(code, kind, schedule_type, ratio, contingency):
+    schedule = schedule_for_code(code, kind)
+    assert type(schedule) is schedule_type
+    assert schedule.ratio == ratio
+    assert schedule.contingency == contingency
+
+
+def test_plain_codes_take_the_given_ratio():
+    # e.g., P003g's INS/OMS trials (RR20)
+    schedule = schedule_for_code("OMS", "RR", ratio=20)
+    assert (type(schedule), schedule.ratio, schedule.contingency) == (RandomRatio, 20, "OMS")
+    with pytest.raises(ValueError):
+        schedule_for_code("INS", "RR")
+
+
+def test_pavlovian_and_extinction_codes():
+    pav = schedule_for_code("PAV")
+    ext = schedule_for_code("EXT")
+    assert type(pav) is Pavlovian and pav.p == 1.0
+    assert type(ext) is Extinction and ext.p == 0.0
+    rng = Random(0)
+    for pecks in (0, 1, 50):
+        assert pav.outcome(pecks, rng) is True
+        assert ext.outcome(pecks, rng) is False
+
+
+@pytest.mark.parametrize("ratio, low, high", [(2, 1, 3), (5, 4, 6), (20, 14, 26), (50, 35, 65)])
+def test_vr_band_bounds(ratio, low, high):
+    schedule = VariableRatio(ratio)
+    assert (schedule.low, schedule.high) == (low, high)
+    assert schedule.low == max(1, round(0.7 * ratio))
+    assert schedule.high == round(1.3 * ratio)
+    rng = Random(ratio)
+    drawn = {schedule.draw_requirement(rng) for _ in range(2000)}
+    assert drawn == set(range(low, high + 1))
+
+
+@pytest.mark.parametrize("ratio, trials", [(2, 30), (5, 20), (20, 20), (20, 13), (50, 100)])
+def test_requirement_table_gives_each_value_equally_often(ratio, trials):
+    schedule = VariableRatio(ratio)
+    values = range(schedule.low, schedule.high + 1)
+    table = schedule.requirement_table(trials, Random(trials))
+    counts = Counter(table)
+    assert len(table) == trials
+    assert set(counts) <= set(values)
+    # Every value trials // len(values) times, the remainder at most once more
+    assert all(trials // len(values) <= counts[v] <= trials // len(values) + 1 for v in values)
+    assert sum(counts[v] > trials // len(values) for v in values) == trials % len(values)
+
+
+def test_requirement_table_is_reproducible():
+    schedule = VariableRatio(20)
+    assert schedule.requirement_table(20, Random(7)) == schedule.requirement_table(20, Random(7))
+
+
+@pytest.mark.parametrize("pecks, met", [(0, False), (1, False), (2, True), (3, True), (40, True)])
+def test_fr2_needs_exactly_two_pecks(pecks, met):
+    rng = Random(0)
+    assert FixedRatio(2).outcome(pecks, rng) is met
+    assert FixedRatio(2, "OMS").outcome(pecks, rng) is (not met)
+    assert schedule_for_code("INSFR_2").probability(pecks) == float(met)
+
+
+def test_vr_with_a_logged_requirement():
+    schedule = VariableRatio(20)
+    rng = Random(0)
+    assert schedule.outcome(17, rng, requirement=18) is False
+    assert schedule.outcome(18, rng, requirement=18) is True
+    assert VariableRatio(20, "OMS").outcome(18, rng, requirement=18) is False
+
+
+def test_rr_never_met_without_pecks():
+    rng = Random(0)
+    assert not any(RandomRatio(2).outcome(0, rng) for _ in range(100))
+    assert all(RandomRatio(2, "OMS").outcome(0, rng) for _ in range(100))
@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+# Checks of the exact run-limited order sampler (P003_common/sequences.py)
+# against brute-force enumeration of small designs.
+from collections import Counter
+from itertools import permutations
+from random import Random
+
+import pytest
+
+from P003_common.sequences import (InfeasibleOrderError, constrained_order,
+                                   count_orders, run_lengths)
+
+
+def valid_orders(counts, max_run, key=None):
+    # Every distinct order of {type: count} with no run longer than max_run
+    trial_types = [t for t, n in counts.items() for _ in range(n)]
+    return {order for order in set(permutations(trial_types))
+            if max(length for _, length in run_lengths(order, key)) <= max_run}
+
+
+@pytest.mark.parametrize("counts, max_run", [
+    ({"A": 1}, 1),
+    ({"A": 3, "B": 1}, 2),
+    ({"A": 2, "B": 2}, 1),
+    ({"A": 3, "B": 2, "C": 1}, 2),
+    ({"A": 4, "B": 3, "C": 2}, 3),
+    ({"A": 5, "B": 2, "C": 2}, 2),
+    ({"A": 2, "B": 2, "C": 2, "D": 2}, 1),
+    ])
+def test_count_orders_matches_enumeration(counts, max_run):
+    assert count_orders(counts, max_run) == len(valid_orders(counts, max_run))
+
+
+def test_draws_are_uniform_over_valid_orders():
+    counts = {"A": 3, "B": 2, "C": 1}
+    orders = valid_orders(counts, 2)
+    trial_types = [t for t, n in counts.items() for _ in range(n)]
+    rng = Random(31)
+    draws = 200 * len(orders)
+    seen = Counter(tuple(constrained_order(trial_types, 2, rng)) for _ in range(draws))
+    assert set(seen) == orders
+    # Each order is expected 200 times; the bounds are ~5 standard deviations
+    assert min(seen.values()) > 130
+    assert max(seen.values()) < 270
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_no_run_longer_than_max_run(seed):
+    trial_types = ["INS", "OMS", "PAV", "EXT"] * 40 + ["INS"] * 20
+    order = constrained_order(trial_types, 3, Random(seed))
+    assert Counter(order) == Counter(trial_types)
+    assert max(length for _, length in run_lengths(order)) <= 3
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_no_group_run_longer_than_max_run_with_key(seed):
+    # P003f's codes: the limit holds for INS/OMS/PAV/EXT, whatever the FR value
+    trial_types = ["INS_2", "INS_5", "INS_20", "OMS_2", "OMS_5", "OMS_20",
+                   "PAV", "EXT"] * 20
+    group = lambda code: code.split("_")[0]
+    order = constrained_order(trial_types, 3, Random(seed), key=group)
+    assert Counter(order) == Counter(trial_types)
+    assert max(length for _, length in run_lengths(order, group)) <= 3
+
+
+def test_key_orders_only_come_from_valid_orders():
+    counts = {"A_1": 2, "A_2": 1, "B": 2}
+    group = lambda code: code[0]
+    orders = valid_orders(counts, 2, group)
+    trial_types = [t for t, n in counts.items() for _ in range(n)]
+    rng = Random(5)
+    seen = {tuple(constrained_order(trial_types, 2, rng, key=group)) for _ in range(500)}
+    assert seen == orders
+
+
+def test_same_seed_same_order():
+    trial_types = ["INS", "OMS", "PAV", "EXT"] * 45
+    assert (constrained_order(trial_types, 3, Random(2024))
+            == constrained_order(trial_types, 3, Random(2024)))
+
+
+@pytest.mark.parametrize("trial_types, max_run", [
+    (["A"] * 7 + ["B"], 3), # 7 A's need at least 2 other trials
+    (["A"] * 3 + ["B"], 1),
+    (["A", "B"], 0),
+    ])
+def test_impossible_mix_raises(trial_types, max_run):
+    with pytest.raises(InfeasibleOrderError):
+        constrained_order(trial_types, max_run, Random(1))
+    with pytest.raises(InfeasibleOrderError):
+        count_orders(Counter(trial_types), max_run)
@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+# Checks of the high-peck-rate stress test's peck classification
+# (P003_common/stress.py), on the virtual-clock runtime.
+from os import path as os_path
+
+import pytest
+
+from P003_common.scene import Disc
+
+P003F = os_path.join(os_path.dirname(os_path.dirname(os_path.abspath(__file__))),
+                     "P003f", "P003F_ExpProgram_RP.py")
+
+
+@pytest.fixture
+def headless_home(tmp_path, monkeypatch):
+    # The programs read the user name from the home folder at import
+    monkeypatch.setenv("HOME", str(tmp_path))
+
+
+def stress_report(reshape=None):
+    from P003_common.stress import PeckStressTest, _HeadlessStressSession
+    session = _HeadlessStressSession(P003F, "TEST", session_seed = 0)
+    if reshape:
+        session.screen.scene.reshape(*reshape)
+    report = PeckStressTest(session, 20, 120, seed = 0).run()
+    session.close()
+    return report
+
+
+def test_p003f_pecks_are_classified(headless_home):
+    report = stress_report()
+    assert report["handled"] > 1000
+    assert (report["dropped"], report["misclassified"], report["counter_errors"]) == (0, 0, [])
+
+
+def test_wrong_region_shape_is_misclassified(headless_home):
+    # A key outline ring missing from the scene sends touches on it to the
+    # background; the stress test's own geometry still says "key"
+    report = stress_report(("key_outline", Disc(512, 384, 96)))
+    assert report["misclassified"] > 0
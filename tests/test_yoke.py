@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+# Master -> yoke file -> Yoked round trip of P003_common/yoke.py.
+from csv import writer
+from random import Random
+
+from P003_common.yoke import (YokeFile, compile_yoke, session_outcomes, yoke_file_loc,
+                              yoked_session)
+
+
+def write_session(subject_folder, start_time, exp_phase_name, trials):
+    # P003g-style data file: [(trial type, reinforced), ...] in trial order,
+    # with peck rows between the outcome rows
+    file_loc = subject_folder / f"Peach_{start_time}_P003g_data.csv"
+    with open(file_loc, 'w', newline='') as f:
+        w = writer(f)
+        w.writerow(["SessionTime", "ExpPhase", "TrialNum", "TrialType", "Event"])
+        w.writerow([0, exp_phase_name, 0, "NA", "SessionStarts"])
+        for n, (trial_type, reinforced) in enumerate(trials, 1):
+            w.writerow([n, exp_phase_name, n, trial_type, "key_peck"])
+            w.writerow([n, exp_phase_name, n, trial_type,
+                        "reinforced_trial" if reinforced else "nonreinforced_trial"])
+        w.writerow([len(trials) + 1, exp_phase_name, len(trials), "NA", "SessionEnds"])
+    return file_loc
+
+
+def random_trials(rng, n):
+    return [(rng.choice(["PAV", "INS", "OMS"]), rng.random() < 0.4) for _ in range(n)]
+
+
+def test_master_sessions_round_trip(tmp_path):
+    rng = Random(38)
+    master = [random_trials(rng, 180), random_trials(rng, 7), random_trials(rng, 61)]
+    start_times = ["2026-01-05_09.00.00", "2026-01-06_09.00.00", "2026-01-07_09.00.00"]
+    for start_time, trials in zip(start_times, master):
+        write_session(tmp_path, start_time, "Master", trials)
+    assert session_outcomes(tmp_path / f"Peach_{start_times[0]}_P003g_data.csv") == master[0]
+
+    yoke = compile_yoke(tmp_path, "Peach")
+    yoke.save(yoke_file_loc(tmp_path, "Peach"))
+    loaded = YokeFile.load(yoke_file_loc(tmp_path, "Peach"))
+    assert len(loaded) == 3
+    for index, trials in enumerate(master):
+        source, trial_types, outcomes = loaded.session(index)
+        assert source == f"Peach_{start_times[index]}"
+        assert list(zip(trial_types, outcomes)) == trials
+
+    # Yoked session n replays Master session n (oldest first), wrapping
+    # around at the number of Master sessions
+    for yoked_run in range(7):
+        source, trial_types, outcomes = yoked_session(tmp_path, "Peach")
+        assert list(zip(trial_types, outcomes)) == master[yoked_run % len(master)]
+        assert source == f"Peach_{start_times[yoked_run % len(master)]}"
+        write_session(tmp_path, f"2026-02-{yoked_run + 1:02d}_09.00.00", "Yoked",
+                      list(zip(trial_types, outcomes)))
+
+
+def test_no_yoke_file(tmp_path):
+    assert compile_yoke(tmp_path, "Peach") is None
+    assert yoked_session(tmp_path, "Peach") is None
+    # Yoked data alone makes no yoke file
+    write_session(tmp_path, "2026-02-01_09.00.00", "Yoked", random_trials(Random(1), 10))
+    assert compile_yoke(tmp_path, "Peach") is None